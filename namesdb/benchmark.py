@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""Search latency benchmark (see "namesdb bench")
+
+Replays a file of queries (one per line: surnames, full names,
+pseudoids, ...) through publish.search_records with a number of
+concurrent clients and reports throughput and latency percentiles.
+Results can be appended to a JSON lines file so runs before and after a
+mapping or code change can be compared.
+
+Run against a MemoryElasticsearch (see memory) to measure the overhead
+of the namesdb code path itself, without a cluster; with injected
+latency it also stands in for a cluster of known speed (time_import).
+
+time_conversion compares ways of turning a large response into records.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+logger = logging.getLogger(__name__)
+import math
+import time
+
+CLIENTS = 4
+REPEAT = 1
+SIZE = 100                # results per search
+PERCENTILES = [50, 95, 99]
+
+
+def read_queries(path):
+    """Queries from file, one per line; blank lines and #comments skipped
+
+    @param path: str
+    @returns: list of str
+    """
+    with open(path, 'r') as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.startswith('#')
+        ]
+
+def percentile(values, p):
+    """Nearest-rank percentile
+
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 95)
+    10
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 50)
+    5
+
+    @param values: list of numbers (sorted)
+    @param p: int 0-100
+    @returns: number
+    """
+    if not values:
+        return None
+    rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+def summarize(latencies, errors, elapsed):
+    """
+    @param latencies: list of float seconds
+    @param errors: int
+    @param elapsed: float seconds, wall clock for the whole run
+    @returns: dict
+    """
+    latencies = sorted(latencies)
+    summary = {
+        'searches': len(latencies),
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        summary['p%s_ms' % p] = round(value * 1000, 2) if value is not None else None
+    return summary
+
+def _client(search, queries, offset, repeat):
+    """Run queries (starting at offset) repeat times (runs in worker thread)
+
+    @returns: (latencies, errors)
+    """
+    latencies = []
+    errors = 0
+    n = len(queries)
+    for i in range(n * repeat):
+        query = queries[(offset + i) % n]
+        start = time.perf_counter()
+        try:
+            search(query)
+        except Exception as err:
+            errors += 1
+            logging.debug('%s: %s' % (query, err))
+            continue
+        latencies.append(time.perf_counter() - start)
+    return latencies,errors
+
+def run(search, queries, clients=CLIENTS, repeat=REPEAT):
+    """Run queries with concurrent clients
+
+    Each client replays all the queries repeat times, starting at a
+    different place in the list so clients don't move in lockstep.
+
+    @param search: function taking a query string
+    @param queries: list of str
+    @param clients: int Number of concurrent clients
+    @param repeat: int Times each client replays the queries
+    @returns: dict summary (see summarize)
+    """
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [
+            pool.submit(
+                _client, search, queries, n * len(queries) // clients, repeat
+            )
+            for n in range(clients)
+        ]
+        for future in futures:
+            l,e = future.result()
+            latencies += l
+            errors += e
+    summary = summarize(latencies, errors, time.perf_counter() - start)
+    summary['clients'] = clients
+    summary['queries'] = len(queries)
+    return summary
+
+def search_function(ds, collapse=False, match_names=False, size=SIZE):
+    """Function that runs a query through publish.search_records
+
+    @returns: function
+    """
+    from . import publish
+    def search(query):
+        return publish.search_records(
+            ds, query, collapse=collapse, match_names=match_names, size=size
+        )
+    return search
+
+def memory_docstore(csvpaths, index_prefix, latency=None, doc_latency=0.0):
+    """Docstore backed by a MemoryElasticsearch loaded from CSV files
+
+    Records are loaded directly, without injected latency.
+
+    @param csvpaths: list of str (dataset names taken from filenames)
+    @param index_prefix: str
+    @param latency: dict operation -> seconds (see memory.MemoryElasticsearch)
+    @param doc_latency: float Seconds per document in bulk requests
+    @returns: docstore.Docstore
+    """
+    from . import definitions
+    from . import docstore
+    from . import memory
+    from . import publish
+    from . import sourcefile
+    es = memory.MemoryElasticsearch(latency, doc_latency)
+    ds = docstore.Docstore(index_prefix, 'memory', None, connection=es)
+    ds.create_indices()
+    for csvpath in csvpaths:
+        dataset = sourcefile.dataset_from_path(csvpath)
+        records,rejects = publish.read_records(
+            csvpath, dataset, definitions.DATASETS[dataset]
+        )
+        n = es.load(ds.dataset_index(dataset), records)
+        logging.info('Loaded %s records from %s' % (n, csvpath))
+    return ds
+
+def time_import(ds, csvpath, bulk_options={}):
+    """Time reading a CSV file and writing its records with bulk requests
+
+    Use a Docstore from memory_docstore (with latency injected to stand
+    in for a cluster) to measure the import pipeline repeatably.
+
+    @param ds: docstore.Docstore
+    @param csvpath: str (dataset name taken from filename)
+    @param bulk_options: dict kwargs for bulk.AdaptiveBulkWriter
+    @returns: dict
+    """
+    from . import bulk
+    from . import definitions
+    from . import publish
+    from . import sourcefile
+    dataset = sourcefile.dataset_from_path(csvpath)
+    start = time.perf_counter()
+    records,rejects = publish.read_records(
+        csvpath, dataset, definitions.DATASETS[dataset]
+    )
+    read = time.perf_counter() - start
+    summary = publish.write_records(
+        ds, ds.dataset_index(dataset), records, bulk_options
+    )
+    elapsed = summary['elapsed']
+    return {
+        'records': len(records),
+        'rejects': len(rejects),
+        'read_s': round(read, 3),
+        'write_s': round(elapsed, 3),
+        'docs_per_s': round(summary['docs'] / elapsed, 1) if elapsed else None,
+        'bulk': bulk.format_summary(summary),
+    }
+
+
+def conversion_response(num_hits):
+    """Synthetic search response with num_hits FIELDS_MASTER hits
+
+    @param num_hits: int
+    @returns: dict
+    """
+    from . import definitions
+    hits = []
+    for n in range(num_hits):
+        source = {field: '%s-%s' % (field, n) for field in definitions.FIELDS_MASTER}
+        source['m_dataset'] = 'far-manzanar'
+        source['m_pseudoid'] = '7-manzanar_yano_1922_%s' % n
+        hits.append({
+            '_index': 'namesdbrecord', '_type': '_doc',
+            '_id': 'far-manzanar:%s' % source['m_pseudoid'],
+            '_score': 1.0, '_source': source,
+        })
+    return {
+        'took': 1, 'timed_out': False,
+        'hits': {'total': {'value': num_hits, 'relation': 'eq'}, 'hits': hits},
+    }
+
+def _document_records(raw):
+    """Conversion as done before models.records_from_hits, for comparison
+
+    A Document per hit (response.hits), then per-field setattr and
+    assemble_fulltext for each Record.
+    """
+    from elasticsearch_dsl import Search
+    from elasticsearch_dsl.response import Response
+    from . import definitions
+    from . import models
+    response = Response(Search().doc_type(models.Record), raw)
+    records = []
+    for hit in response:
+        hit_d = hit.__dict__['_d_']
+        record = models.Record(meta={'id': hit.meta.id})
+        for field in definitions.FIELDS_MASTER:
+            value = hit_d.get(field)
+            if isinstance(value, list):
+                value = value[0]
+            setattr(record, field, value)
+        record.assemble_fulltext()
+        records.append(record)
+    return records
+
+def time_conversion(num_hits=10000, repeat=3):
+    """Time hit conversion methods on a synthetic response
+
+    @param num_hits: int
+    @param repeat: int Best of repeat runs is reported
+    @returns: dict method -> seconds
+    """
+    from . import models
+    raw = conversion_response(num_hits)
+    methods = [
+        ('documents', _document_records),
+        ('records', lambda raw: models.records_from_hits(raw['hits']['hits'])),
+        ('dicts', lambda raw: models.dicts_from_hits(raw['hits']['hits'])),
+    ]
+    timings = {}
+    for name,method in methods:
+        best = None
+        for n in range(repeat):
+            start = time.perf_counter()
+            records = method(raw)
+            elapsed = time.perf_counter() - start
+            assert len(records) == num_hits
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+
+def save(path, summary, label='', **info):
+    """Append summary to JSON lines results file
+
+    @param path: str
+    @param summary: dict
+    @param label: str Describes this run (e.g. "before keyword mapping")
+    @param info: Other settings to record (e.g. target, size)
+    @returns: dict as written
+    """
+    data = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'label': label,
+    }
+    data.update(info)
+    data.update(summary)
+    with open(path, 'a') as f:
+        f.write(json.dumps(data) + '\n')
+    return data
+
+def load(path):
+    """
+    @param path: str
+    @returns: list of dicts
+    """
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def format_results(results):
+    """Table of benchmark results, one line per run
+
+    @param results: list of dicts (see save, run)
+    @returns: list of str
+    """
+    columns = ['searches', 'clients', 'errors', 'throughput'] \
+        + ['p%s_ms' % p for p in PERCENTILES] + ['max_ms']
+    lines = [
+        '%-19s %-24s ' % ('timestamp', 'label')
+        + ' '.join(['%10s' % c for c in columns])
+    ]
+    for r in results:
+        lines.append(
+            '%-19s %-24s ' % (r.get('timestamp', ''), r.get('label', '')[:24])
+            + ' '.join(['%10s' % r.get(c, '') for c in columns])
+        )
+    return lines
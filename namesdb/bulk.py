@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+"""Bulk writes to Elasticsearch with adaptive batch size and concurrency
+
+Batch size and the number of concurrent bulk requests are adjusted AIMD
+style (additive increase, multiplicative decrease) like TCP congestion
+control: they grow while bulk requests come back quickly and without
+rejections, and are halved when the cluster pushes back with
+es_rejected_execution_exception (429) or slow responses.
+Rejected documents are sent again in a later batch.
+
+FanoutWriter sends the same actions to several clusters, each with its
+own AdaptiveBulkWriter, so documents are only transformed once.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+logger = logging.getLogger(__name__)
+import queue
+import time
+
+MIN_BATCH = 100
+MAX_BATCH = 5000
+BATCH_STEP = 100           # additive increase
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 4
+TARGET_LATENCY = 2.0       # seconds per bulk request
+MAX_ATTEMPTS = 5           # times a rejected document is resent
+MAX_ERRORS = 100           # errors kept in summary
+FANOUT_BUFFER = 10000      # actions queued per target in FanoutWriter
+
+
+def record_actions(indexname, records):
+    """Bulk (action, source) pairs for records
+
+    @param indexname: str
+    @param records: iterable of models.Record or models.RecordRow
+    @returns: generator of (dict, dict)
+    """
+    for record in records:
+        if hasattr(record, 'to_record'):
+            record = record.to_record()
+        yield (
+            {'index': {'_index': indexname, '_id': record.meta.id}},
+            record.to_dict(),
+        )
+
+
+class AdaptiveBulkWriter():
+    """Sends (action, source) pairs with bulk requests
+
+    Documents that fail (after any retries) are counted in the summary
+    and passed to on_error, if given, e.g. rejects.RejectLog.rejected.
+
+    Usage:
+        writer = AdaptiveBulkWriter(ds.es, max_batch=2000)
+        summary = writer.write(record_actions(indexname, records))
+    """
+
+    def __init__(self, es, min_batch=MIN_BATCH, max_batch=MAX_BATCH,
+                 min_concurrency=MIN_CONCURRENCY, max_concurrency=MAX_CONCURRENCY,
+                 target_latency=TARGET_LATENCY, on_error=None):
+        self.es = es
+        self.on_error = on_error
+        self.min_batch = min_batch
+        self.max_batch = max(max_batch, min_batch)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.target_latency = target_latency
+        self.batch_size = self.min_batch
+        self.concurrency = self.min_concurrency
+        self.retry = deque()
+        self.summary = {
+            'docs': 0,
+            'batches': 0,
+            'rejections': 0,
+            'errors': 0,
+            'error_items': [],
+            'batch_sizes': [],
+            'concurrency_max': self.concurrency,
+            'latency_max': 0.0,
+            'elapsed': 0.0,
+        }
+
+    def increase(self):
+        self.batch_size = min(self.batch_size + BATCH_STEP, self.max_batch)
+        if self.batch_size == self.max_batch:
+            self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+
+    def decrease(self):
+        self.batch_size = max(self.batch_size // 2, self.min_batch)
+        self.concurrency = max(self.concurrency // 2, self.min_concurrency)
+
+    def _batches(self, actions):
+        """Group actions (plus any rejected ones) into batches of current size
+        """
+        actions = iter(actions)
+        while True:
+            batch = []
+            while self.retry and (len(batch) < self.batch_size):
+                batch.append(self.retry.popleft())
+            for action,source in actions:
+                batch.append([action, source, 0])
+                if len(batch) >= self.batch_size:
+                    break
+            if not batch:
+                return
+            yield batch
+
+    def _send(self, batch):
+        """Send one bulk request (runs in worker thread)
+        @returns: (batch, response, latency)
+        """
+        dumps = self.es.transport.serializer.dumps
+        lines = []
+        for action,source,attempts in batch:
+            lines.append(dumps(action))
+            lines.append(dumps(source))
+        body = '\n'.join(lines) + '\n'
+        start = time.monotonic()
+        response = self.es.bulk(body=body)
+        return batch,response,time.monotonic() - start
+
+    def _finished(self, batch, response, latency):
+        """Record results of bulk request and adjust batch size
+        """
+        rejected = 0
+        for item,result in zip(batch, response['items']):
+            result = list(result.values())[0]
+            status = result.get('status', 200)
+            if status == 429:
+                rejected += 1
+                item[2] += 1
+                if item[2] < MAX_ATTEMPTS:
+                    self.retry.append(item)
+                    continue
+            if status >= 300:
+                self.summary['errors'] += 1
+                if len(self.summary['error_items']) < MAX_ERRORS:
+                    self.summary['error_items'].append(
+                        (result.get('_id'), result.get('error'))
+                    )
+                if self.on_error:
+                    self.on_error(item[0], item[1], result)
+            else:
+                self.summary['docs'] += 1
+        self.summary['batches'] += 1
+        self.summary['rejections'] += rejected
+        self.summary['batch_sizes'].append(len(batch))
+        self.summary['latency_max'] = max(self.summary['latency_max'], latency)
+        if rejected or (latency > self.target_latency):
+            self.decrease()
+        else:
+            self.increase()
+        self.summary['concurrency_max'] = max(
+            self.summary['concurrency_max'], self.concurrency
+        )
+        logging.debug('bulk %s docs %.2fs rejected %s -> batch %s concurrency %s' % (
+            len(batch), latency, rejected, self.batch_size, self.concurrency
+        ))
+
+    def write(self, actions):
+        """Write actions to Elasticsearch
+
+        @param actions: iterable of (action, source) (see record_actions)
+        @returns: dict summary (see format_summary)
+        """
+        start = time.monotonic()
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            while True:
+                batches = self._batches(actions)
+                while True:
+                    # wait before making the next batch so it gets the
+                    # size adjusted by the latest response
+                    while len(pending) >= self.concurrency:
+                        done,pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._finished(*future.result())
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    pending.add(pool.submit(self._send, batch))
+                    logging.info('Saving %s docs (%s saved)' % (
+                        len(batch), self.summary['docs']
+                    ))
+                # wait for last requests, which may put docs back in retry
+                for future in pending:
+                    self._finished(*future.result())
+                pending = set()
+                if not self.retry:
+                    break
+                actions = []
+        self.summary['elapsed'] = time.monotonic() - start
+        return self.summary
+
+
+class FanoutWriter():
+    """Sends the same (action, source) pairs to several clusters
+    
+    Each target has its own AdaptiveBulkWriter (batch size, concurrency,
+    retries) running in its own thread, fed from a bounded queue.  A slow
+    target only holds up the others once its queue is full.  If a target
+    fails its queue is drained so the other targets can finish.
+    
+    Usage:
+        writer = FanoutWriter([ds1.es, ds2.es], max_batch=2000)
+        summaries = writer.write(record_actions(indexname, records))
+    """
+
+    def __init__(self, clients, buffer_size=FANOUT_BUFFER, **options):
+        self.writers = [AdaptiveBulkWriter(es, **options) for es in clients]
+        self.buffer_size = buffer_size
+
+    def _target(self, writer, q):
+        """Write actions from queue (runs in worker thread)
+        @returns: dict summary
+        """
+        done = []
+        def actions():
+            while not done:
+                item = q.get()
+                if item is None:
+                    done.append(True)
+                    return
+                yield item
+        try:
+            summary = writer.write(actions())
+            summary['failed'] = None
+        except Exception as err:
+            logging.error('Bulk target failed: %s' % err)
+            summary = writer.summary
+            summary['failed'] = str(err)
+            for item in actions():
+                pass
+        return summary
+
+    def write(self, actions):
+        """Write actions to all targets
+        
+        @param actions: iterable of (action, source) (see record_actions)
+        @returns: list of dict summaries, in order of clients
+        """
+        queues = [queue.Queue(maxsize=self.buffer_size) for w in self.writers]
+        with ThreadPoolExecutor(max_workers=len(self.writers)) as pool:
+            futures = [
+                pool.submit(self._target, writer, q)
+                for writer,q in zip(self.writers, queues)
+            ]
+            for item in actions:
+                for q in queues:
+                    q.put(item)
+            for q in queues:
+                q.put(None)
+            return [future.result() for future in futures]
+
+
+def format_summary(summary):
+    """One-line description of AdaptiveBulkWriter summary
+
+    @param summary: dict
+    @returns: str
+    """
+    sizes = summary['batch_sizes'] or [0]
+    elapsed = summary['elapsed'] or 1
+    failed = ''
+    if summary.get('failed'):
+        failed = ' - FAILED: %s' % summary['failed']
+    return (
+        '%s docs in %s batches, batch size %s-%s (last %s), concurrency up to %s, '
+        '%s rejections, %s errors, max latency %.2fs, %.0f docs/s'
+    ) % (
+        summary['docs'], summary['batches'],
+        min(sizes), max(sizes), sizes[-1],
+        summary['concurrency_max'],
+        summary['rejections'], summary['errors'],
+        summary['latency_max'], summary['docs'] / elapsed,
+    ) + failed
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""Pre-built bulk payloads (see "namesdb post --emit-bulk", "namesdb load-bulk")
+
+Records, families, and stats transformed by an import can be written to a
+directory as ready-to-send _bulk NDJSON chunks instead of being sent to a
+cluster.  The same data can then be loaded into any number of clusters
+(restores, new clusters, mapping tests) without parsing the CSV again:
+
+    release-2024.1/
+        manifest.json
+        record-far-00000.ndjson.gz
+        record-far-00001.ndjson.gz
+        family-00000.ndjson.gz
+        stats-00000.ndjson.gz
+
+Actions in the chunks have no _index; each chunk's model is listed in
+the manifest and the index is chosen when loading (Docstore.index_name),
+so the payloads don't depend on the index prefix.  The manifest also has
+the number of documents and SHA-256 of each chunk, which are checked
+before the chunk is sent.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import logging
+logger = logging.getLogger(__name__)
+import os
+import time
+
+CHUNK_DOCS = 5000         # documents per chunk file
+LOAD_WORKERS = 4          # chunks sent concurrently
+MAX_ATTEMPTS = 5          # times a rejected (429) document is resent
+RETRY_WAIT = 1.0          # seconds, doubled after each attempt
+MAX_ERRORS = 100          # errors kept in summary
+MANIFEST = 'manifest.json'
+MANIFEST_FORMAT = 1
+
+
+def chunk_name(model, n, compress=False):
+    """
+    >>> chunk_name('record-far', 3, compress=True)
+    'record-far-00003.ndjson.gz'
+    """
+    name = '%s-%05d.ndjson' % (model, n)
+    if compress:
+        name += '.gz'
+    return name
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class BulkFileWriter():
+    """Writes (action, source) pairs to chunk files instead of a cluster
+
+    Usage:
+        writer = BulkFileWriter(outdir, compress=True)
+        writer.write('record-far', bulk.record_actions(indexname, records))
+        writer.write_manifest(dataset='far-manzanar')
+    """
+
+    def __init__(self, outdir, compress=False, chunk_docs=CHUNK_DOCS):
+        self.outdir = outdir
+        self.compress = compress
+        self.chunk_docs = chunk_docs
+        self.chunks = []
+        self.counts = {}
+        os.makedirs(outdir, exist_ok=True)
+
+    def _write_chunk(self, model, lines, docs):
+        n = self.counts.get(model, 0)
+        self.counts[model] = n + 1
+        name = chunk_name(model, n, self.compress)
+        path = os.path.join(self.outdir, name)
+        data = ''.join(lines).encode('utf-8')
+        if self.compress:
+            with gzip.open(path, 'wb', compresslevel=6) as f:
+                f.write(data)
+        else:
+            with open(path, 'wb') as f:
+                f.write(data)
+        self.chunks.append({
+            'file': name,
+            'model': model,
+            'docs': docs,
+            'bytes': len(data),
+            'sha256': file_sha256(path),
+        })
+        logging.debug('Wrote %s (%s docs)' % (name, docs))
+
+    def write(self, model, actions):
+        """Write actions to chunk files for model
+
+        @param model: str Index model, e.g. 'record-far', 'family' (see Docstore.index_name)
+        @param actions: iterable of (action, source) (see bulk.record_actions)
+        @returns: int Number of documents
+        """
+        lines = []
+        docs = 0
+        total = 0
+        for action,source in actions:
+            action = {
+                op: {key: value for key,value in meta.items() if key != '_index'}
+                for op,meta in action.items()
+            }
+            lines.append(json.dumps(action) + '\n')
+            lines.append(json.dumps(source, default=str) + '\n')
+            docs += 1
+            if docs >= self.chunk_docs:
+                self._write_chunk(model, lines, docs)
+                total += docs
+                lines = []
+                docs = 0
+        if docs:
+            self._write_chunk(model, lines, docs)
+            total += docs
+        logging.info('%s: %s docs' % (model, total))
+        return total
+
+    def write_manifest(self, **info):
+        """
+        @param info: Other things to record (e.g. dataset, csv checksum)
+        @returns: str path to manifest
+        """
+        manifest = {
+            'format': MANIFEST_FORMAT,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        manifest.update(info)
+        manifest['chunks'] = self.chunks
+        path = os.path.join(self.outdir, MANIFEST)
+        with open(path, 'w') as f:
+            f.write(json.dumps(manifest, indent=2))
+        return path
+
+
+def read_manifest(indir):
+    """
+    @param indir: str
+    @returns: dict
+    """
+    with open(os.path.join(indir, MANIFEST), 'r') as f:
+        manifest = json.loads(f.read())
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise Exception('Unknown bulk manifest format: %s' % manifest.get('format'))
+    return manifest
+
+def read_chunk(indir, chunk):
+    """Read chunk file and check its checksum
+
+    @param indir: str
+    @param chunk: dict (see BulkFileWriter.chunks)
+    @returns: bytes Uncompressed NDJSON
+    """
+    path = os.path.join(indir, chunk['file'])
+    with open(path, 'rb') as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != chunk['sha256']:
+        raise Exception('Checksum mismatch: %s' % path)
+    if chunk['file'].endswith('.gz'):
+        data = gzip.decompress(data)
+    return data
+
+def verify(indir, manifest=None):
+    """Check that all chunks are present and match the manifest
+
+    @param indir: str
+    @param manifest: dict
+    @returns: list of str Problems, empty if ok
+    """
+    if manifest is None:
+        manifest = read_manifest(indir)
+    problems = []
+    for chunk in manifest['chunks']:
+        path = os.path.join(indir, chunk['file'])
+        if not os.path.exists(path):
+            problems.append('missing: %s' % chunk['file'])
+        elif file_sha256(path) != chunk['sha256']:
+            problems.append('checksum mismatch: %s' % chunk['file'])
+    return problems
+
+
+class BulkFileLoader():
+    """Sends chunk files to a cluster, several at a time
+
+    Chunks are sent as they are, without parsing documents.  Documents
+    rejected with 429 are sent again (with backoff) by themselves.
+    Summaries have the same keys as bulk.AdaptiveBulkWriter's so
+    bulk.format_summary can be used.
+
+    Usage:
+        loader = BulkFileLoader(ds.es, ds.index_name)
+        summary = loader.load(indir)
+    """
+
+    def __init__(self, es, index_name, workers=LOAD_WORKERS):
+        self.es = es
+        self.index_name = index_name
+        self.workers = workers
+        self.summary = {
+            'docs': 0,
+            'batches': 0,
+            'rejections': 0,
+            'errors': 0,
+            'error_items': [],
+            'batch_sizes': [],
+            'concurrency_max': workers,
+            'latency_max': 0.0,
+            'elapsed': 0.0,
+        }
+
+    def _send(self, indexname, data):
+        """Send chunk, resending rejected documents (runs in worker thread)
+
+        @returns: (docs, rejections, error_items, latency)
+        """
+        lines = data.splitlines()
+        docs = 0
+        rejections = 0
+        error_items = []
+        latency = 0.0
+        attempt = 0
+        while lines:
+            start = time.monotonic()
+            response = self.es.bulk(body=b'\n'.join(lines) + b'\n', index=indexname)
+            latency = max(latency, time.monotonic() - start)
+            retry = []
+            for n,item in enumerate(response['items']):
+                result = list(item.values())[0]
+                status = result.get('status', 200)
+                if (status == 429) and (attempt + 1 < MAX_ATTEMPTS):
+                    rejections += 1
+                    retry += lines[n*2:n*2+2]
+                elif status >= 300:
+                    error_items.append((result.get('_id'), result.get('error')))
+                else:
+                    docs += 1
+            lines = retry
+            if lines:
+                time.sleep(RETRY_WAIT * 2**attempt)
+                attempt += 1
+        return docs,rejections,error_items,latency
+
+    def _load_chunk(self, indir, chunk):
+        data = read_chunk(indir, chunk)
+        return chunk, self._send(self.index_name(chunk['model']), data)
+
+    def load(self, indir, manifest=None):
+        """Send all chunks listed in manifest
+
+        @param indir: str
+        @param manifest: dict (default: read from indir)
+        @returns: dict summary (see bulk.format_summary)
+        """
+        if manifest is None:
+            manifest = read_manifest(indir)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(self._load_chunk, indir, chunk)
+                for chunk in manifest['chunks']
+            ]
+            for future in futures:
+                chunk,(docs,rejections,error_items,latency) = future.result()
+                self.summary['docs'] += docs
+                self.summary['batches'] += 1
+                self.summary['rejections'] += rejections
+                self.summary['errors'] += len(error_items)
+                self.summary['error_items'] += error_items[
+                    :MAX_ERRORS - len(self.summary['error_items'])
+                ]
+                self.summary['batch_sizes'].append(chunk['docs'])
+                self.summary['latency_max'] = max(self.summary['latency_max'], latency)
+                logging.info('%s: %s docs (%s loaded)' % (
+                    chunk['file'], docs, self.summary['docs']
+                ))
+        self.summary['elapsed'] = time.monotonic() - start
+        return self.summary
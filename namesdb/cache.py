@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of parsed and validated records, kept next to the source CSV
+
+Release files are imported repeatedly (staging, production, after mapping
+changes).  The first import can save the loaded models.RecordRows so later
+imports skip CSV decoding, date parsing, and Record.from_dict.
+
+Caches are keyed by the SHA-256 of the CSV file, the dataset, and a schema
+version made from the dataset's field list and the Record mapping, so a
+cache is ignored if the file, the dataset, or the model changes.
+"""
+
+import hashlib
+import json
+import logging
+logger = logging.getLogger(__name__)
+import os
+import pickle
+
+from . import models
+
+CACHE_FORMAT = 3
+CACHE_EXT = '.cache'
+HASH_BLOCKSIZE = 1024 * 1024
+
+
+def cache_path(csvpath):
+    """
+    >>> cache_path('/opt/namesdb-data/far-manzanar.csv')
+    '/opt/namesdb-data/far-manzanar.csv.cache'
+    """
+    return csvpath + CACHE_EXT
+
+def file_hash(path):
+    """SHA-256 of file contents
+
+    @param path: str
+    @returns: str
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCKSIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def schema_version(fields):
+    """Hash of cache format, dataset fields, and record mappings
+
+    @param fields: list
+    @returns: str
+    """
+    schema = {
+        'format': CACHE_FORMAT,
+        'fields': fields,
+        'mapping': {
+            family: models.record_mapping(family)
+            for family in models.RECORD_FAMILIES
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(schema, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+def cache_key(csvpath, dataset, fields):
+    """Key of cache for CSV file imported as dataset
+
+    The dataset is part of the key because records carry it (m_dataset,
+    record IDs), and the same file can be imported with -d/--dataset.
+
+    @param csvpath: str
+    @param dataset: str
+    @param fields: list
+    @returns: dict
+    """
+    return {
+        'file': file_hash(csvpath),
+        'dataset': dataset,
+        'schema': schema_version(fields),
+    }
+
+def write(csvpath, key, fields, records, rejects):
+    """Write records to cache file
+
+    Only the values tuples and errors of each RecordRow are stored;
+    fields is stored once.
+
+    @param csvpath: str
+    @param key: dict (see cache_key)
+    @param fields: list
+    @param records: list of models.RecordRow
+    @param rejects: list of reject entries (see rejects.RejectLog.entries)
+    @returns: str path to cache file
+    """
+    path = cache_path(csvpath)
+    data = {
+        'key': key,
+        'fields': fields,
+        'records': [(record.values, record.errors) for record in records],
+        'rejects': rejects,
+    }
+    tmppath = path + '.tmp'
+    with open(tmppath, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmppath, path)
+    return path
+
+def read(csvpath, key):
+    """Read records from cache file if it matches key
+
+    @param csvpath: str
+    @param key: dict (see cache_key)
+    @returns: (records, rejects) or None
+    """
+    path = cache_path(csvpath)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception as err:
+        logging.error('Could not read cache %s: %s' % (path, err))
+        return None
+    if data.get('key') != key:
+        logging.info('Cache is out of date: %s' % path)
+        return None
+    fields = data['fields']
+    records = [
+        models.RecordRow(fields, values, errors)
+        for values,errors in data['records']
+    ]
+    return records,data['rejects']
@@ -7,19 +7,55 @@ Sample usage:
     $ namesdb create -H localhost:9200
     $ namesdb destroy -H localhost:9200 --confirm
 
-    # Check status
+    # Check status; watch indexing rate during an import
     $ namesdb status -H localhost:9200
+    $ namesdb status -H localhost:9200 --watch
+
+    # Check a CSV file before importing (no Elasticsearch needed)
+    $ namesdb validate /tmp/namesdb-data/far-manzanar.csv
 
     # Import records
     $ namesdb post -H localhost:9200 /tmp/namesdb-data/far-manzanar.csv
 
+    # Import into staging and production at once (file is parsed once)
+    $ namesdb post -H stage:9200 -t "prod:9200;/etc/ddr/prod-ca.pem;PASSWORD" far-manzanar.csv
+
+    # Import compressed file, or from stdin
+    $ namesdb post -H localhost:9200 /tmp/namesdb-data/far-manzanar.csv.gz
+    $ xzcat far-manzanar.csv.xz | namesdb post -H localhost:9200 -d far-manzanar -
+
+    # Transform once, load many times
+    $ namesdb post --emit-bulk /opt/namesdb-bulk/far-manzanar --gzip far-manzanar.csv
+    $ namesdb load-bulk -H localhost:9200 /opt/namesdb-bulk/far-manzanar
+
     # Delete records
     $ namesdb delete -H localhost:9200 /tmp/namesdb-data/far-manzanar.csv
 
+    # Delete whole dataset in background, throttled; resume watching a task
+    $ namesdb delete -H localhost:9200 --dataset far-poston --rps 500
+    $ namesdb delete -H localhost:9200 --task oTUltX4IQMOUUVeiohTt8A:12345
+
+    # Link records of the same person across datasets
+    $ namesdb link -H localhost:9200
+
+    # Counts per camp, gender, birthyear, state (computed at import)
+    $ namesdb stats -H localhost:9200 -d far-manzanar
+
+    # Everyone in a family (household)
+    $ namesdb family -H localhost:9200 -d wra-master 12345
+
+    # Run search API
+    $ namesdb serve -H localhost:9200 --port 8085
+
+    # Search latency benchmark
+    $ namesdb bench -H localhost:9200 --clients 8 -s bench.jsonl queries.txt
+
     # Search for record
     $ namesdb search -H localhost:9200 yano
     $ namesdb search -H localhost:9200 "George Takei"
     $ namesdb search -H localhost:9200 7-manzanar_zoriki_1922_masayuki
+    $ namesdb search -H localhost:9200 --names Oohashi
+    $ namesdb search -H localhost:9200 --profile yano
 
 Note: You can set environment variables for Elasticsearch:
 
@@ -27,6 +63,14 @@ Note: You can set environment variables for Elasticsearch:
     $ export ES_SSL_CERT=/etc/ddr/elasticsearch-ca.pem
     $ export ES_PASSWORD=REDACTED
 
+Transport settings (also available as options):
+
+    $ export ES_TIMEOUT=bulk=300,search=10   # or seconds for everything
+    $ export ES_POOL_SIZE=20                 # connections per host
+    $ export ES_COMPRESS=false               # gzip request bodies
+    $ export ES_RETRIES=8                    # retries on 429/503/conn errors
+    $ export ES_TARGETS="prod:9200;/etc/ddr/prod-ca.pem;PASSWORD"  # post --target
+
 """
 
 import os
@@ -34,22 +78,75 @@ import sys
 
 import click
 
-from . import docstore
-from . import publish
+# Only light modules here; commands import docstore/publish/etc as needed
+# so "namesdb help" etc don't pay for elasticsearch and the definitions.
+from . import bulk
+from . import config
 
-INDEX_PREFIX = docstore.INDEX_PREFIX
+INDEX_PREFIX = config.INDEX_PREFIX
 
 
 class Settings():
     DOCSTORE_HOST = ''
     DOCSTORE_SSL_CERTFILE = ''
     DOCSTORE_PASSWORD = ''
+    DOCSTORE_TIMEOUTS = config.DOCSTORE_TIMEOUTS
+    DOCSTORE_POOL_SIZE = config.POOL_SIZE
+    DOCSTORE_COMPRESS = True
+    DOCSTORE_RETRIES = config.RETRIES
 
-    def __init__(self, host, sslcert, password):
+    def __init__(self, host, sslcert, password,
+                 timeout=None, pool_size=None, compress=True, retries=None):
         self.DOCSTORE_HOST = host
         self.DOCSTORE_SSL_CERTFILE = sslcert
         self.DOCSTORE_USERNAME = 'elastic'
         self.DOCSTORE_PASSWORD = password
+        self.DOCSTORE_TIMEOUTS = dict(config.DOCSTORE_TIMEOUTS)
+        self.DOCSTORE_TIMEOUTS.update(config.parse_timeouts(timeout))
+        if pool_size:
+            self.DOCSTORE_POOL_SIZE = pool_size
+        self.DOCSTORE_COMPRESS = compress
+        if retries is not None:
+            self.DOCSTORE_RETRIES = retries
+
+
+def transport_options(func):
+    """Elasticsearch transport options used by all commands that connect
+    """
+    options = [
+        click.option('--timeout','-T', envvar='ES_TIMEOUT',
+                     help='Timeout secs, or per operation (bulk=120,search=10).'),
+        click.option('--pool-size', envvar='ES_POOL_SIZE', type=int,
+                     help='Connections per host.'),
+        click.option('--compress/--no-compress', envvar='ES_COMPRESS', default=True,
+                     help='Gzip request bodies (default on).'),
+        click.option('--retries', envvar='ES_RETRIES', type=int,
+                     help='Retries with backoff on 429/503/connection errors.'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def slowlog_options(func):
+    """Slow query log options used by commands that search
+    """
+    options = [
+        click.option('--slow-log', envvar='NAMESDB_SLOW_LOG',
+                     help='Write slow searches to this file (JSON lines).'),
+        click.option('--slow-threshold', envvar='NAMESDB_SLOW_THRESHOLD', type=float,
+                     help='Seconds before a search counts as slow (default 1.0).'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+def enable_slowlog(path, threshold):
+    if path:
+        from . import profiling
+        if threshold is None:
+            threshold = profiling.SLOW_THRESHOLD
+        profiling.enable_slowlog(path, threshold)
 
 
 @click.group()
@@ -62,6 +159,9 @@ def namesdb(debug):
     """
     if debug:
         click.echo('Debug mode is on')
+        config.set_logging('DEBUG')
+    else:
+        config.set_logging(config.LOGGING_LEVEL)
 
 
 @namesdb.command()
@@ -71,10 +171,25 @@ def help():
     click.echo(HELP)
 
 
+def parse_target(text):
+    """Parse --target option
+    
+    >>> parse_target('prod:9200;/etc/ddr/ca.pem;secret')
+    ('prod:9200', '/etc/ddr/ca.pem', 'secret')
+    >>> parse_target('dr1:9200,dr2:9200')
+    ('dr1:9200,dr2:9200', '', '')
+    
+    @param text: str HOSTS[;SSLCERT[;PASSWORD]]
+    @returns: (hosts, sslcert, password)
+    """
+    parts = text.split(';', 2) + ['', '']
+    return parts[0].strip(),parts[1].strip(),parts[2]
+
 def hosts_index(hosts):
     if not hosts:
         click.echo('Set host using --host or the ES_HOST environment variable.')
         sys.exit(1)
+    from . import publish
     return publish.make_hosts(hosts)
 
 
@@ -82,10 +197,12 @@ def hosts_index(hosts):
 @click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
 @click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
 @click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
-def create(hosts, sslcert, password):
+@transport_options
+def create(hosts, sslcert, password, **transport):
     """Create specified Elasticsearch index and upload mappings.
     """
-    settings = Settings(hosts, sslcert, password)
+    from . import docstore
+    settings = Settings(hosts, sslcert, password, **transport)
     ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
     ds.create_indices()
 
@@ -94,9 +211,10 @@ def create(hosts, sslcert, password):
 @click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
 @click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
 @click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
 @click.option('--confirm', is_flag=True,
               help='Yes I really want to delete this index.')
-def destroy(hosts, sslcert, password, confirm):
+def destroy(hosts, sslcert, password, confirm, **transport):
     """Destroy specified Elasticsearch index and all its records.
 
     Think twice before you do this, then think again.
@@ -107,8 +225,9 @@ def destroy(hosts, sslcert, password, confirm):
     It's meant to sound serious. Also to not clash with 'delete', which
     is for individual documents.
     """
+    from . import docstore
     if confirm:
-        settings = Settings(hosts, sslcert, password)
+        settings = Settings(hosts, sslcert, password, **transport)
         ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
         ds.delete_indices()
     else:
@@ -119,45 +238,99 @@ def destroy(hosts, sslcert, password, confirm):
 @click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
 @click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
 @click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
-def status(hosts, sslcert, password):
+@transport_options
+@click.option('--watch','-w', is_flag=True, help='Show indexing rate and rejections until interrupted.')
+@click.option('--interval','-i', type=float, default=5, help='Seconds between --watch samples.')
+@click.option('--json','as_json', is_flag=True, help='Output JSON (one object per sample with --watch).')
+def status(hosts, sslcert, password, watch, interval, as_json, **transport):
     """Print status info.
 
-    More detail since you asked.
+    More detail since you asked.  Doc counts per index and dataset,
+    store size, segments, refresh and merge totals, and search and
+    indexing latencies per node.  Use --watch during an import.
     """
-    settings = Settings(hosts, sslcert, password)
+    import json
+    from elasticsearch.exceptions import ConnectionError
+    from . import docstore
+    from .status import format_rates, format_status
+    from .status import watch as watch_status
+    settings = Settings(hosts, sslcert, password, **transport)
     ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
-    ds.status()
-
-    print('------------------------------------------------------------------------',0)
-    print('Elasticsearch')
-    # config file
-    print('DOCSTORE_HOST  (default): %s' % hosts)
-
     try:
         pingable = ds.es.ping()
-        if not pingable:
-            print("Can't ping the cluster!")
-            return
-    except elasticsearch.exceptions.ConnectionError:
-        print("Connection error when trying to ping the cluster!")
+    except ConnectionError:
+        pingable = False
+    if not pingable:
+        click.echo("Can't ping the cluster at %s!" % hosts)
+        sys.exit(1)
+    if watch:
+        try:
+            for rates in watch_status(ds, interval):
+                if as_json:
+                    click.echo(json.dumps(rates))
+                else:
+                    click.echo(format_rates(rates))
+        except KeyboardInterrupt:
+            pass
         return
-    print('ping ok')
+    summary = ds.status()
+    if as_json:
+        click.echo(json.dumps(summary, indent=2))
+        return
+    click.echo('DOCSTORE_HOST  (default): %s' % hosts)
+    for line in format_status(summary):
+        click.echo(line)
 
-    print('Indexes')
-    index_names = ds.es.indices.stats()['indices'].keys()
-    for i in index_names:
-        print('- %s' % i)
+
+@namesdb.command()
+@click.option('--dataset','-d', help='Dataset name (if not in filename).')
+@click.option('--processes','-p', type=int, help='Number of worker processes (default: all CPUs).')
+@click.argument('csvpath') # Absolute path to CSV file (named ${dataset}.csv).
+def validate(dataset, processes, csvpath):
+    """Check CSV file for errors without touching Elasticsearch.
+
+    \b
+    Verifies headers, field types, and finds duplicate m_pseudoids.
+        $ namesdb validate /opt/namesdb-data/0.1/far-manzanar.csv
+
+    \b
+    Exits with nonzero status if errors are found.
+    """
+    from .validate import validate_csv
+    report = validate_csv(csvpath, dataset, processes)
+    for line in report.format():
+        click.echo(line)
+    if not report.ok():
+        sys.exit(1)
 
 
 @namesdb.command()
 @click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
 @click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
 @click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
 @click.option('--dataset','-d', help='Dataset name (if not in filename).')
 @click.option('--ids','-i', help='Comma-separated list of record IDs to post.')
 @click.option('--stop','-s', is_flag=True, help='Stop if errors detected.')
+@click.option('--cache','-c', is_flag=True, help='Use/write pre-parsed cache file next to CSV.')
+@click.option('--batch-min', type=int, default=bulk.MIN_BATCH, help='Minimum docs per bulk request.')
+@click.option('--batch-max', type=int, default=bulk.MAX_BATCH, help='Maximum docs per bulk request.')
+@click.option('--concurrency', type=int, default=bulk.MAX_CONCURRENCY, help='Maximum concurrent bulk requests.')
+@click.option('--sample', type=int, help='Import a random sample of N rows.')
+@click.option('--sample-fraction', type=float, help='Import a random fraction (0.0-1.0) of rows.')
+@click.option('--limit', type=int, help='Import at most N rows.')
+@click.option('--seed', type=int, default=0, help='Random seed for --sample/--sample-fraction.')
+@click.option('--target','-t', multiple=True, envvar='ES_TARGETS', help='Also write to HOSTS[;SSLCERT[;PASSWORD]] (repeatable).')
+@click.option('--families/--no-families', default=True, help='Write family documents (default on).')
+@click.option('--rejects','-r', help='Reject file (default: CSVPATH.rejects.ndjson).')
+@click.option('--from-rejects', help='Post only rows listed in this reject file.')
+@click.option('--emit-bulk', help='Write bulk payload files to this directory instead of posting.')
+@click.option('--gzip','-z', 'gzip_bulk', is_flag=True, help='gzip --emit-bulk files.')
 @click.argument('csvpath') # Absolute path to CSV file (named ${dataset}.csv).
-def post(hosts, sslcert, password, dataset, ids, stop, csvpath):
+def post(hosts, sslcert, password, dataset, ids, stop, cache,
+         batch_min, batch_max, concurrency, sample, sample_fraction, limit, seed,
+         target, families, rejects, from_rejects, emit_bulk, gzip_bulk,
+         csvpath, **transport):
     """Read records from CSV file and push to Elasticsearch.
 
     \b
@@ -168,44 +341,265 @@ def post(hosts, sslcert, password, dataset, ids, stop, csvpath):
     If filename does not contain the dataset name, specify using -d/--dataset:
         $ namesdb post -h localhost:9200 -d far-manzanar /tmp/random-file.csv
 
+    \b
+    Files compressed with gzip, bzip2, xz, or zstd are read directly.
+    Use "-" to read from stdin (requires -d/--dataset):
+        $ zcat far-manzanar.csv.gz | namesdb post -h localhost:9200 -d far-manzanar -
+
     \b
     Process only specified IDs using --ids:
         $ namesdb post far-ancestry.csv -i 1-topaz_hirabayashi_1890_george
+
+    \b
+    Bulk batch size and concurrency adapt to cluster load within bounds:
+        $ namesdb post -h localhost:9200 --batch-max 2000 --concurrency 2 far-manzanar.csv
+
+    \b
+    Build a small staging index from a sample of rows (same seed, same sample):
+        $ namesdb post -h localhost:9200 --sample 1000 --seed 42 wra-master.csv
+        $ namesdb post -h localhost:9200 --sample-fraction 0.01 wra-master.csv
+        $ namesdb post -h localhost:9200 --limit 500 wra-master.csv
+
+    \b
+    Write to other clusters too; the file is parsed once and each cluster
+    gets its own batch sizes, retries, and summary:
+        $ namesdb post -H stage:9200 -t "prod:9200;/etc/ddr/prod-ca.pem;PASSWORD" far-manzanar.csv
+
+    \b
+    Family documents (see "namesdb family") are written after the records
+    unless --no-families is given, or only some rows are imported.
+    The dataset's stats document (see "namesdb stats") is replaced at the
+    end of full imports.
+
+    \b
+    Defective rows, invalid values, and records refused by Elasticsearch
+    are written to a reject file (far-manzanar.csv.rejects.ndjson) with a
+    summary at the end.  After fixing the CSV, post only the rejected rows:
+        $ namesdb post -h localhost:9200 --from-rejects far-manzanar.csv.rejects.ndjson far-manzanar.csv
+
+    \b
+    Write ready-to-send bulk payloads (records, families, stats) to a
+    directory instead, without a cluster; load them with "namesdb load-bulk":
+        $ namesdb post --emit-bulk /opt/namesdb-bulk/2024.1/far-manzanar --gzip far-manzanar.csv
+
+    \b
+    Save parsed records in far-manzanar.csv.cache so later runs (e.g. to
+    another cluster) can skip parsing; ignored if CSV or schema changes:
+        $ namesdb post -h localhost:9200 --cache far-manzanar.csv
     """
-    settings = Settings(hosts, sslcert, password)
-    ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    from . import docstore
+    from . import publish
+    from .rejects import reject_ids
+    settings = Settings(hosts, sslcert, password, **transport)
+    if emit_bulk:
+        # bulk files are written without a cluster
+        ds = None
+    else:
+        ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
     # --ids
     if ids and isinstance(ids, str):
         record_ids = ids.replace(' ','').split(',')
     else:
         record_ids = []
+    if from_rejects:
+        record_ids += reject_ids(from_rejects)
+        if not record_ids:
+            click.echo('No rows to re-import in %s' % from_rejects)
+            sys.exit(1)
     # ok go
-    publish.import_records(ds, dataset, stop, csvpath, record_ids=ids)
+    bulk_options = {
+        'min_batch': batch_min,
+        'max_batch': batch_max,
+        'max_concurrency': concurrency,
+    }
+    sample_options = {}
+    if sample or sample_fraction or limit:
+        sample_options = {
+            'size': sample,
+            'frac': sample_fraction,
+            'num': limit,
+            'seed': seed,
+        }
+    targets = []
+    for text in target:
+        target_hosts,target_sslcert,target_password = parse_target(text)
+        target_settings = Settings(
+            target_hosts, target_sslcert, target_password, **transport
+        )
+        targets.append(
+            docstore.Docstore(INDEX_PREFIX, target_hosts, target_settings)
+        )
+    publish.import_records(
+        ds, dataset, stop, csvpath, record_ids=record_ids, use_cache=cache,
+        bulk_options=bulk_options, sample_options=sample_options,
+        targets=targets, families=families, rejects_path=rejects,
+        emit_dir=emit_bulk, compress=gzip_bulk,
+    )
+
+@namesdb.command('load-bulk')
+@click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
+@click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
+@click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--workers','-w', type=int, default=4, help='Chunks sent concurrently.')
+@click.argument('bulkdir')
+def load_bulk(hosts, sslcert, password, workers, bulkdir, **transport):
+    """Send bulk payload files written by "post --emit-bulk".
+
+    \b
+    Chunk checksums are checked against the manifest before loading.
+    Indexes are chosen by model, so create them first:
+        $ namesdb create -H localhost:9200
+        $ namesdb load-bulk -H localhost:9200 /opt/namesdb-bulk/2024.1/far-manzanar
+    """
+    from . import docstore
+    from . import publish
+    settings = Settings(hosts, sslcert, password, **transport)
+    ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    publish.load_bulk(ds, bulkdir, workers=workers)
 
 @namesdb.command()
 @click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
 @click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
 @click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
-@click.argument('csvpath') # Absolute path to CSV file (named ${dataset}.csv).
-def delete(hosts, sslcert, password):
+@transport_options
+@click.option('--dataset','-d', help='Delete all documents of dataset (no CSV needed).')
+@click.option('--slices', default='auto', help='Parallel slices for --dataset (default: one per shard).')
+@click.option('--rps', type=float, help='Throttle --dataset deletes (requests per second).')
+@click.option('--task', help='Resume watching delete task (NODE:ID).')
+@click.option('--no-wait', is_flag=True, help='Start --dataset delete and exit without watching.')
+@click.argument('csvpath', required=False) # Absolute path to CSV file (named ${dataset}.csv).
+def delete(hosts, sslcert, password, dataset, slices, rps, task, no_wait, csvpath, **transport):
     """Delete records in CSV file from Elasticsearch.
 
     Use this function to delete all records for a given dataset by pointing
     the function at the CSV file.  To delete only certain records, make a CSV file
     containing a single column containing NamesDB pseudo IDs, having the column
     header "m_pseudoid".
+
+    With --dataset, all records and families of the dataset are deleted by
+    background tasks on the cluster and their progress is shown; if
+    interrupted, watch again with --task.
+    """
+    from . import docstore
+    from . import publish
+    settings = Settings(hosts, sslcert, password, **transport)
+    ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    if task:
+        publish.watch_task(ds, task)
+    elif dataset:
+        if slices != 'auto':
+            slices = int(slices)
+        tasks = publish.delete_dataset(
+            ds, dataset, slices=slices, requests_per_second=rps
+        )
+        if not no_wait:
+            for task_id in tasks:
+                publish.watch_task(ds, task_id)
+    elif csvpath:
+        publish.delete_records(ds, csvpath)
+    else:
+        click.echo('Specify a CSV file, --dataset, or --task.')
+        sys.exit(1)
+
+
+@namesdb.command()
+@click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
+@click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
+@click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--threshold','-t', type=float, help='Minimum match score (0.0-1.0, default 0.75).')
+@click.option('--processes','-p', type=int, help='Number of worker processes (default: all CPUs).')
+@click.option('--dry-run','-n', is_flag=True, help='Find links but do not write them.')
+def link(hosts, sslcert, password, threshold, processes, dry_run, **transport):
+    """Link records of the same person across datasets.
+
+    \b
+    Compares records that share a blocking key (lastname+birthyear,
+    lastname+camp, camp+family number) and gives records that match
+    the same m_linkid.  Use "namesdb search --collapse" to get one
+    result per person.
+        $ namesdb link -H localhost:9200
+        $ namesdb link -H localhost:9200 --threshold 0.85 --dry-run
+    """
+    from . import docstore
+    from . import publish
+    settings = Settings(hosts, sslcert, password, **transport)
+    ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    publish.link_records(ds, threshold, processes, dry_run)
+
+
+@namesdb.command()
+@click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
+@click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
+@click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--dataset','-d', help='Dataset (default: all, plus combined totals).')
+@click.option('--limit','-l', type=int, default=20, help='Values shown per field.')
+def stats(hosts, sslcert, password, dataset, limit, **transport):
+    """Print counts per camp, gender, birthyear, state (from last import).
+
+    \b
+    Reads the stats documents written by "namesdb post", no aggregations:
+        $ namesdb stats -H localhost:9200 -d far-manzanar
+        $ namesdb stats -H localhost:9200
+    """
+    from . import docstore
+    from . import publish
+    from .stats import format_stats, merge_sources
+    settings = Settings(hosts, sslcert, password, **transport)
+    ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    sources = publish.get_stats(ds, dataset)
+    if not sources:
+        click.echo('No stats; run "namesdb post" first.')
+        sys.exit(1)
+    if len(sources) > 1:
+        sources.append(merge_sources(sources))
+    for source in sources:
+        for line in format_stats(source, limit):
+            click.echo(line)
+
+
+@namesdb.command()
+@click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
+@click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
+@click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--dataset','-d', help='Dataset (one get instead of a search).')
+@click.argument('familyno')
+def family(hosts, sslcert, password, dataset, familyno, **transport):
+    """Print members of a family (household).
+
+    \b
+        $ namesdb family -H localhost:9200 -d wra-master 12345
+        $ namesdb family -H localhost:9200 12345
     """
-    settings = Settings(hosts, sslcert, password)
+    from . import docstore
+    from . import publish
+    from .family import format_family
+    settings = Settings(hosts, sslcert, password, **transport)
     ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
-    publish.delete_records(ds, args)
+    families = publish.get_family(ds, familyno, dataset)
+    if not families:
+        click.echo('No family %s' % familyno)
+        sys.exit(1)
+    for source in families:
+        for line in format_family(source):
+            click.echo(line)
 
 
 @namesdb.command()
 @click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
 @click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
 @click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--collapse','-c', is_flag=True, help='One result per linked person (see link).')
+@click.option('--names','-n', 'match_names', is_flag=True, help='Match name spelling variants (Ohashi/Oohashi/Ōhashi).')
+@click.option('--profile', is_flag=True, help='Print timing breakdown (Elasticsearch profile API and client).')
+@slowlog_options
 @click.argument('query') # Search query.
-def search(hosts, sslcert, password, query):
+def search(hosts, sslcert, password, collapse, match_names, profile,
+           slow_log, slow_threshold, query, **transport):
     """Perform search query, return results in raw JSON.
 
     Whatever text follows the HOST and INDEX args will be pasted directly into
@@ -215,11 +609,153 @@ def search(hosts, sslcert, password, query):
         $ namesdb search -H localhost:9200 yano
         $ namesdb search -H localhost:9200 "George Takei"
         $ namesdb search -H localhost:9200 7-manzanar_zoriki_1922_masayuki
+
+    \b
+    Match romanization variants of names using precomputed keys:
+        $ namesdb search -H localhost:9200 --names "Oohashi Kazuo"
+
+    \b
+    Show where the time goes (query, sort, fetch, deserialize, convert):
+        $ namesdb search -H localhost:9200 --profile yano
+
+    \b
+    Log searches slower than 0.5s as JSON lines:
+        $ namesdb search -H localhost:9200 --slow-log slow.json --slow-threshold 0.5 yano
+    """
+    from . import docstore
+    from . import publish
+    enable_slowlog(slow_log, slow_threshold)
+    settings = Settings(hosts, sslcert, password, **transport)
+    ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    publish.search(ds, query, collapse, match_names, profile)
+
+
+
+@namesdb.command()
+@click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
+@click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
+@click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--bind','-b', default='127.0.0.1', help='Address to listen on.')
+@click.option('--port','-p', type=int, default=8085, help='Port to listen on.')
+@slowlog_options
+def serve(hosts, sslcert, password, bind, port, slow_log, slow_threshold,
+          **transport):
+    """Serve search/get/facets/suggest as a JSON HTTP API.
+
+    \b
+    Keeps one pooled Elasticsearch connection for all requests:
+        $ namesdb serve -H localhost:9200 --port 8085
+        $ curl 'http://127.0.0.1:8085/search?q=yano&page=2&size=25'
+        $ curl 'http://127.0.0.1:8085/records/far-manzanar:7-manzanar_yano_1922_taro'
+        $ curl 'http://127.0.0.1:8085/facets?field=m_camp'
+        $ curl 'http://127.0.0.1:8085/suggest?q=yan'
+
+    \b
+    Log slow searches (JSON lines):
+        $ namesdb serve -H localhost:9200 --slow-log /var/log/namesdb-slow.json
     """
-    settings = Settings(hosts, sslcert, password)
+    from . import docstore
+    from . import server
+    enable_slowlog(slow_log, slow_threshold)
+    settings = Settings(hosts, sslcert, password, **transport)
     ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
-    publish.search(ds, query)
+    server.serve(ds, bind, port)
+
+
+@namesdb.command()
+@click.option('--hosts','-H', envvar='ES_HOST', help='Elasticsearch hosts.')
+@click.option('--sslcert','-S', envvar='ES_SSL_CERT', help='(optional) Elasticsearch SSL cert file.')
+@click.option('--password','-P', envvar='ES_PASSWORD', help='(optional) Elasticsearch password.')
+@transport_options
+@click.option('--memory','-m', multiple=True, help='Search in-memory stand-in loaded from this CSV instead (repeatable).')
+@click.option('--clients','-c', type=int, default=4, help='Number of concurrent clients.')
+@click.option('--repeat','-r', type=int, default=1, help='Times each client replays the queries.')
+@click.option('--size', type=int, default=100, help='Results per search.')
+@click.option('--collapse', is_flag=True, help='One result per linked person (see link).')
+@click.option('--names','-n', 'match_names', is_flag=True, help='Match name spelling variants.')
+@click.option('--save','-s', help='Append results to this file (JSON lines) and compare.')
+@click.option('--label','-l', default='', help='Label for saved results.')
+@click.option('--hits', type=int, help='Instead, time converting a synthetic response with this many hits.')
+@click.option('--import','import_csv', help='Instead, time importing this CSV into the in-memory stand-in.')
+@click.option('--latency', help='In-memory latency: SECONDS or OP=SECONDS,... (ops as in --timeout).')
+@click.option('--doc-latency', type=float, default=0.0, help='In-memory latency per bulk document (seconds).')
+@click.argument('queryfile', required=False) # Queries, one per line.
+def bench(hosts, sslcert, password, memory, clients, repeat, size, collapse,
+          match_names, save, label, hits, import_csv, latency, doc_latency,
+          queryfile, **transport):
+    """Search latency benchmark: replay queries with concurrent clients.
+
+    \b
+    Reports throughput and p50/p95/p99 latency:
+        $ namesdb bench -H localhost:9200 --clients 8 --repeat 3 queries.txt
+
+    \b
+    Save results and compare with earlier runs (e.g. before a mapping change):
+        $ namesdb bench -H localhost:9200 -s bench.jsonl -l "keyword names" queries.txt
+
+    \b
+    Measure namesdb code path overhead without a cluster:
+        $ namesdb bench --memory far-manzanar.csv --memory wra-master.csv queries.txt
+
+    \b
+    Inject latency to stand in for a cluster of known speed:
+        $ namesdb bench --memory far-manzanar.csv --latency search=0.005 queries.txt
+        $ namesdb bench --import far-manzanar.csv --latency bulk=0.05 --doc-latency 0.0001
 
+    \b
+    Compare ways of converting hits to records (no cluster needed):
+        $ namesdb bench --hits 10000
+    """
+    from . import benchmark
+    from .config import parse_timeouts
+    latency = parse_timeouts(latency)
+    if hits:
+        timings = benchmark.time_conversion(hits, max(repeat, 3))
+        for name,seconds in timings.items():
+            click.echo('%-10s %9.1fms  %6.2fus/hit' % (
+                name, seconds * 1000, seconds / hits * 1000000
+            ))
+        return
+    if import_csv:
+        ds = benchmark.memory_docstore([], INDEX_PREFIX, latency, doc_latency)
+        result = benchmark.time_import(ds, import_csv)
+        if save:
+            benchmark.save(save, result, label, target='memory', csv=import_csv,
+                           latency=latency, doc_latency=doc_latency)
+        for key,value in result.items():
+            click.echo('%-10s %s' % (key, value))
+        return
+    if not queryfile:
+        click.echo('QUERYFILE is required (or use --hits or --import).')
+        sys.exit(1)
+    queries = benchmark.read_queries(queryfile)
+    if memory:
+        target = 'memory'
+        ds = benchmark.memory_docstore(memory, INDEX_PREFIX, latency, doc_latency)
+    else:
+        if not hosts:
+            click.echo('Set host using --host or the ES_HOST environment variable, or use --memory.')
+            sys.exit(1)
+        from . import docstore
+        target = hosts
+        settings = Settings(hosts, sslcert, password, **transport)
+        ds = docstore.Docstore(INDEX_PREFIX, hosts, settings)
+    search = benchmark.search_function(ds, collapse, match_names, size)
+    click.echo('%s queries, %s clients, %s repeats, target %s' % (
+        len(queries), clients, repeat, target
+    ))
+    summary = benchmark.run(search, queries, clients, repeat)
+    if save:
+        benchmark.save(
+            save, summary, label, target=target, size=size,
+            collapse=collapse, match_names=match_names,
+        )
+        results = benchmark.load(save)
+    else:
+        results = [summary]
+    for line in benchmark.format_results(results):
+        click.echo(line)
 
 if __name__ == '__main__':
     cli(auto_envvar_prefix='NAMESDB')
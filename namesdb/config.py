@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Settings and defaults that are needed before anything heavy is loaded
+
+Importing this module must not have side effects or import elasticsearch,
+elasticsearch_dsl, or definitions; cli imports it at startup and loads
+other modules only in the commands that need them.
+"""
+
+import configparser
+import logging
+import sys
+
+LOGGING_LEVEL = 'INFO'
+CONFIG_FILES = ['/etc/ddr/names.cfg', '/etc/ddr/names-local.cfg']
+
+INDEX_PREFIX = 'namesdb'
+
+DOCSTORE_TIMEOUT = 30
+# Request timeouts (seconds) by operation (see docstore.operation()).
+DOCSTORE_TIMEOUTS = {
+    'bulk': 120,
+    'delete': 60,
+    'get': 10,
+    'index': DOCSTORE_TIMEOUT,
+    'search': 30,
+    'status': 10,
+}
+POOL_SIZE = 10            # connections per host
+RETRIES = 5
+
+
+def set_logging(level, stream=sys.stdout):
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        stream=stream,
+    )
+
+def read_config(paths=CONFIG_FILES):
+    """Read config files (only when asked)
+
+    @param paths: list
+    @returns: configparser.ConfigParser
+    """
+    config = configparser.ConfigParser()
+    config.read(paths)
+    return config
+
+def parse_timeouts(text):
+    """Parse timeout option into dict of operation:seconds
+
+    >>> parse_timeouts('60')
+    {'bulk': 60.0, 'delete': 60.0, 'get': 60.0, 'index': 60.0, 'search': 60.0, 'status': 60.0}
+    >>> parse_timeouts('bulk=300,search=5')
+    {'bulk': 300.0, 'search': 5.0}
+
+    @param text: str Seconds, or comma-separated list of operation=seconds
+    @returns: dict
+    """
+    if not text:
+        return {}
+    if '=' not in text:
+        return {op: float(text) for op in DOCSTORE_TIMEOUTS.keys()}
+    timeouts = {}
+    for item in text.split(','):
+        op,seconds = item.split('=')
+        timeouts[op.strip()] = float(seconds)
+    return timeouts
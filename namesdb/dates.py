@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""Date normalization for date fields (see definitions.FIELD_DEFINITIONS)
+
+Source CSVs use a handful of date formats and the same few thousand dates
+repeat across hundreds of thousands of rows.  Each date column's format
+is inferred from a sample of rows; values are parsed with strptime using
+that format and results are memoized.  Values that don't match fall back
+to dateutil, which is what elasticsearch_dsl.Date uses.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+import logging
+logger = logging.getLogger(__name__)
+
+from . import definitions
+
+# Candidate formats, in order of preference when a sample is ambiguous.
+# Month-first comes before day-first to match dateutil's default.
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%m/%d/%y',
+    '%m-%d-%Y',
+    '%d-%m-%Y',
+    '%d/%m/%Y',
+    '%Y/%m/%d',
+    '%Y%m%d',
+    '%d %b %Y',
+    '%b %d, %Y',
+    '%B %d, %Y',
+]
+ISO_FORMAT = DATE_FORMATS[0]
+SAMPLE_SIZE = 1000   # rows used to infer formats
+CACHE_SIZE = 10000   # parsed values remembered per format
+
+DATE_FIELDS = [
+    field for field,fielddef in definitions.FIELD_DEFINITIONS.items()
+    if fielddef['type'] == 'date'
+]
+
+
+def _strptime(value, fmt):
+    try:
+        return datetime.strptime(value, fmt).date()
+    except ValueError:
+        return None
+
+def infer_format(values, formats=DATE_FORMATS):
+    """Returns the format that parses the most values
+
+    >>> infer_format(['01/02/1943', '12/25/1944'])
+    '%m/%d/%Y'
+    >>> infer_format(['25-12-1944', '01-02-1943'])
+    '%d-%m-%Y'
+
+    @param values: list of str
+    @param formats: list of strptime formats
+    @returns: str format or None
+    """
+    values = [v for v in values if v]
+    best = None
+    best_count = 0
+    for fmt in formats:
+        count = len([v for v in values if _strptime(v, fmt)])
+        if count > best_count:
+            best,best_count = fmt,count
+        if best_count == len(values):
+            break
+    return best
+
+def infer_formats(fields, headers, rows):
+    """Infer format of each date field from a sample of rows
+
+    @param fields: list of field names for the dataset
+    @param headers: dict of field name -> column number (sourcefile.map_headers)
+    @param rows: list of rows (sample)
+    @returns: dict of field name -> str format or None
+    """
+    formats = {}
+    for field in fields:
+        if field in DATE_FIELDS:
+            col = headers[field]
+            values = [row[col] for row in rows if len(row) > col]
+            formats[field] = infer_format(values)
+            logging.debug('%s format %s' % (field, formats[field]))
+    return formats
+
+
+class DateNormalizer():
+    """Parses dates in one format with fallback to dateutil, memoized
+    """
+
+    def __init__(self, fmt=None, cache_size=CACHE_SIZE):
+        self.fmt = fmt
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, value):
+        """
+        @param value: str
+        @returns: datetime.date or None if unparseable
+        """
+        if self.fmt:
+            date = _strptime(value, self.fmt)
+            if date:
+                return date
+        from dateutil import parser as dateparser
+        try:
+            return dateparser.parse(value).date()
+        except (ValueError, OverflowError):
+            return None
+
+    def isoformat(self, value):
+        """
+        >>> DateNormalizer('%m/%d/%Y').isoformat('12/25/1944')
+        '1944-12-25'
+
+        @param value: str
+        @returns: str ISO date or None if unparseable
+        """
+        date = self.parse(value)
+        if date:
+            return date.isoformat()
+        return None
+
+
+NORMALIZERS = {}
+
+def normalizer(fmt=None):
+    """Get the (per-process) DateNormalizer for format
+
+    @param fmt: str strptime format or None
+    @returns: DateNormalizer
+    """
+    if fmt not in NORMALIZERS:
+        NORMALIZERS[fmt] = DateNormalizer(fmt)
+    return NORMALIZERS[fmt]
+
+def normalize_rowd(rowd, formats):
+    """Replace date strings in rowd with ISO dates (yyyy-mm-dd)
+
+    ISO strings are what Elasticsearch expects, and unlike date objects
+    they are included in Record.fulltext.
+    Unparseable values are left as-is; models.Record.from_dict reports
+    them in Record.errors and leaves them out of the record.
+
+    @param rowd: dict
+    @param formats: dict of field name -> format (see infer_formats)
+    @returns: dict
+    """
+    for field,fmt in formats.items():
+        value = rowd.get(field)
+        if value:
+            date = normalizer(fmt).isoformat(value)
+            if date:
+                rowd[field] = date
+    return rowd
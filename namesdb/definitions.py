@@ -55,6 +55,7 @@ FIELD_DEFINITIONS['m_dataset'] = {
     'type': 'string',
     'required': True,
     'display': True,
+    'cardinality': 'low',
     'sample': 'far-ancestry',
     'notes': 'far-ancestry|far-poston|far-minidoka|far-manzanar|wra',
     'choices': OrderedDict([
@@ -80,6 +81,7 @@ FIELD_DEFINITIONS['m_camp'] = {
     'type': 'string',
     'required': True,
     'display': True,
+    'cardinality': 'low',
     'sample': '2-poston',
     'choices': OrderedDict([
         ('1-topaz', 'Topaz'),
@@ -119,6 +121,7 @@ FIELD_DEFINITIONS['m_birthyear'] = {
     'type': 'number',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '1921',
     'notes': '',
 }
@@ -128,6 +131,7 @@ FIELD_DEFINITIONS['m_gender'] = {
     'type': 'string',
     'required': True,
     'display': True,
+    'cardinality': 'low',
     'sample': 'M',
     'choices': OrderedDict([
         ('F', 'Female'),
@@ -141,6 +145,7 @@ FIELD_DEFINITIONS['m_originalstate'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': 'UT',
     'choices': OrderedDict([]),
     'notes': "Use two-digit code for US states. Not included in far-ancestry data",
@@ -224,6 +229,7 @@ FIELD_DEFINITIONS['f_maritalstatus'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': '',
 }
@@ -233,6 +239,7 @@ FIELD_DEFINITIONS['f_citizenship'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': '',
 }
@@ -251,6 +258,7 @@ FIELD_DEFINITIONS['f_entrytype'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': '',
 }
@@ -269,6 +277,7 @@ FIELD_DEFINITIONS['f_departuretype'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': '',
 }
@@ -287,6 +296,7 @@ FIELD_DEFINITIONS['f_destinationstate'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': '',
 }
@@ -324,6 +334,7 @@ FIELD_DEFINITIONS['w_assemblycenter'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': 'Original: Assem Center',
 }
@@ -342,6 +353,7 @@ FIELD_DEFINITIONS['w_birthcountry'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original:Birth Country",
 }
@@ -387,6 +399,7 @@ FIELD_DEFINITIONS['w_schooldegree'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: School Degree",
 }
@@ -432,6 +445,7 @@ FIELD_DEFINITIONS['w_militaryservice'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Military, etc#",
 }
@@ -441,6 +455,7 @@ FIELD_DEFINITIONS['w_maritalstatus'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Sex & Marital",
 }
@@ -450,6 +465,7 @@ FIELD_DEFINITIONS['w_ethnicity'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Race",
 }
@@ -459,6 +475,7 @@ FIELD_DEFINITIONS['w_birthplace'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Birthplace",
 }
@@ -477,6 +494,7 @@ FIELD_DEFINITIONS['w_highestgrade'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Highest Grade",
 }
@@ -486,6 +504,7 @@ FIELD_DEFINITIONS['w_language'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Language",
 }
@@ -495,6 +514,7 @@ FIELD_DEFINITIONS['w_religion'] = {
     'type': 'string',
     'required': False,
     'display': True,
+    'cardinality': 'low',
     'sample': '',
     'notes': "Original: Religion",
 }
@@ -557,6 +577,11 @@ FIELD_DEFINITIONS_NAMES_STRINGS = [
     key for key,item in FIELD_DEFINITIONS.items()
     if item['type'] == 'string'
 ]
+# Fields with few distinct values; see models.RecordRow
+FIELDS_LOW_CARDINALITY = [
+    key for key,item in FIELD_DEFINITIONS.items()
+    if item.get('cardinality') == 'low'
+]
 SEARCH_FIELDS = [
     'm_dataset', 'm_pseudoid', 'm_camp', 'm_lastname', 'm_firstname', 'm_gender',
     'm_birthyear', 'm_originalstate', 'm_familyno', 'm_individualno',
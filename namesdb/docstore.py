@@ -1,27 +1,191 @@
 import logging
 logger = logging.getLogger(__name__)
+import random
 from ssl import create_default_context
+import threading
+import time
 
-from elasticsearch import Elasticsearch, TransportError
+from elasticsearch import Elasticsearch, Transport, TransportError
+from elasticsearch import ConnectionError as ESConnectionError
+from elasticsearch.serializer import JSONSerializer
 import elasticsearch_dsl
 
 from elastictools import docstore
+from .config import DOCSTORE_TIMEOUT, DOCSTORE_TIMEOUTS
+from .config import POOL_SIZE, RETRIES
 from . import models
 
-DOCSTORE_TIMEOUT = 5
-INDEX_PREFIX = 'namesdb'
+# orjson is optional; falls back to the standard json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+RETRY_BACKOFF = 0.5       # seconds, doubled on each retry
+RETRY_BACKOFF_MAX = 30
+RETRY_STATUSES = [429, 502, 503, 504]
+
+# Seconds spent deserializing the last response in this thread
+# (TIMINGS.loads), see publish.search --profile.
+TIMINGS = threading.local()
+
+# Record indices are made by Docstore.create_indices from generated
+# mappings (see models.record_mapping), not from the Record class.
 ELASTICSEARCH_CLASSES = {
     'all': [
-        {'doctype': 'record', 'class': models.Record},
+        {'doctype': 'family', 'class': models.Family},
+        {'doctype': 'stats', 'class': models.DatasetStats},
     ]
 }
 
 ELASTICSEARCH_CLASSES_BY_MODEL = {
     'record': models.Record,
+    'family': models.Family,
+    'stats': models.DatasetStats,
 }
 
 
+def make_hosts(text, pool_size=None):
+    """List of host dicts from comma-separated host:port list
+    
+    >>> make_hosts('es1:9200,es2:9200', pool_size=4)
+    [{'host': 'es1', 'port': '9200', 'maxsize': 4}, {'host': 'es2', 'port': '9200', 'maxsize': 4}]
+    
+    @param text: str
+    @param pool_size: int Connections per host
+    @returns: list of dicts
+    """
+    hosts = []
+    for host in text.split(','):
+        h,p = host.split(':')
+        host = {'host':h, 'port':p}
+        if pool_size:
+            host['maxsize'] = pool_size
+        hosts.append(host)
+    return hosts
+
+def operation(method, url):
+    """Classify request for timeouts
+    
+    >>> operation('POST', '/namesdbrecord/_bulk')
+    'bulk'
+    >>> operation('GET', '/namesdbrecord/_doc/far-manzanar:abc')
+    'get'
+    
+    @param method: str
+    @param url: str
+    @returns: str key in DOCSTORE_TIMEOUTS
+    """
+    if '_bulk' in url:
+        return 'bulk'
+    if ('_search' in url) or ('_count' in url) or ('_msearch' in url):
+        return 'search'
+    if ('_delete_by_query' in url) or (method == 'DELETE'):
+        return 'delete'
+    if ('_mget' in url) or ((method in ['GET','HEAD']) and ('/_doc/' in url)):
+        return 'get'
+    if (url == '/') or any(
+            part in url for part in ['_stats', '_cluster', '_nodes', '_cat', '_tasks']
+    ):
+        return 'status'
+    return 'index'
+
+
+class RetryTransport(Transport):
+    """Transport with per-operation timeouts and retries with backoff
+    
+    Retries requests that fail with RETRY_STATUSES (e.g. 429 Too Many
+    Requests from a busy cluster) or connection errors, waiting
+    exponentially longer (with jitter) between attempts.
+    """
+    
+    def __init__(self, hosts, timeouts=None, retries=RETRIES,
+                 backoff=RETRY_BACKOFF, **kwargs):
+        self.timeouts = dict(DOCSTORE_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.retries = retries
+        self.backoff = backoff
+        # retries are done here, not in Transport
+        kwargs['max_retries'] = 0
+        super(RetryTransport,self).__init__(hosts, **kwargs)
+    
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        params = dict(params or {})
+        if 'request_timeout' not in params:
+            params['request_timeout'] = self.timeouts.get(
+                operation(method, url), DOCSTORE_TIMEOUT
+            )
+        attempt = 0
+        while True:
+            try:
+                return super(RetryTransport,self).perform_request(
+                    method, url, headers=headers, params=dict(params), body=body
+                )
+            except TransportError as err:
+                retryable = isinstance(err, ESConnectionError) \
+                    or (err.status_code in RETRY_STATUSES)
+                if (not retryable) or (attempt >= self.retries):
+                    raise
+                wait = min(self.backoff * 2**attempt, RETRY_BACKOFF_MAX)
+                wait = wait * random.uniform(0.5, 1.0)
+                logging.warning('%s %s: %s (retry %s in %.1fs)' % (
+                    method, url, err.status_code, attempt+1, wait
+                ))
+                time.sleep(wait)
+                attempt += 1
+
+
+class FastJSONSerializer(JSONSerializer):
+    """Uses orjson if available
+    """
+    
+    def dumps(self, data):
+        if isinstance(data, str) or (orjson is None):
+            return super(FastJSONSerializer,self).dumps(data)
+        return orjson.dumps(data, default=self.default).decode('utf-8')
+    
+    def loads(self, s):
+        start = time.perf_counter()
+        if orjson is None:
+            data = super(FastJSONSerializer,self).loads(s)
+        else:
+            data = orjson.loads(s)
+        TIMINGS.loads = time.perf_counter() - start
+        return data
+
+
+def get_elasticsearch(settings):
+    """Elasticsearch client with transport options from settings
+    
+    Like elastictools.docstore.get_elasticsearch but also uses
+    settings.DOCSTORE_TIMEOUTS, DOCSTORE_POOL_SIZE, DOCSTORE_COMPRESS,
+    DOCSTORE_RETRIES if present.
+    
+    @param settings: cli.Settings
+    @returns: Elasticsearch
+    """
+    hosts = make_hosts(
+        settings.DOCSTORE_HOST, getattr(settings, 'DOCSTORE_POOL_SIZE', POOL_SIZE)
+    )
+    kwargs = {
+        'transport_class': RetryTransport,
+        'timeouts': getattr(settings, 'DOCSTORE_TIMEOUTS', DOCSTORE_TIMEOUTS),
+        'retries': getattr(settings, 'DOCSTORE_RETRIES', RETRIES),
+        'http_compress': getattr(settings, 'DOCSTORE_COMPRESS', True),
+        'serializer': FastJSONSerializer(),
+        'timeout': DOCSTORE_TIMEOUT,
+    }
+    if settings.DOCSTORE_SSL_CERTFILE and settings.DOCSTORE_PASSWORD:
+        context = create_default_context(cafile=settings.DOCSTORE_SSL_CERTFILE)
+        context.check_hostname = False
+        kwargs['scheme'] = 'https'
+        kwargs['ssl_context'] = context
+        kwargs['http_auth'] = (
+            settings.DOCSTORE_USERNAME, settings.DOCSTORE_PASSWORD
+        )
+    return Elasticsearch(hosts, **kwargs)
+
+
 class Docstore(docstore.DocstoreManager):
 
     def __init__(self, index_prefix, host, settings, connection=None):
@@ -30,10 +194,57 @@ class Docstore(docstore.DocstoreManager):
         if connection:
             self.es = connection
         else:
-            self.es = docstore.get_elasticsearch(settings)
+            self.es = get_elasticsearch(settings)
+
+    def status(self):
+        """Cluster, index, node and dataset status (see status.summarize)
+        
+        @returns: dict
+        """
+        from . import status
+        return status.summarize(status.fetch(status.status_requests(self)))
 
+    def record_index(self, family):
+        """Name of record index for dataset family (see models.RECORD_FAMILIES)
+        
+        index_name('record') is an alias for all the record indices;
+        search it, but write to the index of the record's dataset.
+        """
+        return self.index_name('record-%s' % family)
+    
+    def dataset_index(self, dataset):
+        """Name of record index that dataset's records are written to
+        """
+        return self.record_index(models.dataset_family(dataset))
+    
+    def record_id_index(self, _id):
+        """Name of record index containing record ID (dataset:pseudoid)
+        """
+        return self.dataset_index(_id.split(':')[0])
+    
     def create_indices(self):
+        alias = self.index_name('record')
+        if self.es.indices.exists(index=alias) \
+           and not self.es.indices.exists_alias(name=alias):
+            raise Exception(
+                'Index %s must be deleted before record indices can be ' \
+                'created with alias %s' % (alias, alias)
+            )
+        for family in models.RECORD_FAMILIES:
+            index = self.record_index(family)
+            if self.es.indices.exists(index=index):
+                logging.info('Index %s exists' % index)
+                continue
+            logging.info('Creating index %s' % index)
+            self.es.indices.create(index=index, body={
+                'mappings': models.record_mapping(family),
+                'aliases': {alias: {}},
+            })
         return super(Docstore,self).create_indices(ELASTICSEARCH_CLASSES['all'])
 
     def delete_indices(self):
+        for family in models.RECORD_FAMILIES:
+            index = self.record_index(family)
+            logging.info('Deleting index %s' % index)
+            self.es.indices.delete(index=index, ignore=404)
         return super(Docstore,self).delete_indices(ELASTICSEARCH_CLASSES['all'])
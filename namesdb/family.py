@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+"""Family (household) documents
+
+Records are grouped by dataset + m_familyno (and m_altfamilyid, if any)
+and each group is written as one Family document listing its members,
+so a household view is a single get (see "namesdb family").
+
+Grouping is done as records stream by.  If there are more members than
+fit in memory, groups are spilled to partition files on disk by hash of
+the family ID, and each partition is grouped separately afterwards
+(hash grouping with spill, as in a Grace hash join).
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+
+MAX_MEMBERS = 500000      # members held in memory before spilling
+PARTITIONS = 64
+
+# member fields, in order of the member tuples used below
+MEMBER_FIELDS = [
+    'id', 'm_pseudoid', 'm_lastname', 'm_firstname', 'm_birthyear',
+    'm_gender', 'm_individualno',
+]
+
+
+def family_id(dataset, familyno):
+    """
+    >>> family_id('wra-master', '12345')
+    'wra-master:12345'
+    """
+    return ':'.join([dataset, familyno])
+
+def record_families(record):
+    """IDs of families a record belongs to
+
+    @param record: models.RecordRow
+    @returns: list of str
+    """
+    dataset = record.get('m_dataset')
+    families = []
+    for field in ['m_familyno', 'm_altfamilyid']:
+        familyno = record.get(field)
+        if familyno and isinstance(familyno, str) and familyno.strip():
+            fid = family_id(dataset, familyno.strip())
+            if fid not in families:
+                families.append(fid)
+    return families
+
+def make_member(_id, record):
+    """Compact member tuple (see MEMBER_FIELDS)
+
+    @param _id: str Record ID
+    @param record: models.RecordRow
+    @returns: tuple
+    """
+    return (_id,) + tuple([record.get(field) for field in MEMBER_FIELDS[1:]])
+
+
+class FamilyGrouper():
+    """Group members by family, spilling to disk if there are too many
+
+    Usage:
+        grouper = FamilyGrouper()
+        for record in records:
+            grouper.add(record)
+        for fid,members in grouper.families():
+            ...
+    """
+
+    def __init__(self, max_members=MAX_MEMBERS, partitions=PARTITIONS,
+                 tmpdir=None):
+        self.max_members = max_members
+        self.partitions = partitions
+        self.tmpdir = tmpdir
+        self.groups = {}
+        self.members = 0
+        self.spilldir = None
+        self.spills = 0
+
+    def add(self, record):
+        """
+        @param record: models.RecordRow
+        """
+        families = record_families(record)
+        if not families:
+            return
+        # same as models.Record.make_id, without importing models
+        _id = ':'.join([record.get('m_dataset'), record.get('m_pseudoid')])
+        member = make_member(_id, record)
+        for fid in families:
+            self.groups.setdefault(fid, []).append(member)
+            self.members += 1
+        if self.members >= self.max_members:
+            self.spill()
+
+    def _partition_path(self, fid):
+        n = zlib.crc32(fid.encode('utf-8')) % self.partitions
+        return os.path.join(self.spilldir, '%03d' % n)
+
+    def spill(self):
+        """Append in-memory groups to partition files
+        """
+        if not self.groups:
+            return
+        if not self.spilldir:
+            self.spilldir = tempfile.mkdtemp(prefix='namesdb-family-', dir=self.tmpdir)
+        by_path = {}
+        for fid,members in self.groups.items():
+            by_path.setdefault(self._partition_path(fid), []).append((fid, members))
+        for path,groups in by_path.items():
+            with open(path, 'ab') as f:
+                pickle.dump(groups, f, protocol=pickle.HIGHEST_PROTOCOL)
+        logging.debug('Spilled %s families (%s members)' % (
+            len(self.groups), self.members
+        ))
+        self.spills += 1
+        self.groups = {}
+        self.members = 0
+
+    def _read_partition(self, path):
+        groups = {}
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+                for fid,members in chunk:
+                    groups.setdefault(fid, []).extend(members)
+        return groups
+
+    def families(self):
+        """Yield (family_id, members) for every family, in no particular order
+
+        Temporary files are removed when done.
+        @returns: generator of (str, list of member tuples)
+        """
+        if not self.spilldir:
+            for fid,members in self.groups.items():
+                yield fid,members
+            self.groups = {}
+            return
+        self.spill()
+        try:
+            for name in sorted(os.listdir(self.spilldir)):
+                groups = self._read_partition(os.path.join(self.spilldir, name))
+                for fid,members in groups.items():
+                    yield fid,members
+        finally:
+            shutil.rmtree(self.spilldir, ignore_errors=True)
+            self.spilldir = None
+
+
+def _member_order(member):
+    individualno = member[MEMBER_FIELDS.index('m_individualno')] or ''
+    birthyear = member[MEMBER_FIELDS.index('m_birthyear')] or ''
+    return (individualno, birthyear, member[0])
+
+def family_source(fid, members):
+    """Family document _source (see models.Family)
+
+    @param fid: str Family ID (see family_id)
+    @param members: list of member tuples
+    @returns: dict
+    """
+    dataset,familyno = fid.split(':', 1)
+    members = sorted(set(members), key=_member_order)
+    return {
+        'm_dataset': dataset,
+        'm_familyno': familyno,
+        'member_ids': [member[0] for member in members],
+        'member_count': len(members),
+        'members': [
+            {field: value for field,value in zip(MEMBER_FIELDS, member) if value}
+            for member in members
+        ],
+    }
+
+def family_actions(indexname, grouper):
+    """Bulk (action, source) pairs for families
+
+    @param indexname: str
+    @param grouper: FamilyGrouper
+    @returns: generator of (dict, dict)
+    """
+    for fid,members in grouper.families():
+        yield (
+            {'index': {'_index': indexname, '_id': fid}},
+            family_source(fid, members),
+        )
+
+def format_family(source):
+    """Lines describing family document
+
+    @param source: dict (see family_source)
+    @returns: list of str
+    """
+    lines = ['%s:%s (%s members)' % (
+        source['m_dataset'], source['m_familyno'], source['member_count']
+    )]
+    for member in source['members']:
+        lines.append('  %-4s %-20s %-20s %-5s %-2s %s' % (
+            member.get('m_individualno', ''), member.get('m_lastname', ''),
+            member.get('m_firstname', ''), member.get('m_birthyear', ''),
+            member.get('m_gender', ''), member.get('id'),
+        ))
+    return lines
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""Link records of the same person across datasets
+
+Comparing every record with every other record is quadratic, so records
+are first grouped into blocks that likely matches share:
+
+- normalized lastname + birthyear (+/- 1 year)
+- normalized lastname + camp
+- camp + WRA family number
+
+Pairs are only scored within blocks, blocks are scored by a pool of
+worker processes, and pairs that score above a threshold are merged into
+clusters.  Every record in a cluster gets the same m_linkid, so searches
+can collapse on that field.  See publish.link_records.
+"""
+
+from difflib import SequenceMatcher
+import logging
+logger = logging.getLogger(__name__)
+import multiprocessing
+
+from .names import normalize_name
+
+THRESHOLD = 0.75
+MAX_BLOCK_SIZE = 1000   # skip blocks bigger than this (e.g. blank names)
+
+# fields needed from each record, in order of the tuples used below
+LINK_FIELDS = [
+    'm_dataset', 'm_lastname', 'm_firstname', 'm_birthyear', 'm_gender',
+    'm_camp', 'm_familyno',
+]
+ID,DATASET,LASTNAME,FIRSTNAME,BIRTHYEAR,GENDER,CAMP,FAMILYNO = range(8)
+
+
+def make_linkrecord(_id, source):
+    """Compact tuple of normalized LINK_FIELDS values
+
+    @param _id: str Document ID
+    @param source: dict Document _source
+    @returns: tuple
+    """
+    year = source.get('m_birthyear') or ''
+    return (
+        _id,
+        source.get('m_dataset') or '',
+        normalize_name(source.get('m_lastname')),
+        normalize_name(source.get('m_firstname')),
+        int(year) if year.isdigit() else None,
+        (source.get('m_gender') or '').upper(),
+        source.get('m_camp') or '',
+        source.get('m_familyno') or '',
+    )
+
+def blocking_keys(rec):
+    """Keys of the blocks a record belongs to
+
+    A record born in year Y is put in the Y and Y+1 lastname-year blocks,
+    so records born a year apart always share one.
+
+    @param rec: tuple (see make_linkrecord)
+    @returns: list of tuples
+    """
+    keys = []
+    if rec[LASTNAME]:
+        if rec[BIRTHYEAR]:
+            keys.append(('ly', rec[LASTNAME], rec[BIRTHYEAR]))
+            keys.append(('ly', rec[LASTNAME], rec[BIRTHYEAR] + 1))
+        if rec[CAMP]:
+            keys.append(('lc', rec[LASTNAME], rec[CAMP]))
+    if rec[CAMP] and rec[FAMILYNO]:
+        keys.append(('fn', rec[CAMP], rec[FAMILYNO]))
+    return keys
+
+def make_blocks(records):
+    """Group records by blocking key
+
+    @param records: iterable of tuples (see make_linkrecord)
+    @returns: (blocks, skipped) list of lists of tuples, int oversize blocks
+    """
+    index = {}
+    for rec in records:
+        for key in blocking_keys(rec):
+            index.setdefault(key, []).append(rec)
+    blocks = []
+    skipped = 0
+    for key,block in index.items():
+        if len(block) > MAX_BLOCK_SIZE:
+            skipped += 1
+        elif len(block) > 1:
+            blocks.append(block)
+    return blocks,skipped
+
+def score(a, b):
+    """Score likelihood that two records are the same person
+
+    @param a: tuple (see make_linkrecord)
+    @param b: tuple
+    @returns: float 0.0 - 1.0
+    """
+    if a[GENDER] and b[GENDER] and (a[GENDER] != b[GENDER]):
+        return 0.0
+    if a[BIRTHYEAR] and b[BIRTHYEAR] and (abs(a[BIRTHYEAR] - b[BIRTHYEAR]) > 1):
+        return 0.0
+    total = 0.0
+    total += 0.25 * SequenceMatcher(None, a[LASTNAME], b[LASTNAME]).ratio()
+    total += 0.35 * SequenceMatcher(None, a[FIRSTNAME], b[FIRSTNAME]).ratio()
+    if a[BIRTHYEAR] and b[BIRTHYEAR]:
+        if a[BIRTHYEAR] == b[BIRTHYEAR]:
+            total += 0.2
+        else:
+            total += 0.1
+    if a[GENDER] and (a[GENDER] == b[GENDER]):
+        total += 0.05
+    if a[CAMP] and (a[CAMP] == b[CAMP]):
+        total += 0.1
+        if a[FAMILYNO] and (a[FAMILYNO] == b[FAMILYNO]):
+            total += 0.05
+    return total
+
+def score_block(block, threshold=THRESHOLD):
+    """Pairs in block from different datasets that score >= threshold
+
+    Runs in worker processes.
+
+    @param block: list of tuples (see make_linkrecord)
+    @param threshold: float
+    @returns: list of (id, id, score)
+    """
+    pairs = []
+    for i,a in enumerate(block):
+        for b in block[i+1:]:
+            if a[DATASET] == b[DATASET]:
+                continue
+            s = score(a, b)
+            if s >= threshold:
+                pairs.append((min(a[ID], b[ID]), max(a[ID], b[ID]), s))
+    return pairs
+
+def _score_block(args):
+    return score_block(*args)
+
+def find_pairs(blocks, threshold=THRESHOLD, processes=None):
+    """Score all blocks using a pool of worker processes
+
+    @param blocks: list of lists of tuples
+    @param threshold: float
+    @param processes: int Number of worker processes (default: all CPUs)
+    @returns: dict of (id, id) -> score
+    """
+    pairs = {}
+    with multiprocessing.Pool(processes) as pool:
+        args = ((block, threshold) for block in blocks)
+        for results in pool.imap_unordered(_score_block, args, chunksize=100):
+            for a,b,s in results:
+                pairs[(a,b)] = s
+    return pairs
+
+def clusters(ids, pairs):
+    """Merge linked pairs into clusters (union-find)
+
+    Each cluster's linkid is the smallest ID in it, so results don't
+    depend on the order in which pairs were found.
+
+    >>> clusters(['a','b','c','d'], [('b','c'), ('c','d')])
+    {'a': 'a', 'b': 'b', 'c': 'b', 'd': 'b'}
+
+    @param ids: iterable of all record IDs
+    @param pairs: iterable of (id, id)
+    @returns: dict of id -> linkid
+    """
+    parent = {_id: _id for _id in ids}
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for a,b in pairs:
+        ra,rb = find(a),find(b)
+        if ra != rb:
+            parent[max(ra,rb)] = min(ra,rb)
+    return {_id: find(_id) for _id in parent}
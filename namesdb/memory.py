@@ -0,0 +1,665 @@
+# -*- coding: utf-8 -*-
+
+"""In-memory stand-in for an Elasticsearch client
+
+Holds documents in dicts and answers the subset of the Elasticsearch
+API that namesdb uses, so the namesdb code paths (import, search,
+linking, families, deletes) can be run, tested, and timed without a
+cluster (see benchmark):
+
+- index, get, mget, delete, bulk (index/create/update/delete actions);
+  bulk rejects documents whose values for date fields in the index's
+  mappings are not dates, with mapper_parsing_exception
+- search: match, multi_match, term, terms, ids, bool, match_all, sort,
+  collapse, from/size, _source filtering, terms aggregations, scroll
+- delete_by_query (always completes at once; tasks.get reports it)
+- indices.create/exists/delete/exists_alias/put_alias, with aliases
+
+Relevance scores are crude and no analysis beyond lowercasing and
+splitting on whitespace is done; it is not a substitute for testing
+against Elasticsearch.
+
+Latency can be injected per operation (the keys of
+config.DOCSTORE_TIMEOUTS: search, get, bulk, index, delete, status),
+plus a cost per document in bulk requests, so pipelines can be
+benchmarked against a cluster of known, repeatable speed.
+
+Usage:
+    es = MemoryElasticsearch(latency={'search': 0.005}, doc_latency=0.0001)
+    ds = docstore.Docstore(INDEX_PREFIX, 'memory', settings, connection=es)
+    ds.create_indices()
+"""
+
+from collections import Counter
+from datetime import datetime
+import fnmatch
+import itertools
+import json
+import logging
+logger = logging.getLogger(__name__)
+import threading
+import time
+
+# elasticsearch is optional here so tests can run without it
+try:
+    from elasticsearch.exceptions import NotFoundError
+except ImportError:
+    class NotFoundError(Exception):
+        pass
+
+
+class MemorySerializer():
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        return json.dumps(data, default=str)
+
+    def loads(self, s):
+        return json.loads(s)
+
+class MemoryTransport():
+    serializer = MemorySerializer()
+
+
+def _values(source, field):
+    value = source.get(field)
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def _words(value):
+    return str(value).lower().split()
+
+def _match(query, source, _id=None):
+    """Score of source document for query, or 0 if it doesn't match
+
+    @param query: dict Elasticsearch query DSL
+    @param source: dict
+    @param _id: str Document ID (for ids queries)
+    @returns: float
+    """
+    if not query or ('match_all' in query):
+        return 1.0
+    if 'multi_match' in query:
+        args = query['multi_match']
+        terms = set(_words(args['query']))
+        score = 0.0
+        for field in args.get('fields', source.keys()):
+            for value in _values(source, field):
+                score += len(terms.intersection(_words(value)))
+        return score
+    if 'match' in query:
+        field,value = list(query['match'].items())[0]
+        if isinstance(value, dict):
+            value = value['query']
+        terms = set(_words(value))
+        return float(sum([
+            len(terms.intersection(_words(v))) for v in _values(source, field)
+        ]))
+    if 'term' in query:
+        field,value = list(query['term'].items())[0]
+        boost = 1.0
+        if isinstance(value, dict):
+            boost = value.get('boost', 1.0)
+            value = value['value']
+        if value in _values(source, field):
+            return boost
+        return 0.0
+    if 'terms' in query:
+        field,values = list(query['terms'].items())[0]
+        if set(values).intersection(_values(source, field)):
+            return 1.0
+        return 0.0
+    if 'ids' in query:
+        return 1.0 if _id in query['ids']['values'] else 0.0
+    if 'bool' in query:
+        args = query['bool']
+        score = 0.0
+        for q in _list(args.get('must')) + _list(args.get('filter')):
+            s = _match(q, source, _id)
+            if not s:
+                return 0.0
+            score += s
+        for q in _list(args.get('must_not')):
+            if _match(q, source, _id):
+                return 0.0
+        should = _list(args.get('should'))
+        if should:
+            matched = [s for s in [_match(q, source, _id) for q in should] if s]
+            minimum = args.get('minimum_should_match', 0 if args.get('must') else 1)
+            if len(matched) < minimum:
+                return 0.0
+            score += sum(matched)
+        return score or 1.0
+    raise NotImplementedError('MemoryElasticsearch query: %s' % list(query.keys()))
+
+def _list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def _sort(hits, sort):
+    """Sort list of (score, _id, source, index) by sort spec
+
+    @param hits: list
+    @param sort: list of field names or {field: {'order': ...}} dicts
+    """
+    # stable sorts, least significant field first
+    for item in reversed(sort):
+        if isinstance(item, dict):
+            field,order = list(item.items())[0]
+            if isinstance(order, dict):
+                order = order.get('order', 'asc')
+        else:
+            field,order = item,('desc' if item == '_score' else 'asc')
+        if field == '_score':
+            key = lambda hit: hit[0]
+        elif field == '_doc':
+            continue
+        else:
+            key = lambda hit: str((_values(hit[2], field) or [''])[0])
+        hits.sort(key=key, reverse=(order == 'desc'))
+
+def _filter_source(source, includes):
+    if includes is None or includes is True:
+        return dict(source)
+    if includes is False:
+        return {}
+    if isinstance(includes, dict):
+        includes = includes.get('includes', [])
+    if isinstance(includes, str):
+        includes = includes.split(',')
+    return {k: v for k,v in source.items() if k in includes}
+
+def _aggregations(aggs, hits):
+    """Terms aggregations over matching documents
+
+    @param aggs: dict name -> {'terms': {'field': ..., 'size': ...}}
+    @param hits: list of (score, _id, source, index)
+    @returns: dict
+    """
+    results = {}
+    for name,agg in aggs.items():
+        if 'terms' not in agg:
+            raise NotImplementedError('MemoryElasticsearch aggregation: %s' % list(agg.keys()))
+        args = agg['terms']
+        counts = Counter()
+        for hit in hits:
+            for value in _values(hit[2], args['field']):
+                counts[value] += 1
+        buckets = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+        size = args.get('size', 10)
+        results[name] = {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': sum([count for value,count in buckets[size:]]),
+            'buckets': [
+                {'key': value, 'doc_count': count} for value,count in buckets[:size]
+            ],
+        }
+    return results
+
+def _ignored(ignore, status):
+    return status in _list(ignore)
+
+def _is_date(value):
+    """
+    >>> [_is_date('1944-12-25'), _is_date('1944-12-25T10:00:00Z'), _is_date('12/25/1944')]
+    [True, True, False]
+    """
+    if isinstance(value, int):
+        return True
+    try:
+        datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return False
+    return True
+
+def _mapping_error(mappings, _id, source):
+    """Error for a document that doesn't fit the index mappings
+
+    Only date fields are checked.
+
+    @param mappings: dict Index mappings (see MemoryIndices.create)
+    @param _id: str
+    @param source: dict
+    @returns: dict error or None
+    """
+    properties = mappings.get('properties', {})
+    for field,value in source.items():
+        if properties.get(field, {}).get('type') != 'date':
+            continue
+        for v in _list(value):
+            if not _is_date(v):
+                return {
+                    'type': 'mapper_parsing_exception',
+                    'reason': "failed to parse field [%s] of type [date] in " \
+                    "document with id '%s'. Preview of field's value: '%s'" % (
+                        field, _id, v
+                    ),
+                }
+    return None
+
+# search body parts that newer clients (and elasticsearch_dsl with them)
+# pass as keyword arguments instead of in body
+BODY_PARAMS = [
+    'query', 'aggs', 'aggregations', 'sort', 'collapse', 'from_', 'size',
+    '_source',
+]
+
+def _body(body, kwargs):
+    """Search body including parts passed as keyword arguments
+    """
+    body = dict(body or {})
+    for key in BODY_PARAMS:
+        if kwargs.get(key) is not None:
+            body.setdefault(key.rstrip('_'), kwargs[key])
+    return body
+
+
+class MemoryIndices(dict):
+    """Index name -> {_id: source}, plus the indices API
+
+    Also used as es.indices, like elasticsearch.client.IndicesClient.
+    """
+
+    def __init__(self):
+        super(MemoryIndices,self).__init__()
+        self.aliases = {}
+        self.settings = {}
+
+    def resolve(self, index):
+        """Names of indices matching index name, alias, or pattern
+
+        @param index: str Comma-separated names, aliases, or wildcards, or list
+        @returns: list of str
+        """
+        if isinstance(index, (list, tuple)):
+            index = ','.join(index)
+        names = []
+        for part in (index or '*').split(','):
+            if part in self:
+                matches = [part]
+            elif part in self.aliases:
+                matches = self.aliases[part]
+            else:
+                matches = fnmatch.filter(self.keys(), part)
+            names += [name for name in matches if name not in names]
+        return names
+
+    def write_index(self, index):
+        """Index to write to, creating it if necessary
+
+        @param index: str Index name or alias of one index
+        @returns: str
+        """
+        if index in self.aliases:
+            if len(self.aliases[index]) != 1:
+                raise Exception('Alias %s has more than one index' % index)
+            return self.aliases[index][0]
+        self.setdefault(index, {})
+        return index
+
+    def create(self, index, body=None, **kwargs):
+        if index in self or index in self.aliases:
+            if _ignored(kwargs.get('ignore'), 400):
+                return {'acknowledged': False}
+            raise Exception('resource_already_exists_exception: %s' % index)
+        self[index] = {}
+        self.settings[index] = body or {}
+        for alias in (body or {}).get('aliases', {}).keys():
+            self.put_alias(index, alias)
+        return {'acknowledged': True, 'index': index}
+
+    def exists(self, index, **kwargs):
+        return all([bool(self.resolve(part)) for part in index.split(',')])
+
+    def exists_alias(self, name, index=None, **kwargs):
+        return name in self.aliases
+
+    def put_alias(self, index, name, **kwargs):
+        for concrete in self.resolve(index):
+            names = self.aliases.setdefault(name, [])
+            if concrete not in names:
+                names.append(concrete)
+        return {'acknowledged': True}
+
+    def delete(self, index, **kwargs):
+        names = [name for name in self.resolve(index) if name in self]
+        if not names:
+            if _ignored(kwargs.get('ignore'), 404):
+                return {'acknowledged': False}
+            raise NotFoundError(404, 'index_not_found_exception', {'index': index})
+        for name in names:
+            self.pop(name)
+            self.settings.pop(name, None)
+            for alias,indices in list(self.aliases.items()):
+                if name in indices:
+                    indices.remove(name)
+                if not indices:
+                    self.aliases.pop(alias)
+        return {'acknowledged': True}
+
+    def refresh(self, index=None, **kwargs):
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+
+class MemoryTasks():
+    """Completed delete_by_query tasks (see MemoryElasticsearch.delete_by_query)
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def get(self, task_id, **kwargs):
+        if task_id not in self.tasks:
+            raise NotFoundError(404, 'resource_not_found_exception', {'task': task_id})
+        return self.tasks[task_id]
+
+
+class MemoryElasticsearch():
+    """Minimal Elasticsearch client that keeps documents in memory
+
+    @param latency: dict operation -> seconds added to each request
+    @param doc_latency: float Seconds added per document in bulk requests
+    """
+    transport = MemoryTransport()
+
+    def __init__(self, latency=None, doc_latency=0.0):
+        self.indices = MemoryIndices()
+        self.tasks = MemoryTasks()
+        self.latency = dict(latency or {})
+        self.doc_latency = doc_latency
+        self.requests = Counter()
+        self.scrolls = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _request(self, operation, docs=0):
+        """Count request and sleep for injected latency
+        """
+        self.requests[operation] += 1
+        seconds = self.latency.get(operation, 0.0) + self.doc_latency * docs
+        if seconds:
+            time.sleep(seconds)
+
+    def load(self, index, records):
+        """Add documents to index (no latency)
+
+        @param index: str Index name or alias
+        @param records: iterable of models.Record or models.RecordRow
+        @returns: int number of documents
+        """
+        docs = self.indices[self.indices.write_index(index)]
+        n = 0
+        for record in records:
+            if hasattr(record, 'to_record'):
+                record = record.to_record()
+            docs[record.meta.id] = json.loads(json.dumps(record.to_dict(), default=str))
+            n += 1
+        return n
+
+    def ping(self, **kwargs):
+        return True
+
+    def info(self, **kwargs):
+        self._request('status')
+        return {'name': 'memory', 'version': {'number': '7.17.0'}}
+
+    # documents --------------------------------------------------------
+
+    def _get(self, index, _id):
+        """
+        @returns: (index name, source) or (None, None)
+        """
+        for name in self.indices.resolve(index):
+            source = self.indices.get(name, {}).get(_id)
+            if source is not None:
+                return name,source
+        return None,None
+
+    def index(self, index, body, id=None, **kwargs):
+        self._request('index', 1)
+        with self.lock:
+            name = self.indices.write_index(index)
+            if id is None:
+                id = str(next(self._ids))
+            result = 'updated' if id in self.indices[name] else 'created'
+            self.indices[name][id] = json.loads(json.dumps(body, default=str))
+        return {'_index': name, '_id': id, 'result': result}
+
+    def get(self, index, id, _source=None, **kwargs):
+        self._request('get')
+        name,source = self._get(index, id)
+        if source is None:
+            if _ignored(kwargs.get('ignore'), 404):
+                return {'_index': index, '_id': id, 'found': False}
+            raise NotFoundError(404, 'not_found', {'_index': index, '_id': id})
+        return {
+            '_index': name, '_type': '_doc', '_id': id, 'found': True,
+            '_source': _filter_source(source, _source),
+        }
+
+    def exists(self, index, id, **kwargs):
+        self._request('get')
+        return self._get(index, id)[1] is not None
+
+    def mget(self, body, index=None, _source=None, **kwargs):
+        self._request('get')
+        if 'ids' in body:
+            requests = [(index, _id) for _id in body['ids']]
+        else:
+            requests = [
+                (doc.get('_index', index), doc['_id']) for doc in body['docs']
+            ]
+        docs = []
+        for doc_index,_id in requests:
+            name,source = self._get(doc_index, _id)
+            if source is None:
+                docs.append({'_index': doc_index, '_id': _id, 'found': False})
+            else:
+                docs.append({
+                    '_index': name, '_type': '_doc', '_id': _id, 'found': True,
+                    '_source': _filter_source(source, _source),
+                })
+        return {'docs': docs}
+
+    def delete(self, index, id, **kwargs):
+        self._request('delete')
+        with self.lock:
+            name,source = self._get(index, id)
+            if source is None:
+                if _ignored(kwargs.get('ignore'), 404):
+                    return {'_index': index, '_id': id, 'result': 'not_found'}
+                raise NotFoundError(404, 'not_found', {'_index': index, '_id': id})
+            self.indices[name].pop(id)
+        return {'_index': name, '_id': id, 'result': 'deleted'}
+
+    def _bulk_item(self, op, meta, source, index):
+        """Apply one bulk action
+        @returns: dict item
+        """
+        name = self.indices.write_index(meta.get('_index', index))
+        _id = meta.get('_id')
+        docs = self.indices[name]
+        if op in ['index', 'create']:
+            if _id is None:
+                _id = str(next(self._ids))
+            if (op == 'create') and (_id in docs):
+                return {'_index': name, '_id': _id, 'status': 409,
+                        'error': {'type': 'version_conflict_engine_exception'}}
+            error = _mapping_error(
+                self.indices.settings.get(name, {}).get('mappings', {}), _id, source
+            )
+            if error:
+                return {'_index': name, '_id': _id, 'status': 400, 'error': error}
+            status = 200 if _id in docs else 201
+            docs[_id] = source
+            return {'_index': name, '_id': _id, 'status': status}
+        if op == 'update':
+            if _id not in docs:
+                return {'_index': name, '_id': _id, 'status': 404,
+                        'error': {'type': 'document_missing_exception'}}
+            docs[_id].update(source['doc'])
+            return {'_index': name, '_id': _id, 'status': 200}
+        if op == 'delete':
+            if docs.pop(_id, None) is None:
+                return {'_index': name, '_id': _id, 'status': 404}
+            return {'_index': name, '_id': _id, 'status': 200}
+        raise NotImplementedError('MemoryElasticsearch bulk action: %s' % op)
+
+    def bulk(self, body, index=None, **kwargs):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        if not isinstance(body, str):
+            body = '\n'.join([self.transport.serializer.dumps(line) for line in body])
+        lines = iter([line for line in body.split('\n') if line.strip()])
+        actions = []
+        for line in lines:
+            action = json.loads(line)
+            op,meta = list(action.items())[0]
+            source = None if op == 'delete' else json.loads(next(lines))
+            actions.append((op, meta, source))
+        start = time.perf_counter()
+        self._request('bulk', len(actions))
+        items = []
+        with self.lock:
+            for op,meta,source in actions:
+                items.append({op: self._bulk_item(op, meta, source, index)})
+        return {
+            'took': int((time.perf_counter() - start) * 1000),
+            'errors': any([list(item.values())[0]['status'] >= 300 for item in items]),
+            'items': items,
+        }
+
+    # search -----------------------------------------------------------
+
+    def _hits(self, index, query):
+        """Matching (score, _id, source, index), in index order
+        """
+        hits = []
+        for name in self.indices.resolve(index):
+            for _id,source in list(self.indices.get(name, {}).items()):
+                score = _match(query, source, _id)
+                if score:
+                    hits.append((score, _id, source, name))
+        return hits
+
+    def search(self, body=None, index=None, scroll=None, **kwargs):
+        start = time.perf_counter()
+        self._request('search')
+        body = _body(body, kwargs)
+        hits = self._hits(index, body.get('query'))
+        aggregations = None
+        if body.get('aggs') or body.get('aggregations'):
+            aggregations = _aggregations(body.get('aggs') or body['aggregations'], hits)
+        _sort(hits, body.get('sort') or ['_score'])
+        if body.get('collapse'):
+            field = body['collapse']['field']
+            seen = set()
+            collapsed = []
+            for hit in hits:
+                value = (_values(hit[2], field) or [None])[0]
+                if value is None or value not in seen:
+                    seen.add(value)
+                    collapsed.append(hit)
+            hits = collapsed
+        total = len(hits)
+        offset = body.get('from') or 0
+        size = body.get('size')
+        if size is None:
+            size = 10
+        includes = body.get('_source')
+        if scroll:
+            scroll_id = 'scroll%s' % next(self._ids)
+            self.scrolls[scroll_id] = (hits[offset+size:], size, includes)
+        hits = hits[offset:offset+size]
+        response = {
+            'took': int((time.perf_counter() - start) * 1000),
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+            'hits': {
+                'total': {'value': total, 'relation': 'eq'},
+                'max_score': max([hit[0] for hit in hits], default=None),
+                'hits': self._format_hits(hits, includes),
+            },
+        }
+        if aggregations is not None:
+            response['aggregations'] = aggregations
+        if scroll:
+            response['_scroll_id'] = scroll_id
+        return response
+
+    def _format_hits(self, hits, includes):
+        return [
+            {
+                '_index': name,
+                '_type': '_doc',
+                '_id': _id,
+                '_score': score,
+                '_source': _filter_source(source, includes),
+            }
+            for score,_id,source,name in hits
+        ]
+
+    def scroll(self, scroll_id=None, body=None, **kwargs):
+        self._request('search')
+        if scroll_id is None:
+            scroll_id = body['scroll_id']
+        if scroll_id not in self.scrolls:
+            raise NotFoundError(404, 'search_context_missing_exception', scroll_id)
+        hits,size,includes = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (hits[size:], size, includes)
+        return {
+            '_scroll_id': scroll_id,
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+            'hits': {'hits': self._format_hits(hits[:size], includes)},
+        }
+
+    def clear_scroll(self, scroll_id=None, body=None, **kwargs):
+        if scroll_id is None:
+            scroll_id = (body or {}).get('scroll_id', [])
+        for _id in _list(scroll_id):
+            self.scrolls.pop(_id, None)
+        return {'succeeded': True}
+
+    def count(self, body=None, index=None, **kwargs):
+        self._request('search')
+        return {'count': len(self._hits(index, _body(body, kwargs).get('query')))}
+
+    def delete_by_query(self, index, body=None, wait_for_completion=True, **kwargs):
+        """Delete matching documents
+
+        Always done at once; with wait_for_completion=False a completed
+        task is returned (see MemoryTasks).
+        """
+        start = time.perf_counter()
+        with self.lock:
+            hits = self._hits(index, _body(body, kwargs).get('query'))
+            for score,_id,source,name in hits:
+                self.indices[name].pop(_id, None)
+        # latency outside the lock, like other requests
+        self._request('delete', len(hits))
+        elapsed = time.perf_counter() - start
+        response = {
+            'took': int(elapsed * 1000), 'timed_out': False,
+            'total': len(hits), 'deleted': len(hits), 'batches': 1,
+            'version_conflicts': 0, 'noops': 0, 'throttled_millis': 0,
+            'failures': [],
+        }
+        if wait_for_completion:
+            return response
+        task_id = 'memory:%s' % next(self._ids)
+        self.tasks.tasks[task_id] = {
+            'completed': True,
+            'task': {
+                'id': task_id, 'action': 'indices:data/write/delete/byquery',
+                'status': response, 'running_time_in_nanos': int(elapsed * 1e9),
+            },
+            'response': response,
+        }
+        return {'task': task_id}
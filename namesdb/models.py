@@ -6,32 +6,75 @@ import logging
 logger = logging.getLogger(__name__)
 import os
 import sys
+from sys import intern
 
 from elasticsearch.exceptions import NotFoundError
 import elasticsearch_dsl as dsl
 
+from . import dates
 from . import definitions
+from . import names
 
 DOC_TYPE = 'names-record'
+FAMILY_DOC_TYPE = 'names-family'
+STATS_DOC_TYPE = 'names-stats'
 
 
-def _hitvalue(hit, field):
-    """Extract list-wrapped values from their lists.
+def unwrap(value):
+    """Take values out of single-item lists
     
-    For some reason, Search hit objects wrap values in lists.
-    returns the value inside the list.
+    docvalue_fields and stored fields always come back as lists.
     
-    @param hit: Elasticsearch search hit object
-    @param field: str field name
-    @return: value
+    >>> [unwrap(['Yano']), unwrap(['a','b']), unwrap('Yano'), unwrap([])]
+    ['Yano', ['a', 'b'], 'Yano', []]
+    
+    @param value
+    @returns: value
+    """
+    if isinstance(value, list) and (len(value) == 1):
+        return value[0]
+    return value
+
+def hit_dict(hit):
+    """Field values from raw hit (_source and/or fields) plus 'id'
+    
+    @param hit: dict Raw hit from response['hits']['hits']
+    @returns: dict
+    """
+    data = {}
+    fields = hit.get('fields')
+    if fields:
+        for field,value in fields.items():
+            data[field] = unwrap(value)
+    source = hit.get('_source')
+    if source:
+        for field,value in source.items():
+            data[field] = unwrap(value)
+    data['id'] = hit['_id']
+    return data
+
+def dicts_from_hits(hits):
+    """Plain dicts from raw hits (see hit_dict)
+    
+    Reads the raw response instead of response.hits, which makes an
+    elasticsearch_dsl Document (setattr and coercion per field) per hit.
+    
+    @param hits: list Raw hits, response.to_dict()['hits']['hits']
+    @returns: list of dicts
     """
-    if hit.get(field) \
-       and isinstance(hit[field], list):
-        value = hit[field][0]
-    elif hit.get(field):
-        value = hit[field]
-    return None
+    return [hit_dict(hit) for hit in hits]
 
+def records_from_hits(hits):
+    """Records from raw hits (see Record.from_source)
+    
+    @param hits: list Raw hits, response.to_dict()['hits']['hits']
+    @returns: list of Records
+    """
+    records = []
+    for hit in hits:
+        data = hit_dict(hit)
+        records.append(Record.from_source(data.pop('id'), data))
+    return records
 
 class Record(dsl.Document):
     """FAR/WRA record model
@@ -48,6 +91,16 @@ class Record(dsl.Document):
     m_familyno = dsl.Keyword()
     m_individualno = dsl.Keyword()
     m_originalstate = dsl.Keyword()
+    m_altfamilyid = dsl.Keyword()
+    m_altindividualid = dsl.Keyword()
+    m_ddrreference = dsl.Keyword()
+    m_notes = dsl.Text()
+    m_linkid = dsl.Keyword()  # same person in other datasets, see link
+    # name match keys, see Record.assemble_namekeys()
+    m_lastname_norm = dsl.Keyword()
+    m_lastname_phon = dsl.Keyword()
+    m_firstname_norm = dsl.Keyword()
+    m_firstname_phon = dsl.Keyword()
     errors = dsl.Text()
     
     f_originalcity = dsl.Keyword()
@@ -97,6 +150,7 @@ class Record(dsl.Document):
     #    name = ???
     # We could define Index here but we don't because we want to be consistent
     # with ddr-local and ddr-public.
+    # Index mappings are generated per dataset family, see record_mapping().
     
     class Meta:
         doc_type = DOC_TYPE
@@ -130,36 +184,54 @@ class Record(dsl.Document):
         })
         record.errors = []
         for field in fieldnames:
-            if data.get(field):
-                try:
-                    setattr(record, field, data[field])
-                except dsl.exceptions.ValidationException:
-                    err = ':'.join([field, data[field]])
-                    record.errors.append(err)
+            value = data.get(field)
+            if not value:
+                continue
+            if field in dates.DATE_FIELDS:
+                # dsl.Date doesn't check values on setattr; bad dates
+                # would only fail when Elasticsearch indexes the record
+                value = dates.normalizer(dates.ISO_FORMAT).isoformat(value)
+                if not value:
+                    record.errors.append(':'.join([field, data[field]]))
+                    continue
+            try:
+                setattr(record, field, value)
+            except dsl.exceptions.ValidationException:
+                err = ':'.join([field, data[field]])
+                record.errors.append(err)
         record.m_dataset = m_dataset
         record.assemble_fulltext()
+        record.assemble_namekeys()
         return record
     
     @staticmethod
     def from_hit(hit):
-        """Build Record object from Elasticsearch hit
+        """Build Record object from elasticsearch_dsl search hit
+        
+        Prefer records_from_hits, which skips making a Document per hit.
         @param hit
-        @returns: Record
+        @returns: Record or None
         """
-        hit_d = hit.__dict__['_d_']
-        m_pseudoid = _hitvalue(hit_d, 'm_pseudoid')
-        m_dataset = _hitvalue(hit_d, 'm_dataset')
-        if m_dataset and m_pseudoid:
-            record = Record(meta={
-                'id': Record.make_id(m_dataset, m_pseudoid)
-            })
-            for field in definitions.FIELDS_MASTER:
-                setattr(record, field, _hitvalue(hit_d, field))
-            record.m_dataset = m_dataset
-            record.assemble_fulltext()
-            return record
-        record.assemble_fulltext()
+        data = hit_dict({'_id': hit.meta.id, '_source': hit.to_dict()})
+        if data.get('m_dataset') and data.get('m_pseudoid'):
+            return Record.from_source(data.pop('id'), data)
         return None
+    
+    @staticmethod
+    def from_source(_id, data):
+        """Build Record from hit values without per-field setattr
+        
+        Values are used as returned by Elasticsearch (e.g. dates are not
+        parsed) and fulltext is not assembled; these Records are for
+        display, not for writing back.
+        
+        @param _id: str
+        @param data: dict (see hit_dict)
+        @returns: Record
+        """
+        record = Record(meta={'id': _id})
+        record._d_.update(data)
+        return record
      
     @staticmethod
     def field_values(field, es=None, index=None):
@@ -237,3 +309,210 @@ class Record(dsl.Document):
         self.fulltext = ' '.join([
             f.lower() for f in fields if isinstance(f, str)
         ])
+    
+    def assemble_namekeys(self):
+        """Normalized and phonetic keys for name fields (see names)
+        """
+        for field in names.NAME_FIELDS:
+            value = getattr(self, field, None)
+            if value:
+                norm,phon = names.name_keys(value)
+                setattr(self, '%s_norm' % field, norm)
+                setattr(self, '%s_phon' % field, phon)
+
+
+class FamilyMember(dsl.InnerDoc):
+    id = dsl.Keyword()
+    m_pseudoid = dsl.Keyword()
+    m_lastname = dsl.Keyword()
+    m_firstname = dsl.Keyword()
+    m_birthyear = dsl.Keyword()
+    m_gender = dsl.Keyword()
+    m_individualno = dsl.Keyword()
+
+
+class Family(dsl.Document):
+    """Household: all records with the same dataset and m_familyno
+    
+    Written by publish.import_records, see family.
+    ID is m_dataset:m_familyno.
+    """
+    m_dataset = dsl.Keyword()
+    m_familyno = dsl.Keyword()
+    member_ids = dsl.Keyword(multi=True)
+    member_count = dsl.Integer()
+    members = dsl.Object(FamilyMember, multi=True)
+    
+    class Meta:
+        doc_type = FAMILY_DOC_TYPE
+    
+    def __repr__(self):
+        return "<Family %s>" % self.meta.id
+
+
+class DatasetStats(dsl.Document):
+    """Counts for one dataset, written at import time (see stats)
+    
+    ID is m_dataset.
+    """
+    m_dataset = dsl.Keyword()
+    records = dsl.Integer()
+    distinct_families = dsl.Integer()
+    families_hll = dsl.Keyword(index=False)
+    counts = dsl.Object(enabled=False)
+    updated = dsl.Date()
+    
+    class Meta:
+        doc_type = STATS_DOC_TYPE
+    
+    def __repr__(self):
+        return "<DatasetStats %s>" % self.meta.id
+
+
+# FAR and WRA records are stored in separate indices (see record_mapping)
+RECORD_FAMILIES = ['far', 'wra']
+
+def dataset_family(dataset):
+    """
+    >>> dataset_family('far-manzanar')
+    'far'
+    
+    @param dataset: str
+    @returns: str
+    """
+    family = dataset.split('-')[0]
+    if family not in RECORD_FAMILIES:
+        raise ValueError('Unknown dataset family: %s' % dataset)
+    return family
+
+def record_mapping(family):
+    """Elasticsearch mapping for the record index of a dataset family
+    
+    Fields are the m_* fields of all datasets and the other fields of
+    this family's datasets in definitions.DATASETS, plus the fields
+    Record adds itself (m_linkid, name keys, errors, fulltext).
+    The m_* fields are the same in every family so searches can span
+    all record indices.  Types come from Record where declared, else
+    from definitions.FIELD_DEFINITIONS (date or keyword).
+    
+    @param family: str One of RECORD_FAMILIES
+    @returns: dict
+    """
+    declared = Record._doc_type.mapping.to_dict()['properties']
+    fields = [
+        field for field in declared.keys()
+        if not field.startswith(('f_', 'w_'))
+    ]
+    for dataset,dataset_fields in definitions.DATASETS.items():
+        for field in dataset_fields:
+            if field.startswith('m_') or (dataset_family(dataset) == family):
+                if field not in fields:
+                    fields.append(field)
+    properties = {}
+    for field in fields:
+        if field in declared:
+            properties[field] = declared[field]
+        elif definitions.FIELD_DEFINITIONS.get(field, {}).get('type') == 'date':
+            properties[field] = {'type': 'date'}
+        else:
+            properties[field] = {'type': 'keyword'}
+    return {'properties': properties}
+
+
+LOW_CARDINALITY = set(definitions.FIELDS_LOW_CARDINALITY)
+
+def intern_value(field, value):
+    """Intern strings from fields with few distinct values
+    
+    A full wra-master load holds hundreds of thousands of copies of the
+    same few camp, gender, state, etc strings; interned they share one.
+    
+    @param field: str
+    @param value: any
+    @returns: value
+    """
+    if (field in LOW_CARDINALITY) and isinstance(value, str):
+        return intern(value)
+    return value
+
+
+# id of field list -> (field list, {field: position}), see field_positions
+FIELD_POSITIONS = {}
+
+def field_positions(fields):
+    """Positions of fields in a field list, made once per list
+    
+    The list is kept with its positions so its id can't be reused.
+    
+    @param fields: list
+    @returns: dict field -> int
+    """
+    entry = FIELD_POSITIONS.get(id(fields))
+    if entry is None:
+        entry = (fields, {field: n for n,field in enumerate(fields)})
+        FIELD_POSITIONS[id(fields)] = entry
+    return entry[1]
+
+
+class RecordRow():
+    """Compact in-memory stand-in for a Record
+    
+    Record objects (dsl.Document) carry a dict of values, a meta object,
+    and the fulltext field.  When many records must be held in memory
+    (see publish.load_records) keep them as RecordRows instead and only
+    make Records as they are written.
+    Values are stored in a tuple in the same order as `fields`, which is
+    shared by all RecordRows from a dataset, as is the dict of field
+    positions used by get (see field_positions).
+    """
+    __slots__ = ('fields', 'positions', 'values', 'errors')
+    
+    def __init__(self, fields, values, errors=()):
+        self.fields = fields
+        self.positions = field_positions(fields)
+        self.values = values
+        self.errors = errors
+    
+    def __repr__(self):
+        return "<Record %s>" % Record.make_id(
+            self.get('m_dataset'), self.get('m_pseudoid')
+        )
+    
+    def get(self, field, default=None):
+        n = self.positions.get(field)
+        if n is None:
+            return default
+        value = self.values[n]
+        if value is None:
+            return default
+        return value
+    
+    @staticmethod
+    def from_record(record, fields):
+        """
+        @param record: Record
+        @param fields: list (same object for all RecordRows in a dataset)
+        @returns: RecordRow
+        """
+        values = tuple([
+            intern_value(field, getattr(record, field, None))
+            for field in fields
+        ])
+        # most records have no errors; share the empty tuple
+        errors = tuple(record.errors)
+        return RecordRow(fields, values, errors)
+    
+    def to_record(self):
+        """
+        @returns: Record
+        """
+        record = Record(meta={
+            'id': Record.make_id(self.get('m_dataset'), self.get('m_pseudoid'))
+        })
+        for field,value in zip(self.fields, self.values):
+            if value is not None:
+                setattr(record, field, value)
+        record.errors = list(self.errors)
+        record.assemble_fulltext()
+        record.assemble_namekeys()
+        return record
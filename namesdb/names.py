@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""Normalized and phonetic keys for matching romanized Japanese names
+
+The same surname may be written Ōhashi, Oohashi, Ohhashi, or Ohashi,
+and Katō as Kato, Katou, or Katoh.  Instead of fuzzy queries at search
+time, keys are computed when records are written (see
+models.Record.assemble_namekeys) and stored as Keyword fields, so a
+name search (see publish.search_query) is a handful of term lookups.
+
+- norm: lowercase, diacritics folded, long vowels collapsed
+- phon: Soundex code of the norm key
+
+Only the standard library is used; no Elasticsearch plugins needed.
+"""
+
+import re
+import unicodedata
+
+# long vowels: doubled vowels, "ou", and "h" after a vowel (Hepburn "oh")
+LONG_VOWELS = [
+    (re.compile(r'([aeiou])\1+'), r'\1'),
+    (re.compile(r'ou'), 'o'),
+    (re.compile(r'uu'), 'u'),
+    (re.compile(r'([aeiou])h(?=[^aeiouy]|$)'), r'\1'),
+]
+
+SOUNDEX_CODES = {}
+for letters,code in [
+        ('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'),
+        ('l', '4'), ('mn', '5'), ('r', '6'),
+]:
+    for letter in letters:
+        SOUNDEX_CODES[letter] = code
+
+NAME_FIELDS = ['m_lastname', 'm_firstname']
+
+
+def normalize_name(text):
+    """Lowercase, fold diacritics, and drop non-letters
+
+    >>> normalize_name("Ōhashi-Smith ")
+    'ohashismith'
+
+    @param text: str
+    @returns: str
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join([c for c in text.lower() if c.isalpha() and c.isascii()])
+
+def collapse_vowels(text):
+    """Collapse romanized long vowels
+
+    >>> [collapse_vowels(x) for x in ['oohashi', 'ohhashi', 'katou', 'katoh', 'yuuki']]
+    ['ohashi', 'ohashi', 'kato', 'kato', 'yuki']
+
+    @param text: str (normalized)
+    @returns: str
+    """
+    for pattern,repl in LONG_VOWELS:
+        text = pattern.sub(repl, text)
+    return text
+
+def norm_key(text):
+    """
+    >>> [norm_key(x) for x in ['Ōhashi', 'OOHASHI', 'Ohashi']]
+    ['ohashi', 'ohashi', 'ohashi']
+
+    @param text: str
+    @returns: str
+    """
+    return collapse_vowels(normalize_name(text))
+
+def soundex(text):
+    """American Soundex code
+
+    >>> [soundex(x) for x in ['robert', 'rupert', 'tymczak', 'pfister']]
+    ['R163', 'R163', 'T522', 'P236']
+
+    @param text: str (normalized)
+    @returns: str
+    """
+    if not text:
+        return ''
+    code = text[0].upper()
+    last = SOUNDEX_CODES.get(text[0], '')
+    for c in text[1:]:
+        digit = SOUNDEX_CODES.get(c, '')
+        if digit and (digit != last):
+            code += digit
+            if len(code) == 4:
+                break
+        if c not in 'hw':
+            last = digit
+    return (code + '000')[:4]
+
+def phon_key(text):
+    """
+    >>> [phon_key(x) for x in ['Ōhashi', 'Ohhashi', 'Katō', 'Katoh']]
+    ['O200', 'O200', 'K300', 'K300']
+
+    @param text: str
+    @returns: str
+    """
+    return soundex(norm_key(text))
+
+def name_keys(text):
+    """All keys for a name
+
+    @param text: str
+    @returns: (norm, phon)
+    """
+    norm = norm_key(text)
+    return norm,soundex(norm)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""Search timings: profile API breakdowns and the slow query log
+
+"namesdb search --profile" runs the query with the Elasticsearch profile
+API and prints where the time went on each shard (query tree, rewrite,
+collectors incl. sorting, fetch) next to client-side timings (request,
+response deserialization, converting hits to Records).
+
+The slow query log is off unless enable_slowlog() is called (see
+"namesdb search/serve --slow-log").  Searches that take longer than the
+threshold are written to the log file as one JSON object per line.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+logger = logging.getLogger(__name__)
+import time
+
+SLOW_THRESHOLD = 1.0          # seconds
+DESCRIPTION_LENGTH = 80       # truncate query descriptions
+
+slowlog = logging.getLogger('namesdb.slowlog')
+SLOWLOG = {'threshold': None}
+
+
+class Timer():
+    """Named wall-clock timings, in the order they were taken
+
+    Usage:
+        timer = Timer()
+        with timer.time('request'):
+            response = s.execute()
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def add(self, name, seconds):
+        self.timings[name] = seconds
+
+
+def _ms(nanos):
+    return nanos / 1000000.0
+
+def _query_lines(queries, depth):
+    lines = []
+    for q in queries:
+        description = q.get('description', '')
+        if len(description) > DESCRIPTION_LENGTH:
+            description = description[:DESCRIPTION_LENGTH-3] + '...'
+        lines.append('%s%-10s %9.2fms  %s %s' % (
+            '  ' * depth, 'query', _ms(q['time_in_nanos']),
+            q.get('type'), description
+        ))
+        lines += _query_lines(q.get('children', []), depth + 1)
+    return lines
+
+def _collector_lines(collectors, depth):
+    lines = []
+    for c in collectors:
+        lines.append('%s%-10s %9.2fms  %s (%s)' % (
+            '  ' * depth, 'collector', _ms(c['time_in_nanos']),
+            c.get('name'), c.get('reason')
+        ))
+        lines += _collector_lines(c.get('children', []), depth + 1)
+    return lines
+
+def format_profile(profile):
+    """Lines describing an Elasticsearch profile API response
+
+    @param profile: dict response['profile']
+    @returns: list of str
+    """
+    lines = []
+    for shard in profile.get('shards', []):
+        lines.append('shard %s' % shard.get('id'))
+        for search in shard.get('searches', []):
+            lines += _query_lines(search.get('query', []), 1)
+            lines.append('  %-10s %9.2fms' % (
+                'rewrite', _ms(search.get('rewrite_time', 0))
+            ))
+            lines += _collector_lines(search.get('collector', []), 1)
+        # fetch phase is only profiled in Elasticsearch >= 7.16
+        fetch = shard.get('fetch')
+        if fetch:
+            lines.append('  %-10s %9.2fms' % ('fetch', _ms(fetch['time_in_nanos'])))
+            for child in fetch.get('children', []):
+                lines.append('    %-8s %9.2fms  %s' % (
+                    'fetch', _ms(child['time_in_nanos']), child.get('type')
+                ))
+    return lines
+
+def format_timings(timings):
+    """
+    >>> format_timings({'request': 0.25, 'convert': 0.0125})
+    ['request       250.00ms', 'convert        12.50ms']
+
+    @param timings: dict name -> seconds (see Timer)
+    @returns: list of str
+    """
+    return [
+        '%-10s %9.2fms' % (name, seconds * 1000)
+        for name,seconds in timings.items()
+    ]
+
+
+def enable_slowlog(path, threshold=SLOW_THRESHOLD):
+    """Write searches slower than threshold to path (JSON lines)
+
+    @param path: str
+    @param threshold: float Seconds
+    """
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slowlog.addHandler(handler)
+    slowlog.setLevel(logging.INFO)
+    slowlog.propagate = False
+    SLOWLOG['threshold'] = threshold
+
+def log_slow(query, body, elapsed, took=None, hits=None, **extra):
+    """Log search if slow log is enabled and search exceeded threshold
+
+    @param query: str Query text as entered
+    @param body: dict Search body sent to Elasticsearch
+    @param elapsed: float Client-side seconds
+    @param took: int Milliseconds reported by Elasticsearch
+    @param hits: int Total hits
+    @param extra: Other fields to include (e.g. collapse, page)
+    @returns: bool True if logged
+    """
+    threshold = SLOWLOG['threshold']
+    if (threshold is None) or (elapsed < threshold):
+        return False
+    data = {
+        'timestamp': datetime.now().isoformat(),
+        'query': query,
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'took_ms': took,
+        'hits': hits,
+        'body': body,
+    }
+    data.update(extra)
+    slowlog.info(json.dumps(data, default=str))
+    return True
@@ -1,46 +1,44 @@
 from datetime import datetime
-import configparser
+import itertools
 import json
 import logging
 import os
 import sys
+import time
 
 from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import scan
 from elasticsearch_dsl import Index
 from elasticsearch_dsl import Search
+from elasticsearch_dsl import Q
 from elasticsearch_dsl.query import MultiMatch
 from elasticsearch_dsl.connections import connections
 
 from . import sourcefile
+from . import bulk
+from . import bulkfile
+from . import cache
+from . import dates
 from . import definitions
 from . import docstore
+from . import family
+from . import link
 from . import models
-
-def set_logging(level, stream=sys.stdout):
-    logging.basicConfig(
-        level=level,
-        format='%(asctime)s %(levelname)-8s %(message)s',
-        stream=stream,
-    )
-
-LOGGING_LEVEL = 'INFO'
-
-set_logging(LOGGING_LEVEL, stream=sys.stdout)
-
-CONFIG_FILES = ['/etc/ddr/names.cfg', '/etc/ddr/names-local.cfg']
-config = configparser.ConfigParser()
-configs_read = config.read(CONFIG_FILES)
-#if not configs_read:
-#    raise NoConfigError('No config file!')
+from . import names
+from . import profiling
+from .rejects import RejectLog
+from .rejects import rejects_path as make_rejects_path
+from . import sample
+from . import stats
+from .sourcefile import verify_headers, map_headers, make_rowd
+from .sourcefile import dataset_from_path, check_csvpath
 
 
-
-def make_hosts( text ):
-    hosts = []
-    for host in text.split(','):
-        h,p = host.split(':')
-        hosts.append( {'host':h, 'port':p} )
-    return hosts
+def make_hosts(text, pool_size=None):
+    """List of host dicts, see docstore.make_hosts
+    """
+    return docstore.make_hosts(text, pool_size)
 
 def set_hosts_index(hosts, index):
     logging.debug('Connecting %s' % hosts)
@@ -57,46 +55,36 @@ def format_json(data):
 
 # import records -------------------------------------------------------
 
-def verify_headers(fieldnames, row):
-    """Verify that all fields in headers, no extras
-    """
-    missing = [f for f in fieldnames if f not in row]
-    extra = [f for f in row if f not in fieldnames]
-    return missing,extra
-
-def map_headers(row):
-    """Map header field names to column numbers
+def load_records(dataset, fields, headers, rows, record_ids=[], date_formats={},
+                 row_numbers=None, rejects=None):
     """
-    headers_cols = {}
-    for n,header in enumerate(row):
-        headers_cols[header] = n
-    return headers_cols
+    Records are returned as compact models.RecordRows.  Defective rows
+    and records with invalid values are written to rejects as they are
+    found, instead of being kept.  Rows are consumed one at a time so
+    they need not all be in memory.
     
-def make_rowd(headers, row, dataset=None):
-    """Take list of column values and return a dict
-    """
-    rowd = {}
-    for fieldname,index in headers.items():
-        rowd[fieldname] = row[index]
-    if dataset:
-        rowd['dataset'] = dataset
-    return rowd
-
-def load_records(dataset, fields, headers, rows, record_ids=[]):
-    """
-    @returns: (records, defective_rows) where each defective_row = (n, err, row)
+    @param rows: iterable of lists
+    @param date_formats: dict of date field -> format (see dates.infer_formats)
+    @param row_numbers: iterable Row numbers in file, if rows is a sample
+    @param rejects: rejects.RejectLog (default: count only)
+    @returns: (records, rejects)
     """
+    if rejects is None:
+        rejects = RejectLog()
+    record_ids = set(record_ids)
     records = []
-    defective_rows = []
-    num_rows = len(rows)
-    n = 0
-    while rows:
-        n += 1
-        row = rows.pop(0)
-        if dataset in ['wra-master', 'far-ancestry']:
-            rowd = make_rowd(headers, row, dataset)
-        else:
-            rowd = make_rowd(headers, row)
+    num_rows = 0
+    for n,row in zip(row_numbers or itertools.count(1), rows):
+        num_rows += 1
+        try:
+            if dataset in ['wra-master', 'far-ancestry']:
+                rowd = make_rowd(headers, row, dataset)
+            else:
+                rowd = make_rowd(headers, row)
+        except Exception as err:
+            # e.g. short row
+            rejects.defective(n, err, row)
+            continue
         # decide
         if record_ids:
             if (rowd['m_pseudoid'] in record_ids):
@@ -109,54 +97,144 @@ def load_records(dataset, fields, headers, rows, record_ids=[]):
         if load_this:
             rowd['n'] = n
             try:
+                dates.normalize_rowd(rowd, date_formats)
                 record = models.Record.from_dict(
                     fields, dataset, rowd['m_pseudoid'], rowd
                 )
-                logging.info('Loading %s/%s %s' % (n, num_rows, record))
-                records.append(record)
+                logging.info('Loading %s %s' % (n, record))
+                records.append(models.RecordRow.from_record(record, fields))
             except Exception as err:
-                defective_rows.append((n,err,row))
-    return records,defective_rows
-
-def find_errors(records):
-    return [r for r in records if r.errors]
-
-def write_records(ds, indexname, records):
-    num_rows = len(records)
-    n = 0
-    while records:
-        n += 1
-        record = records.pop(0)
-        logging.info('Saving %s/%s %s' % (n, num_rows, record))
-        result = record.save(index=indexname, using=ds.es)
-
-def import_records(ds, dataset, stop, csvpath, record_ids=[]):
-    doctype = 'record'
-    ES_Class = docstore.ELASTICSEARCH_CLASSES_BY_MODEL[doctype]
-    indexname = ds.index_name(doctype)
+                rejects.defective(n, err, row, rowd.get('m_pseudoid'))
+                continue
+            if record.errors:
+                rejects.invalid(n, rowd['m_pseudoid'], record.errors)
+    logging.info('ok (%s rows)' % num_rows)
+    return records,rejects
+
+def write_records(ds, indexname, records, bulk_options={}, rejects=None):
+    """Write records using bulk requests with adaptive batch size
     
-    # check args
-    if not os.path.exists(csvpath):
-        logging.error('ddr-import: CSV file does not exist.')
-        sys.exit(1)
+    @param ds: docstore.Docstore
+    @param indexname: str
+    @param records: list of models.RecordRow
+    @param bulk_options: dict kwargs for bulk.AdaptiveBulkWriter
+    @param rejects: rejects.RejectLog Records that fail are written here
+    @returns: dict summary (see bulk.format_summary)
+    """
+    writer = bulk.AdaptiveBulkWriter(
+        ds.es, on_error=(rejects.rejected if rejects else None), **bulk_options
+    )
+    return writer.write(bulk.record_actions(indexname, records))
+
+def write_records_fanout(dss, indexname, records, bulk_options={}, rejects=None):
+    """Write records to several clusters, transforming each record once
     
-    if not dataset:
-        path,filename = os.path.split(csvpath)
-        dataset,ext = os.path.splitext(filename)
-    logging.info('Dataset: %s' % dataset)
-    if not dataset in definitions.DATASETS.keys():
-        logging.error('ddr-import: unknown dataset: %s.' % dataset)
-        sys.exit(1)
+    @param dss: list of docstore.Docstore
+    @param indexname: str
+    @param records: list of models.RecordRow
+    @param bulk_options: dict kwargs for bulk.AdaptiveBulkWriter
+    @param rejects: rejects.RejectLog Records that fail are written here
+    @returns: list of dict summaries, in order of dss
+    """
+    writer = bulk.FanoutWriter(
+        [ds.es for ds in dss],
+        on_error=(rejects.rejected if rejects else None), **bulk_options
+    )
+    return writer.write(bulk.record_actions(indexname, records))
+
+def write_families(dss, indexname, grouper, bulk_options={}):
+    """Write Family documents
     
-    start = datetime.now()
+    @param dss: list of docstore.Docstore
+    @param indexname: str
+    @param grouper: family.FamilyGrouper with all records added
+    @param bulk_options: dict kwargs for bulk.AdaptiveBulkWriter
+    @returns: list of dict summaries, in order of dss
+    """
+    if grouper.spills:
+        logging.info('Family groups spilled to disk %s times' % grouper.spills)
+    actions = family.family_actions(indexname, grouper)
+    if len(dss) > 1:
+        writer = bulk.FanoutWriter([ds.es for ds in dss], **bulk_options)
+        return writer.write(actions)
+    writer = bulk.AdaptiveBulkWriter(dss[0].es, **bulk_options)
+    return [writer.write(actions)]
+
+def emit_bulk(dataset, records, outdir, compress=False,
+              families=True, dataset_stats=True):
+    """Write records, families, and stats as bulk payload files
     
-    fields = definitions.DATASETS[dataset]
-    logging.info('Fields: %s' % fields)
+    No cluster is needed; see bulkfile and load_bulk.
     
+    @param dataset: str
+    @param records: list of models.RecordRow
+    @param outdir: str
+    @param compress: bool gzip chunks
+    @param families: bool Write Family documents
+    @param dataset_stats: bool Write DatasetStats document
+    @returns: str path to manifest
+    """
+    writer = bulkfile.BulkFileWriter(outdir, compress=compress)
+    model = 'record-%s' % models.dataset_family(dataset)
+    writer.write(model, bulk.record_actions('', records))
+    if families or dataset_stats:
+        grouper = family.FamilyGrouper()
+        dstats = stats.DatasetStats(dataset)
+        for record in records:
+            if families:
+                grouper.add(record)
+            dstats.add(record)
+        if families:
+            writer.write('family', family.family_actions('', grouper))
+        if dataset_stats:
+            writer.write('stats', [({'index': {'_id': dataset}}, dstats.source())])
+    return writer.write_manifest(dataset=dataset)
+
+def load_bulk(ds, indir, workers=bulkfile.LOAD_WORKERS):
+    """Send bulk payload files written by emit_bulk
+    
+    @param ds: docstore.Docstore
+    @param indir: str
+    @param workers: int Chunks sent concurrently
+    @returns: dict summary (see bulk.format_summary)
+    """
+    manifest = bulkfile.read_manifest(indir)
+    logging.info('%s: %s chunks, %s docs (%s, created %s)' % (
+        indir, len(manifest['chunks']),
+        sum([chunk['docs'] for chunk in manifest['chunks']]),
+        manifest.get('dataset'), manifest['created'],
+    ))
+    problems = bulkfile.verify(indir, manifest)
+    if problems:
+        for problem in problems:
+            logging.error(problem)
+        sys.exit(1)
+    loader = bulkfile.BulkFileLoader(ds.es, ds.index_name, workers=workers)
+    summary = loader.load(indir, manifest)
+    for _id,err in summary['error_items']:
+        logging.error('| %s: %s' % (_id, err))
+    logging.info('Bulk %s: %s' % (ds.host, bulk.format_summary(summary)))
+    return summary
+
+def read_records(csvpath, dataset, fields, record_ids=[], sample_options={},
+                 rejects=None):
+    """Read CSV, verify headers, and load records
+    
+    @param sample_options: dict kwargs for sample.sample_rows
+    @param rejects: rejects.RejectLog
+    @returns: (records, rejects) (see load_records)
+    """
     logging.info('Reading file: %s' % csvpath)
-    rows = sourcefile.read_csv(csvpath)
-    header_row = rows.pop(0)
-    logging.info('ok (%s rows)' % str(len(rows)))
+    rows = sourcefile.iter_csv_parallel(csvpath)
+    header_row = next(rows)
+    row_numbers = None
+    if sample_options:
+        logging.info('Sampling: %s' % sample_options)
+        numbered,numbered2 = itertools.tee(
+            sample.sample_rows(rows, **sample_options)
+        )
+        row_numbers = (n for n,row in numbered)
+        rows = (row for n,row in numbered2)
     
     logging.info('Verifying headers')
     missing_headers,extra_headers = verify_headers(fields, header_row)
@@ -171,69 +249,516 @@ def import_records(ds, dataset, stop, csvpath, record_ids=[]):
     logging.info('ok')
     headers = map_headers(header_row)
     
+    # put the rows used to infer formats back in front
+    head = list(itertools.islice(rows, dates.SAMPLE_SIZE))
+    rows = itertools.chain(head, rows)
+    date_formats = dates.infer_formats(fields, headers, head)
+    logging.info('Date formats: %s' % date_formats)
+    
     logging.info('Loading records')
-    records,defective_rows = load_records(dataset, fields, headers, rows, record_ids)
-    logging.info('Loaded %s records' % len(records))
-    if defective_rows:
-        logging.error('Defective rows: {}'.format(len(defective_rows)))
-        for n,err,row in defective_rows:
-            logging.error('| row:%s ERROR:"%s" ROW: %s' % (n, err, row))
-    
-    logging.info('Checking for errors')
-    record_errors = find_errors(records)
-    record_errors_msg = '%s records contain errors (%s%%):' % (
-        len(record_errors),
-        float(len(record_errors)) / len(records)
+    return load_records(
+        dataset, fields, headers, rows, record_ids, date_formats, row_numbers,
+        rejects
     )
-    logging.error(record_errors_msg)
-    if record_errors and args.stop:
-        for record in record_errors:
-            logging.error('| %s: %s' % (record, ', '.join(record.errors)))
+
+def read_records_cached(csvpath, dataset, fields, record_ids=[], rejects=None):
+    """read_records, using cache file next to CSV if possible
+    
+    The cache always contains the whole file; if record_ids are given
+    records are filtered after reading the cache, and the cache is not
+    written.  Rejects stored in the cache are written to rejects again.
+    
+    @param rejects: rejects.RejectLog
+    @returns: (records, rejects) (see load_records)
+    """
+    if rejects is None:
+        rejects = RejectLog()
+    if csvpath == sourcefile.STDIN:
+        return read_records(csvpath, dataset, fields, record_ids, rejects=rejects)
+    key = cache.cache_key(csvpath, dataset, fields)
+    cached = cache.read(csvpath, key)
+    if cached:
+        logging.info('Read cache: %s' % cache.cache_path(csvpath))
+        records,entries = cached
+        if record_ids:
+            record_ids = set(record_ids)
+            records = [r for r in records if r.get('m_pseudoid') in record_ids]
+            entries = [e for e in entries if e.get('m_pseudoid') in record_ids]
+        rejects.replay(entries)
+        return records,rejects
+    records,rejects = read_records(
+        csvpath, dataset, fields, record_ids, rejects=rejects
+    )
+    if not record_ids:
+        path = cache.write(csvpath, key, fields, records, rejects.entries())
+        logging.info('Wrote cache: %s' % path)
+    return records,rejects
+
+def import_records(ds, dataset, stop, csvpath, record_ids=[], use_cache=False,
+                   bulk_options={}, sample_options={}, targets=[],
+                   families=True, rejects_path=None, emit_dir=None,
+                   compress=False):
+    """Read records from CSV file and write to Elasticsearch
+    
+    @param ds: docstore.Docstore (None with emit_dir)
+    @param dataset: str Dataset name (if not in filename)
+    @param stop: bool Stop if errors detected
+    @param csvpath: str Absolute path to CSV file (see sourcefile.open_csv)
+    @param record_ids: list Only import these m_pseudoids
+    @param use_cache: bool Read/write pre-parsed records (see cache)
+    @param bulk_options: dict Batch size/concurrency bounds (see bulk)
+    @param sample_options: dict Import only a sample (see sample.sample_rows)
+    @param targets: list Additional docstore.Docstores to write to
+    @param families: bool Write Family documents (not for partial imports)
+    @param rejects_path: str Reject file (default: next to CSV, see rejects)
+    @param emit_dir: str Write bulk payload files here instead (see bulkfile)
+    @param compress: bool gzip bulk payload files
+    """
+    # check args
+    check_csvpath(csvpath, dataset)
+    if not dataset:
+        dataset = dataset_from_path(csvpath)
+    logging.info('Dataset: %s' % dataset)
+    if not dataset in definitions.DATASETS.keys():
+        logging.error('ddr-import: unknown dataset: %s.' % dataset)
         sys.exit(1)
     
+    start = datetime.now()
+    
+    fields = definitions.DATASETS[dataset]
+    logging.info('Fields: %s' % fields)
+    
+    if not rejects_path:
+        rejects_path = make_rejects_path(csvpath, dataset)
+    logging.info('Rejects: %s' % rejects_path)
+    with RejectLog(rejects_path) as rejects:
+        if use_cache and not sample_options:
+            records,rejects = read_records_cached(
+                csvpath, dataset, fields, record_ids, rejects
+            )
+        else:
+            records,rejects = read_records(
+                csvpath, dataset, fields, record_ids, sample_options, rejects
+            )
+    logging.info('Loaded %s records' % len(records))
+    if rejects and stop:
+        for line in rejects.format_summary(len(records)):
+            logging.error(line)
+        sys.exit(1)
+    
+    if emit_dir:
+        logging.info('Writing bulk files to %s' % emit_dir)
+        partial = bool(record_ids or sample_options)
+        path = emit_bulk(
+            dataset, records, emit_dir, compress,
+            families=(families and not partial), dataset_stats=(not partial),
+        )
+        logging.info('Wrote %s' % path)
+        for line in rejects.format_summary(len(records)):
+            logging.error(line)
+        logging.info('DONE - %s elapsed' % (datetime.now() - start))
+        return
+    
+    indexname = ds.dataset_index(dataset)
+    logging.info('Index: %s' % indexname)
     logging.info('Writing to Elasticsearch')
-    write_records(ds, indexname, records)
-
-    if defective_rows:
-        logging.error('Defective rows: {}'.format(len(defective_rows)))
-        for n,err,row in defective_rows:
-            logging.error('| row:%s ERROR:"%s" ROW: %s' % (n, err, row))
+    dss = [ds] + targets
+    if targets:
+        summaries = write_records_fanout(
+            dss, indexname, records, bulk_options, rejects
+        )
+    else:
+        summaries = [write_records(ds, indexname, records, bulk_options, rejects)]
+    rejects.close()
+    for summary in summaries:
+        for _id,err in summary['error_items']:
+            logging.error('| %s: %s' % (_id, err))
     
-    if record_errors:
-        logging.error(record_errors_msg)
-        for record in record_errors:
-            logging.error('| %s: %s' % (record, ', '.join(record.errors)))
-        logging.error(record_errors_msg)
+    family_summaries = []
+    if record_ids or sample_options:
+        logging.info('Partial import, not writing families or stats')
+    else:
+        # one pass for families and stats
+        grouper = family.FamilyGrouper()
+        dstats = stats.DatasetStats(dataset)
+        for record in records:
+            if families:
+                grouper.add(record)
+            dstats.add(record)
+        if families:
+            logging.info('Writing families')
+            family_summaries = write_families(
+                dss, ds.index_name('family'), grouper, bulk_options
+            )
+        logging.info('Writing stats')
+        for target in dss:
+            write_stats(target, dstats.source())
+
+    for line in rejects.format_summary(len(records)):
+        logging.error(line)
     
     finish = datetime.now()
     elapsed = finish - start
+    for target,summary in zip(dss, summaries):
+        logging.info('Bulk %s: %s' % (target.host, bulk.format_summary(summary)))
+    for target,summary in zip(dss, family_summaries):
+        logging.info('Families %s: %s' % (target.host, bulk.format_summary(summary)))
     logging.info('DONE - %s elapsed' % elapsed)
 
 
+# families -------------------------------------------------------------
+
+def get_family(ds, familyno, dataset=None):
+    """Family documents for family number
+    
+    With dataset this is a single get; without it the family index is
+    searched, since the same number may be used in several datasets.
+    
+    @param ds: docstore.Docstore
+    @param familyno: str
+    @param dataset: str
+    @returns: list of dicts (see family.family_source)
+    """
+    indexname = ds.index_name('family')
+    if dataset:
+        try:
+            doc = ds.es.get(index=indexname, id=family.family_id(dataset, familyno))
+        except NotFoundError:
+            return []
+        return [doc['_source']]
+    s = Search(using=ds.es, index=indexname).filter('term', m_familyno=familyno)
+    return [hit.to_dict() for hit in s.sort('m_dataset')[0:100].execute()]
+
+
+# stats ----------------------------------------------------------------
+
+def write_stats(ds, source):
+    """Replace dataset's stats document (a single index request)
+    
+    @param ds: docstore.Docstore
+    @param source: dict (see stats.DatasetStats.source)
+    """
+    ds.es.index(
+        index=ds.index_name('stats'), id=source['m_dataset'], body=source
+    )
+
+def get_stats(ds, dataset=None):
+    """Stats documents for dataset, or all datasets
+    
+    @param ds: docstore.Docstore
+    @param dataset: str
+    @returns: list of dicts (see stats.DatasetStats.source)
+    """
+    indexname = ds.index_name('stats')
+    if dataset:
+        try:
+            doc = ds.es.get(index=indexname, id=dataset)
+        except NotFoundError:
+            return []
+        return [doc['_source']]
+    s = Search(using=ds.es, index=indexname).sort('m_dataset')[0:100]
+    return [hit.to_dict() for hit in s.execute()]
+
+
+# link records --------------------------------------------------------
+
+def link_records(ds, threshold=None, processes=None, dry_run=False,
+                 bulk_options={}):
+    """Find records of the same person across datasets and set m_linkid
+    
+    Every record gets an m_linkid; records that were linked share one.
+    Only documents whose m_linkid changed are updated.
+    
+    @param ds: docstore.Docstore
+    @param threshold: float Minimum score for a link (default link.THRESHOLD)
+    @param processes: int Number of worker processes (default: all CPUs)
+    @param dry_run: bool Find links but don't write them
+    @param bulk_options: dict kwargs for bulk.AdaptiveBulkWriter
+    @returns: dict summary
+    """
+    if not threshold:
+        threshold = link.THRESHOLD
+    start = datetime.now()
+    indexname = ds.index_name('record')
+    
+    logging.info('Reading records from %s' % indexname)
+    records = []
+    linkids = {}
+    indices = {}
+    for hit in scan(
+            ds.es, index=indexname,
+            query={'_source': link.LINK_FIELDS + ['m_linkid']}
+    ):
+        records.append(link.make_linkrecord(hit['_id'], hit['_source']))
+        linkids[hit['_id']] = hit['_source'].get('m_linkid')
+        indices[hit['_id']] = hit['_index']
+    logging.info('%s records' % len(records))
+    
+    blocks,skipped = link.make_blocks(records)
+    logging.info('%s blocks (%s oversize blocks skipped)' % (len(blocks), skipped))
+    pairs = link.find_pairs(blocks, threshold, processes)
+    logging.info('%s linked pairs' % len(pairs))
+    clusters = link.clusters(linkids.keys(), pairs.keys())
+    
+    changed = {
+        _id: linkid for _id,linkid in clusters.items()
+        if linkids[_id] != linkid
+    }
+    summary = {
+        'records': len(records),
+        'blocks': len(blocks),
+        'pairs': len(pairs),
+        'clusters': len(set(clusters.values())),
+        'changed': len(changed),
+    }
+    logging.info('%s clusters, %s records changed' % (
+        summary['clusters'], summary['changed']
+    ))
+    if not dry_run:
+        actions = (
+            (
+                {'update': {'_index': indices[_id], '_id': _id}},
+                {'doc': {'m_linkid': linkid}},
+            )
+            for _id,linkid in changed.items()
+        )
+        writer = bulk.AdaptiveBulkWriter(ds.es, **bulk_options)
+        result = writer.write(actions)
+        logging.info('Bulk: %s' % bulk.format_summary(result))
+    logging.info('DONE - %s elapsed' % (datetime.now() - start))
+    return summary
+
+
 # delete records -------------------------------------------------------
 
-def delete_records(ds):
+DELETE_SLICES = 'auto'    # one slice per shard
+DELETE_POLL = 5           # seconds between task status checks
+
+def delete_records(ds, csvpath):
     logging.error('NOT IMPLEMENTED YET')
 
+def delete_dataset(ds, dataset, slices=DELETE_SLICES, requests_per_second=None):
+    """Start background tasks deleting all of dataset's documents
+    
+    Records and Family documents are removed with sliced
+    _delete_by_query tasks so the deletes run in parallel on the
+    cluster and don't depend on this connection staying open; see
+    watch_task.  The dataset's DatasetStats document is deleted at once.
+    
+    @param ds: docstore.Docstore
+    @param dataset: str
+    @param slices: int or 'auto'
+    @param requests_per_second: float Throttle (batches of 1000 docs), None for unlimited
+    @returns: list of str Task IDs (records, families)
+    """
+    if not dataset in definitions.DATASETS.keys():
+        logging.error('Unknown dataset: %s' % dataset)
+        sys.exit(1)
+    body = {'query': {'term': {'m_dataset': dataset}}}
+    options = {
+        'slices': slices,
+        'conflicts': 'proceed',
+        'wait_for_completion': False,
+    }
+    if requests_per_second:
+        options['requests_per_second'] = requests_per_second
+    tasks = []
+    for indexname in [ds.dataset_index(dataset), ds.index_name('family')]:
+        response = ds.es.delete_by_query(index=indexname, body=body, **options)
+        logging.info('%s: task %s' % (indexname, response['task']))
+        tasks.append(response['task'])
+    ds.es.delete(index=ds.index_name('stats'), id=dataset, ignore=404)
+    return tasks
+
+def format_task_status(status, running_time):
+    """
+    >>> format_task_status({'total': 2000, 'deleted': 500, 'version_conflicts': 0}, 10)
+    '500/2000 (25.0%) 50.0/s'
+    >>> format_task_status({'total': 2000, 'deleted': 500, 'version_conflicts': 3, 'throttled_millis': 1500}, 10)
+    '500/2000 (25.0%) 50.0/s, 3 conflicts, throttled 1.5s'
+    
+    @param status: dict _delete_by_query task status or response
+    @param running_time: float Seconds
+    @returns: str
+    """
+    total = status.get('total', 0)
+    deleted = status.get('deleted', 0)
+    line = '%s/%s (%.1f%%) %.1f/s' % (
+        deleted, total,
+        (100.0 * deleted / total) if total else 100.0,
+        (deleted / running_time) if running_time else 0.0,
+    )
+    if status.get('version_conflicts'):
+        line += ', %s conflicts' % status['version_conflicts']
+    if status.get('throttled_millis'):
+        line += ', throttled %.1fs' % (status['throttled_millis'] / 1000.0)
+    return line
+
+def watch_task(ds, task_id, interval=DELETE_POLL):
+    """Log progress of a _delete_by_query task until it completes
+    
+    Can be used to resume watching a task started earlier
+    (see "namesdb delete --task").
+    
+    @param ds: docstore.Docstore
+    @param task_id: str 'NODE:ID'
+    @param interval: float Seconds between checks
+    @returns: dict Task response, or status if response not available
+    """
+    while True:
+        try:
+            result = ds.es.tasks.get(task_id=task_id)
+        except NotFoundError:
+            logging.error('Task not found: %s' % task_id)
+            sys.exit(1)
+        running_time = result['task']['running_time_in_nanos'] / 1000000000.0
+        if result.get('completed'):
+            response = result.get('response', result['task']['status'])
+            logging.info('%s done: %s' % (
+                task_id, format_task_status(response, running_time)
+            ))
+            for failure in response.get('failures', []):
+                logging.error('%s: %s' % (task_id, failure))
+            if result.get('error'):
+                logging.error('%s: %s' % (task_id, result['error']))
+            return response
+        logging.info('%s: %s' % (
+            task_id, format_task_status(result['task']['status'], running_time)
+        ))
+        time.sleep(interval)
+
 
 # search ---------------------------------------------------------------
 
-def search(ds, query):
-    logging.info('query: "%s"' % query)
+MAX_RESULTS = 10000       # Elasticsearch index.max_result_window
+
+def name_query(query):
+    """Term lookups on precomputed name keys (see names)
+    
+    Every word in the query must match a lastname or firstname key.
+    Exact normalized matches score higher than phonetic ones.
+    
+    @param query: str
+    @returns: elasticsearch_dsl.query.Bool
+    """
+    must = []
+    for word in query.split():
+        norm,phon = names.name_keys(word)
+        if not norm:
+            continue
+        should = []
+        for field in names.NAME_FIELDS:
+            should.append(Q('term', **{'%s_norm' % field: {'value': norm, 'boost': 2}}))
+            should.append(Q('term', **{'%s_phon' % field: phon}))
+        must.append(Q('bool', should=should, minimum_should_match=1))
+    return Q('bool', must=must)
+
+def search_query(ds, query, collapse=False, match_names=False):
+    """Search object for query (see search, server)
     
-    s = Search().doc_type(models.Record)
-    s = s.fields(definitions.FIELDS_MASTER)
-    s = s.sort('m_pseudoid')
-    s = s.query(
-        'multi_match', query=query, fields=definitions.FIELDS_MASTER
-    )[0:10000]
+    @param ds: docstore.Docstore
+    @param query: str
+    @param collapse: bool One result per linked person (see link_records)
+    @param match_names: bool Match name variants instead of full text
+    @returns: elasticsearch_dsl.Search
+    """
+    s = Search(using=ds.es, index=ds.index_name('record')).doc_type(models.Record)
+    if collapse:
+        s = s.extra(collapse={'field': 'm_linkid'})
+    if match_names:
+        s = s.sort('_score', 'm_pseudoid')
+        s = s.query(name_query(query))
+    else:
+        s = s.sort('m_pseudoid')
+        s = s.query(
+            'multi_match', query=query, fields=definitions.FIELDS_MASTER
+        )
+    return s
+
+def execute_search(s, query, **extra):
+    """Execute search, writing it to the slow query log if slow
+    
+    @param s: elasticsearch_dsl.Search
+    @param query: str Query text (for the log)
+    @param extra: Other fields for the log (see profiling.log_slow)
+    @returns: (response, elapsed seconds)
+    """
+    start = time.perf_counter()
     response = s.execute()
-    records = [models.Record.from_hit(hit) for hit in response]
+    elapsed = time.perf_counter() - start
+    # raw dict; response.hits would make a Document for every hit
+    raw = response.to_dict()
+    profiling.log_slow(
+        query, s.to_dict(), elapsed, raw['took'], raw['hits']['total']['value'],
+        **extra
+    )
+    return response,elapsed
 
+def search_records(ds, query, collapse=False, match_names=False, profile=False,
+                   size=MAX_RESULTS, as_dicts=False, docvalue_fields=None):
+    """Execute search and convert hits to Records (see search, benchmark)
+    
+    Hits are converted from the raw response (see models.records_from_hits).
+    
+    @param ds: docstore.Docstore
+    @param query: str
+    @param collapse: bool One result per linked person (see link_records)
+    @param match_names: bool Match name variants (see name_query)
+    @param profile: bool Ask Elasticsearch for profile (see profiling)
+    @param size: int Maximum number of records
+    @param as_dicts: bool Return dicts (see models.hit_dict) instead of Records
+    @param docvalue_fields: list Keyword fields to read from doc values
+        instead of reading FIELDS_MASTER from _source
+    @returns: (records, response, profiling.Timer)
+    """
+    s = search_query(ds, query, collapse, match_names)
+    if docvalue_fields:
+        s = s.source(False).extra(docvalue_fields=docvalue_fields)
+    else:
+        s = s.source(definitions.FIELDS_MASTER)
+    s = s[0:size]
+    if profile:
+        s = s.extra(profile=True)
+    timer = profiling.Timer()
+    docstore.TIMINGS.loads = 0.0
+    response,elapsed = execute_search(
+        s, query, collapse=collapse, match_names=match_names
+    )
+    deserialize = docstore.TIMINGS.loads
+    timer.add('request', elapsed - deserialize)
+    timer.add('deserialize', deserialize)
+    with timer.time('convert'):
+        hits = response.to_dict()['hits']['hits']
+        if as_dicts:
+            records = models.dicts_from_hits(hits)
+        else:
+            records = models.records_from_hits(hits)
+    return records,response,timer
+
+def search(ds, query, collapse=False, match_names=False, profile=False):
+    """
+    @param ds: docstore.Docstore
+    @param query: str
+    @param collapse: bool One result per linked person (see link_records)
+    @param match_names: bool Match name variants (see name_query)
+    @param profile: bool Log timing breakdown (see profiling)
+    """
+    logging.info('query: "%s"' % query)
+    
+    records,response,timer = search_records(
+        ds, query, collapse, match_names, profile
+    )
+    if profile:
+        logging.info('Profile (Elasticsearch took %sms):' % response.took)
+        for line in profiling.format_profile(response.to_dict()['profile']):
+            logging.info(line)
+        logging.info('Client:')
+        for line in profiling.format_timings(timer.timings):
+            logging.info(line)
     logging.info('%s records' % len(records))
     for record in records:
         logging.info(record)
     # if only single result, display it
     if len(records) == 1:
         for field in definitions.FIELDS_MASTER:
-            logging.info('%s: %s' % (field, getattr(record, field)))
+            logging.info('%s: %s' % (field, getattr(record, field, None)))
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""Rejected rows, streamed to a reject file as they are found
+
+Rows that can't be loaded (defective rows), records with invalid
+values, and records that Elasticsearch refused in a bulk request are
+written to an NDJSON file, one object per error:
+
+    {"n": 12, "m_pseudoid": "...", "error": "invalid",
+     "field": "m_birthyear", "value": "19x2"}
+    {"n": 40, "m_pseudoid": null, "error": "KeyError", "field": null,
+     "value": null, "message": "'m_pseudoid'", "row": [...]}
+    {"n": null, "m_pseudoid": "...", "error": "mapper_parsing_exception",
+     "field": "f_entrydate", "value": "...", "message": "failed to parse
+     field [f_entrydate] of type [date] ...", "source": {...}}
+
+Only counts per (error, field) and one example of each are kept in
+memory, so a messy file doesn't fill memory or the log.
+
+After fixing the CSV, "namesdb post --from-rejects FILE" re-imports
+only the rows listed in the reject file (see reject_ids).
+"""
+
+from collections import Counter
+import json
+import logging
+logger = logging.getLogger(__name__)
+import os
+import re
+import threading
+
+from . import sourcefile
+
+REJECTS_EXT = '.rejects.ndjson'
+TOP_ERRORS = 10           # error types listed in summary
+
+# field named in Elasticsearch error reasons, e.g. mapper_parsing_exception
+REASON_FIELD = re.compile(r'field \[([^\]]+)\]')
+
+
+def rejects_path(csvpath, dataset):
+    """Default reject file path, next to the CSV file
+
+    >>> rejects_path('/opt/namesdb-data/far-manzanar.csv', 'far-manzanar')
+    '/opt/namesdb-data/far-manzanar.csv.rejects.ndjson'
+    >>> rejects_path('-', 'far-manzanar')
+    'far-manzanar.rejects.ndjson'
+    """
+    if csvpath == sourcefile.STDIN:
+        return dataset + REJECTS_EXT
+    return csvpath + REJECTS_EXT
+
+
+class RejectLog():
+    """Writes rejects to file, keeping only counters in memory
+
+    If path is None nothing is written but rejects are still counted.
+    The file is only created if there are rejects; a reject file left
+    from an earlier run is removed.  Rejects can be written from several
+    threads (see bulk.FanoutWriter), and after close (the file is
+    reopened for appending).
+
+    Usage:
+        with RejectLog(path) as rejects:
+            records = publish.load_records(..., rejects=rejects)
+        for line in rejects.format_summary():
+            logging.error(line)
+    """
+
+    def __init__(self, path=None, top=TOP_ERRORS):
+        self.path = path
+        self.top = top
+        self.defective_rows = 0
+        self.invalid_records = 0
+        self.failed_records = 0
+        self.counts = Counter()
+        self.examples = {}
+        self._file = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.defective_rows + self.invalid_records + self.failed_records
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def write(self, entry):
+        """Count reject entry and write it to file
+
+        @param entry: dict
+        """
+        key = (entry['error'], entry.get('field'))
+        with self._lock:
+            self.counts[key] += 1
+            if key not in self.examples:
+                self.examples[key] = (
+                    entry['n'] or entry.get('m_pseudoid'),
+                    entry.get('value') or entry.get('message'),
+                )
+            if self.path:
+                if not self._file:
+                    # any old file was removed in __init__
+                    self._file = open(self.path, 'a')
+                self._file.write(json.dumps(entry, default=str) + '\n')
+
+    def defective(self, n, err, row, m_pseudoid=None):
+        """Row that could not be loaded
+
+        @param n: int Row number
+        @param err: Exception
+        @param row: list
+        @param m_pseudoid: str
+        """
+        self.defective_rows += 1
+        self.write({
+            'n': n, 'm_pseudoid': m_pseudoid, 'error': type(err).__name__,
+            'field': None, 'value': None, 'message': str(err), 'row': row,
+        })
+
+    def invalid(self, n, m_pseudoid, errors):
+        """Record loaded with invalid values (see models.Record.from_dict)
+
+        @param n: int Row number
+        @param m_pseudoid: str
+        @param errors: list of 'field:value' str (Record.errors)
+        """
+        self.invalid_records += 1
+        for err in errors:
+            field,value = err.split(':', 1)
+            self.write({
+                'n': n, 'm_pseudoid': m_pseudoid, 'error': 'invalid',
+                'field': field, 'value': value,
+            })
+
+    def rejected(self, action, source, result):
+        """Record that Elasticsearch refused in a bulk request
+
+        Used as on_error of bulk.AdaptiveBulkWriter.  The field is taken
+        from the error reason if it names one.  The document is written
+        to the file with the error.
+
+        @param action: dict Bulk action
+        @param source: dict Document
+        @param result: dict Bulk response item
+        """
+        error = result.get('error') or {}
+        if not isinstance(error, dict):
+            error = {'reason': str(error)}
+        reason = error.get('reason') or ''
+        match = REASON_FIELD.search(reason)
+        field = match.group(1) if match else None
+        with self._lock:
+            self.failed_records += 1
+        self.write({
+            'n': None, 'm_pseudoid': source.get('m_pseudoid'),
+            'error': error.get('type') or 'status %s' % result.get('status'),
+            'field': field, 'value': source.get(field) if field else None,
+            'message': reason, 'source': source,
+        })
+
+    def replay(self, entries):
+        """Write entries from an earlier run (see cache)
+
+        @param entries: list of dicts (see entries)
+        """
+        invalid = set()
+        for entry in entries:
+            if entry['error'] == 'invalid':
+                invalid.add(entry['n'])
+            elif 'source' in entry:
+                self.failed_records += 1
+            else:
+                self.defective_rows += 1
+            self.write(entry)
+        self.invalid_records += len(invalid)
+
+    def entries(self):
+        """Entries written so far, read back from the reject file
+
+        @returns: list of dicts
+        """
+        if not (self.path and os.path.exists(self.path)):
+            return []
+        if self._file:
+            self._file.flush()
+        return read_rejects(self.path)
+
+    def format_summary(self, num_records=None):
+        """
+        @param num_records: int Records loaded, for percentage
+        @returns: list of str
+        """
+        lines = []
+        if self.defective_rows:
+            lines.append('Defective rows: %s' % self.defective_rows)
+        if self.invalid_records:
+            if num_records:
+                lines.append('%s records contain errors (%.2f%%)' % (
+                    self.invalid_records, 100.0 * self.invalid_records / num_records
+                ))
+            else:
+                lines.append('%s records contain errors' % self.invalid_records)
+        if self.failed_records:
+            lines.append('%s records rejected by Elasticsearch' % self.failed_records)
+        for (error,field),count in self.counts.most_common(self.top):
+            where,value = self.examples[(error,field)]
+            if isinstance(where, int):
+                where = 'row %s' % where
+            lines.append('| %-12s %-24s %8s  e.g. %s: %s' % (
+                error, field or '', count, where, value
+            ))
+        if len(self.counts) > self.top:
+            lines.append('| ... %s more error types' % (len(self.counts) - self.top))
+        if self.path and len(self):
+            lines.append('Rejects: %s' % os.path.abspath(self.path))
+        return lines
+
+
+def read_rejects(path):
+    """
+    @param path: str
+    @returns: list of dicts
+    """
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def reject_ids(path):
+    """m_pseudoids of rejected rows, for re-importing them
+
+    Rejects without an m_pseudoid can't be selected and are logged.
+
+    @param path: str
+    @returns: list of str
+    """
+    ids = {}
+    missing = {}
+    for entry in read_rejects(path):
+        if entry.get('m_pseudoid'):
+            ids[entry['m_pseudoid']] = None
+        else:
+            missing[entry['n']] = None
+    if missing:
+        logging.warning('No m_pseudoid, cannot re-import rows: %s' % list(missing))
+    return list(ids)
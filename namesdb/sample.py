@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""Sampling rows for small staging/dev indexes (see "namesdb post --sample")
+
+Functions take and return (n, row) pairs so row numbers in error messages
+still refer to the row in the source file.  Samples are deterministic for
+a given seed so benchmark runs are comparable.
+"""
+
+import itertools
+import random
+
+SEED = 0
+
+
+def number_rows(rows, start=1):
+    """
+    @param rows: iterable of rows (header row already removed)
+    @returns: generator of (n, row)
+    """
+    return enumerate(rows, start=start)
+
+def limit(numbered, num):
+    """First num rows
+
+    @param numbered: iterable of (n, row)
+    @param num: int
+    @returns: iterator of (n, row)
+    """
+    return itertools.islice(numbered, num)
+
+def reservoir(numbered, num, seed=SEED):
+    """Uniform random sample of num rows in one pass (Algorithm R)
+
+    Only num rows are held in memory regardless of file size.
+
+    >>> [n for n,row in reservoir(number_rows(range(1000)), 3, seed=1)]
+    [128, 255, 678]
+
+    @param numbered: iterable of (n, row)
+    @param num: int
+    @param seed: int
+    @returns: list of (n, row) in file order
+    """
+    rng = random.Random(seed)
+    sample = []
+    for i,item in enumerate(numbered):
+        if i < num:
+            sample.append(item)
+        else:
+            j = rng.randint(0, i)
+            if j < num:
+                sample[j] = item
+    return sorted(sample, key=lambda item: item[0])
+
+def fraction(numbered, frac, seed=SEED):
+    """Each row is included with probability frac
+
+    @param numbered: iterable of (n, row)
+    @param frac: float 0.0 - 1.0
+    @param seed: int
+    @returns: generator of (n, row)
+    """
+    rng = random.Random(seed)
+    for item in numbered:
+        if rng.random() < frac:
+            yield item
+
+def sample_rows(rows, size=None, frac=None, num=None, seed=SEED):
+    """Apply sampling options to rows
+
+    Sampling (size or frac) is done first, then limit (num).
+
+    @param rows: iterable of rows (header row already removed)
+    @param size: int Reservoir sample size
+    @param frac: float Fraction of rows to sample
+    @param num: int Maximum number of rows
+    @param seed: int
+    @returns: iterator of (n, row)
+    """
+    numbered = number_rows(rows)
+    if size:
+        numbered = iter(reservoir(numbered, size, seed))
+    elif frac:
+        numbered = fraction(numbered, frac, seed)
+    if num:
+        numbered = limit(numbered, num)
+    return numbered
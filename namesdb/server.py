@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""Small HTTP API for searching records (see "namesdb serve")
+
+One Docstore (and its pool of Elasticsearch connections) is shared by
+all requests, so lookups skip interpreter startup, config reading, and
+connection setup.  The Elasticsearch 7 client is synchronous so requests
+are handled by a pool of threads rather than an event loop.
+
+    GET /search?q=yano&page=1&size=25[&collapse=1][&names=1]
+    GET /records/<id>
+    GET /facets?field=m_camp
+    GET /suggest?q=yan[&field=m_lastname]
+    GET /stats[?dataset=far-manzanar]   (counts taken at import, see stats)
+
+Responses are JSON.  Each response has an X-Response-Time header (ms).
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+logger = logging.getLogger(__name__)
+import time
+from urllib.parse import urlparse, parse_qs, unquote
+
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import Search
+
+from . import definitions
+from . import models
+from . import publish
+
+HOST = '127.0.0.1'
+PORT = 8085
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+MAX_RESULTS = 10000       # Elasticsearch index.max_result_window
+SUGGEST_SIZE = 10
+FACET_FIELDS = definitions.FIELDS_LOW_CARDINALITY
+SUGGEST_FIELDS = ['m_lastname', 'm_firstname']
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+
+
+def _arg(args, name, default=None):
+    values = args.get(name)
+    if values:
+        return values[0]
+    return default
+
+def _int_arg(args, name, default, minimum, maximum):
+    try:
+        value = int(_arg(args, name, default))
+    except ValueError:
+        raise HTTPError(400, '%s must be an integer' % name)
+    return max(minimum, min(value, maximum))
+
+def search(ds, args):
+    q = _arg(args, 'q')
+    if not q:
+        raise HTTPError(400, 'q is required')
+    size = _int_arg(args, 'size', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    page = _int_arg(args, 'page', 1, 1, MAX_RESULTS // size)
+    collapse = _arg(args, 'collapse') in ['1', 'true']
+    match_names = _arg(args, 'names') in ['1', 'true']
+    start = (page - 1) * size
+    s = publish.search_query(ds, q, collapse, match_names)[start:start+size]
+    response,elapsed = publish.execute_search(
+        s, q, collapse=collapse, match_names=match_names, page=page, size=size
+    )
+    raw = response.to_dict()['hits']
+    return {
+        'total': raw['total']['value'],
+        'page': page,
+        'size': size,
+        'results': models.dicts_from_hits(raw['hits']),
+    }
+
+def get(ds, _id):
+    try:
+        index = ds.record_id_index(_id)
+    except (ValueError, IndexError):
+        raise HTTPError(404, 'not found: %s' % _id)
+    try:
+        doc = ds.es.get(index=index, id=_id)
+    except NotFoundError:
+        raise HTTPError(404, 'not found: %s' % _id)
+    data = doc['_source']
+    data['id'] = doc['_id']
+    return data
+
+def facets(ds, args):
+    field = _arg(args, 'field')
+    if field not in FACET_FIELDS:
+        raise HTTPError(400, 'field must be one of %s' % ', '.join(FACET_FIELDS))
+    s = Search(using=ds.es, index=ds.index_name('record')).extra(size=0)
+    s.aggs.bucket('bucket', 'terms', field=field, size=1000)
+    response = s.execute()
+    return {
+        'field': field,
+        'terms': [
+            {'value': x['key'], 'count': x['doc_count']}
+            for x in response.aggregations['bucket']['buckets']
+        ],
+    }
+
+def suggest(ds, args):
+    q = _arg(args, 'q')
+    if not q:
+        raise HTTPError(400, 'q is required')
+    field = _arg(args, 'field', 'm_lastname')
+    if field not in SUGGEST_FIELDS:
+        raise HTTPError(400, 'field must be one of %s' % ', '.join(SUGGEST_FIELDS))
+    s = Search(using=ds.es, index=ds.index_name('record'))
+    s = s.query('match_phrase_prefix', **{field: q}).source([field])
+    s = s[0:SUGGEST_SIZE * 10]
+    suggestions = []
+    for hit in s.execute():
+        value = getattr(hit, field, None)
+        if value and (value not in suggestions):
+            suggestions.append(value)
+        if len(suggestions) >= SUGGEST_SIZE:
+            break
+    return {'field': field, 'suggestions': suggestions}
+
+def dataset_stats(ds, args):
+    return {'stats': publish.get_stats(ds, _arg(args, 'dataset'))}
+
+
+class Handler(BaseHTTPRequestHandler):
+    ds = None   # set by serve()
+
+    def do_GET(self):
+        start = time.monotonic()
+        url = urlparse(self.path)
+        args = parse_qs(url.query)
+        # decode each part so IDs can contain encoded / as well as : etc
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        try:
+            if parts == ['search']:
+                status,data = 200,search(self.ds, args)
+            elif (len(parts) == 2) and (parts[0] == 'records'):
+                status,data = 200,get(self.ds, parts[1])
+            elif parts == ['facets']:
+                status,data = 200,facets(self.ds, args)
+            elif parts == ['suggest']:
+                status,data = 200,suggest(self.ds, args)
+            elif parts == ['stats']:
+                status,data = 200,dataset_stats(self.ds, args)
+            else:
+                raise HTTPError(404, 'not found: %s' % url.path)
+        except HTTPError as err:
+            status,data = err.status,{'error': err.message}
+        except Exception as err:
+            logging.exception(err)
+            status,data = 500,{'error': str(err)}
+        body = self.ds.es.transport.serializer.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header(
+            'X-Response-Time', '%.1fms' % ((time.monotonic() - start) * 1000)
+        )
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info('%s %s' % (self.address_string(), format % args))
+
+
+def serve(ds, host=HOST, port=PORT):
+    """Serve API until interrupted
+
+    @param ds: docstore.Docstore
+    @param host: str
+    @param port: int
+    """
+    Handler.ds = ds
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    logging.info('Serving on http://%s:%s/' % (host, port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
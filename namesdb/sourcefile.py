@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import bz2
 import codecs
 import csv
 from datetime import datetime
+import gzip
+import io
 import json
 import logging
 logger = logging.getLogger(__name__)
+import lzma
+import mmap
+import multiprocessing
 import os
 import sys
 
@@ -14,6 +20,27 @@ CSV_DELIMITER = ','
 CSV_QUOTECHAR = '"'
 CSV_QUOTING = csv.QUOTE_ALL
 
+STDIN = '-'
+
+CHUNK_SIZE = 16 * 1024 * 1024  # bytes per chunk in iter_csv_chunks
+BATCH_ROWS = 10000             # rows per batch when file can't be chunked
+
+def _zstd_open(path, mode='rb'):
+    # zstandard is optional; only needed for .zst files
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception('Reading .zst files requires the zstandard package.')
+    return zstandard.open(path, mode)
+
+# compression extension -> function that opens file in binary mode
+COMPRESSION = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': _zstd_open,
+}
+
 
 def normalize_text(text):
     """Strip text, convert line endings, etc.
@@ -97,6 +124,87 @@ def write_csv(path, headers, rows):
         for row in rows:
             writer.writerow(row)
 
+def strip_compression(path):
+    """Remove compression extension (if any) from path
+    
+    >>> strip_compression('/tmp/far-manzanar.csv.gz')
+    '/tmp/far-manzanar.csv'
+    >>> strip_compression('/tmp/far-manzanar.csv')
+    '/tmp/far-manzanar.csv'
+    
+    @param path: str
+    @returns: str
+    """
+    base,ext = os.path.splitext(path)
+    if ext in COMPRESSION:
+        return base
+    return path
+
+def open_csv(path):
+    """Open CSV file for reading as text, decompressing if necessary
+    
+    Files ending in .gz, .bz2, .xz, or .zst are decompressed as they
+    are read.  Use '-' to read from stdin.
+    
+    @param path: Absolute path to CSV file, or '-'
+    @returns: text file object
+    """
+    if path == STDIN:
+        f = sys.stdin.buffer
+    else:
+        base,ext = os.path.splitext(path)
+        f = COMPRESSION.get(ext, open)(path, 'rb')
+    # newline='' lets the csv module handle line endings inside quoted fields
+    return io.TextIOWrapper(f, encoding='utf-8', errors='replace', newline='')
+
+def verify_headers(fieldnames, row):
+    """Verify that all fields in headers, no extras
+    """
+    missing = [f for f in fieldnames if f not in row]
+    extra = [f for f in row if f not in fieldnames]
+    return missing,extra
+
+def map_headers(row):
+    """Map header field names to column numbers
+    """
+    headers_cols = {}
+    for n,header in enumerate(row):
+        headers_cols[header] = n
+    return headers_cols
+    
+def make_rowd(headers, row, dataset=None):
+    """Take list of column values and return a dict
+    """
+    rowd = {}
+    for fieldname,index in headers.items():
+        rowd[fieldname] = row[index]
+    if dataset:
+        rowd['dataset'] = dataset
+    return rowd
+
+def dataset_from_path(csvpath):
+    """Dataset name is the CSV filename minus extension(s)
+    
+    >>> dataset_from_path('/opt/namesdb-data/far-manzanar.csv')
+    'far-manzanar'
+    >>> dataset_from_path('/opt/namesdb-data/far-manzanar.csv.gz')
+    'far-manzanar'
+    """
+    path,filename = os.path.split(strip_compression(csvpath))
+    dataset,ext = os.path.splitext(filename)
+    return dataset
+
+def check_csvpath(csvpath, dataset):
+    """Exit if CSV file is missing or dataset can't be determined
+    """
+    if csvpath == STDIN:
+        if not dataset:
+            logging.error('ddr-import: Dataset is required when reading stdin.')
+            sys.exit(1)
+    elif not os.path.exists(csvpath):
+        logging.error('ddr-import: CSV file does not exist.')
+        sys.exit(1)
+
 def read_csv(path):
     """Read specified file, return list of rows.
     
@@ -114,12 +222,154 @@ def read_csv(path):
     @param path: Absolute path to CSV file
     @returns list of rows
     """
-    rows = []
-    # the 'U' is for universal-newline mode
-    with codecs.open(path, 'rU', 'utf-8', 'replace') as f:
+    return [row for row in iter_csv(path)]
+
+def iter_csv(path):
+    """Read specified file one row at a time.
+    
+    Use this instead of read_csv when the whole file does not need to be
+    held in memory.
+    
+    @param path: Absolute path to CSV file (see open_csv)
+    @returns generator of rows (lists)
+    """
+    with open_csv(path) as f:
         reader = csv_reader(f)
         for row in reader:
-            rows.append(row)
+            yield row
+
+
+# parallel reader ------------------------------------------------------
+#
+# Files are split into byte ranges that each end on a record boundary,
+# and the ranges are parsed by a pool of worker processes.
+# With CSV_QUOTING a newline is inside a quoted field if an odd number
+# of quote chars precede it ("" escapes count as two), so boundaries
+# can be found by counting quote chars without parsing.
+
+def _next_boundary(mm, pos, quotes):
+    """Find the first record boundary at or after pos
+    
+    @param mm: mmap
+    @param pos: int Offset to start looking
+    @param quotes: int Number of quote chars before pos
+    @returns: (offset, quotes) Offset just past the newline, quotes before it
+    """
+    quotechar = CSV_QUOTECHAR.encode('utf-8')
+    while True:
+        newline = mm.find(b'\n', pos)
+        if newline < 0:
+            return len(mm), quotes + mm[pos:].count(quotechar)
+        quotes += mm[pos:newline].count(quotechar)
+        pos = newline + 1
+        if not quotes % 2:
+            return pos, quotes
+
+def find_chunks(path, chunk_size=CHUNK_SIZE):
+    """Split file into byte ranges that begin and end on record boundaries
+    
+    The header row is always in a range by itself.
+    
+    @param path: Absolute path to CSV file
+    @param chunk_size: int Approximate size of each range
+    @returns: list of (start, end)
+    """
+    chunks = []
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return chunks
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start,quotes = _next_boundary(mm, 0, 0)
+            chunks.append((0, start))
+            while start < len(mm):
+                pos = min(start + chunk_size, len(mm))
+                quotes += mm[start:pos].count(CSV_QUOTECHAR.encode('utf-8'))
+                end,quotes = _next_boundary(mm, pos, quotes)
+                chunks.append((start, end))
+                start = end
+    return chunks
+
+def parse_chunk(path, start, end, func=None):
+    """Parse rows in byte range of file
+    
+    Runs in worker processes.
+    
+    @param path: Absolute path to CSV file
+    @param start: int
+    @param end: int
+    @param func: function (optional) Applied to the rows in the worker
+    @returns: list of rows, or result of func
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode('utf-8', 'replace')
+    rows = list(csv_reader(io.StringIO(text, newline='')))
+    if func:
+        return func(rows)
     return rows
 
+def _parse_chunk(args):
+    return parse_chunk(*args)
 
+def iter_csv_chunks(path, processes=None, chunk_size=CHUNK_SIZE, func=None):
+    """Read file in parallel, yielding lists of rows in file order
+    
+    The first list contains only the header row.  Compressed files and
+    stdin can't be split and are read by iter_csv in batches instead.
+    
+    If func is given, each list of rows after the header is passed to
+    it in the worker process and its result is yielded instead, so rows
+    are processed where they are parsed and not sent back to this
+    process.  func must be picklable (e.g. a functools.partial of a
+    module-level function).
+    
+    @param path: Absolute path to CSV file (see open_csv)
+    @param processes: int Number of worker processes (default: all CPUs)
+    @param chunk_size: int Approximate size of each chunk in bytes
+    @param func: function (optional) Applied to each list of rows
+    @returns generator of lists of rows (or of func results)
+    """
+    base,ext = os.path.splitext(path)
+    if (path == STDIN) or (ext in COMPRESSION):
+        rows = iter_csv(path)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield [header]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                yield func(batch) if func else batch
+                batch = []
+        if batch:
+            yield func(batch) if func else batch
+        return
+    # header is never passed to func
+    chunks = [
+        (path, start, end, func if n else None)
+        for n,(start,end) in enumerate(find_chunks(path, chunk_size))
+    ]
+    if len(chunks) <= 2:
+        # header plus one chunk, not worth starting processes
+        for chunk in chunks:
+            yield _parse_chunk(chunk)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        # imap returns chunks in file order so row numbers are unchanged
+        for rows in pool.imap(_parse_chunk, chunks):
+            yield rows
+
+def iter_csv_parallel(path, processes=None, chunk_size=CHUNK_SIZE):
+    """Read file in parallel, yielding rows in file order
+    
+    Produces the same rows as iter_csv.
+    
+    @param path: Absolute path to CSV file (see open_csv)
+    @param processes: int Number of worker processes (default: all CPUs)
+    @param chunk_size: int Approximate size of each chunk in bytes
+    @returns generator of rows (lists)
+    """
+    for rows in iter_csv_chunks(path, processes, chunk_size):
+        for row in rows:
+            yield row
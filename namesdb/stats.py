@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""Dataset statistics computed at import time
+
+Instead of running terms aggregations over the whole index for every
+dashboard page (see models.Record.field_values), counts are taken while
+records are imported and written as one DatasetStats document per
+dataset (see publish.import_records, "namesdb stats"):
+
+- exact counts of each value of STATS_FIELDS
+- approximate number of distinct families (HyperLogLog), counted by
+  family ID (see family.family_id) as family numbers are only unique
+  within a dataset
+
+The HyperLogLog registers are stored with the counts so estimates from
+several datasets can be merged.
+"""
+
+import base64
+from datetime import datetime
+import hashlib
+import math
+
+from . import family
+
+STATS_FIELDS = ['m_camp', 'm_gender', 'm_birthyear', 'm_originalstate']
+HLL_PRECISION = 12        # 2**12 registers, about 1.6% standard error
+
+
+class HyperLogLog():
+    """Approximate distinct count in fixed memory (Flajolet et al. 2007)
+
+    >>> hll = HyperLogLog()
+    >>> for n in range(10000):
+    ...     hll.add(str(n % 1000))
+    >>> 980 < hll.count() < 1020
+    True
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.p = precision
+        self.m = 2 ** precision
+        if registers is None:
+            registers = bytearray(self.m)
+        self.registers = registers
+
+    def add(self, value):
+        """
+        @param value: str
+        """
+        h = int.from_bytes(
+            hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big'
+        )
+        j = h >> (64 - self.p)
+        w = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - w.bit_length() + 1
+        if rank > self.registers[j]:
+            self.registers[j] = rank
+
+    def count(self):
+        """
+        @returns: int Estimated number of distinct values added
+        """
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(
+            [2.0 ** -r for r in self.registers]
+        )
+        zeros = self.registers.count(0)
+        if (estimate <= 2.5 * self.m) and zeros:
+            # small range correction (linear counting)
+            estimate = self.m * math.log(self.m / float(zeros))
+        return int(round(estimate))
+
+    def merge(self, other):
+        """Add values counted by other HyperLogLog of same precision
+        """
+        self.registers = bytearray(
+            [max(a, b) for a,b in zip(self.registers, other.registers)]
+        )
+
+    def dumps(self):
+        """
+        @returns: str base64 registers
+        """
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @staticmethod
+    def loads(text, precision=HLL_PRECISION):
+        return HyperLogLog(precision, bytearray(base64.b64decode(text)))
+
+
+class DatasetStats():
+    """Counts for one dataset, taken as records stream by
+
+    Usage:
+        dstats = DatasetStats('far-manzanar')
+        for record in records:
+            dstats.add(record)
+        source = dstats.source()
+    """
+
+    def __init__(self, dataset, fields=STATS_FIELDS):
+        self.dataset = dataset
+        self.fields = fields
+        self.records = 0
+        self.counts = {field: {} for field in fields}
+        self.families = HyperLogLog()
+
+    def add(self, record):
+        """
+        @param record: models.RecordRow
+        """
+        self.records += 1
+        for field in self.fields:
+            value = record.get(field) or ''
+            counts = self.counts[field]
+            counts[value] = counts.get(value, 0) + 1
+        familyno = record.get('m_familyno')
+        if familyno:
+            self.families.add(family.family_id(self.dataset, familyno))
+
+    def source(self):
+        """DatasetStats document _source (see models.DatasetStats)
+
+        Values are sorted by count, most common first.
+        @returns: dict
+        """
+        return {
+            'm_dataset': self.dataset,
+            'records': self.records,
+            'distinct_families': self.families.count(),
+            'families_hll': self.families.dumps(),
+            'counts': {
+                field: [
+                    {'value': value, 'count': count}
+                    for value,count in sorted(
+                        counts.items(), key=lambda item: (-item[1], item[0])
+                    )
+                ]
+                for field,counts in self.counts.items()
+            },
+            'updated': datetime.now().isoformat(timespec='seconds'),
+        }
+
+
+def merge_sources(sources):
+    """Combine stats documents of several datasets
+
+    @param sources: list of dicts (see DatasetStats.source)
+    @returns: dict
+    """
+    records = 0
+    counts = {}
+    families = HyperLogLog()
+    for source in sources:
+        records += source['records']
+        families.merge(HyperLogLog.loads(source['families_hll']))
+        for field,values in source['counts'].items():
+            field_counts = counts.setdefault(field, {})
+            for item in values:
+                field_counts[item['value']] = \
+                    field_counts.get(item['value'], 0) + item['count']
+    return {
+        'm_dataset': ','.join([source['m_dataset'] for source in sources]),
+        'records': records,
+        'distinct_families': families.count(),
+        'counts': {
+            field: [
+                {'value': value, 'count': count}
+                for value,count in sorted(
+                    values.items(), key=lambda item: (-item[1], item[0])
+                )
+            ]
+            for field,values in counts.items()
+        },
+    }
+
+def format_stats(source, limit=20):
+    """
+    @param source: dict (see DatasetStats.source)
+    @param limit: int Values shown per field
+    @returns: list of str
+    """
+    lines = [
+        '%s: %s records, ~%s families%s' % (
+            source['m_dataset'], source['records'], source['distinct_families'],
+            (' (updated %s)' % source['updated']) if source.get('updated') else '',
+        )
+    ]
+    for field,values in source['counts'].items():
+        lines.append('  %s (%s values)' % (field, len(values)))
+        for item in values[:limit]:
+            lines.append('    %-30s %8s' % (item['value'] or '(blank)', item['count']))
+        if len(values) > limit:
+            lines.append('    ...')
+    return lines
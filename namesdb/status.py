@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+"""Cluster and index status (see "namesdb status")
+
+The status requests (cluster health, index stats, node stats, record
+counts per dataset) are independent so they are sent in parallel and
+combined by summarize.  In watch mode only index and node stats are
+sampled, and rates (documents indexed per second, thread pool
+rejections) are computed from the difference between two samples.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+logger = logging.getLogger(__name__)
+import time
+
+WATCH_INTERVAL = 5        # seconds
+DATASETS_MAX = 100        # terms agg size, more than there are datasets
+
+INDEX_METRICS = 'docs,store,segments,refresh,merge,indexing,search'
+NODE_METRICS = 'indices,thread_pool'
+
+
+def status_requests(ds):
+    """Status requests as name -> function
+
+    @param ds: docstore.Docstore
+    @returns: dict
+    """
+    es = ds.es
+    return {
+        'health': lambda: es.cluster.health(),
+        'indices': lambda: es.indices.stats(
+            index=ds.index_name('*'), metric=INDEX_METRICS
+        ),
+        'nodes': lambda: es.nodes.stats(metric=NODE_METRICS),
+        'datasets': lambda: es.search(index=ds.index_name('record'), body={
+            'size': 0,
+            'aggs': {'datasets': {'terms': {
+                'field': 'm_dataset', 'size': DATASETS_MAX
+            }}},
+        }),
+    }
+
+def fetch(functions):
+    """Call functions in parallel
+
+    A failed request doesn't stop the others; its error is returned in
+    place of the response.
+
+    @param functions: dict name -> function
+    @returns: dict name -> response or Exception
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(functions)) as pool:
+        futures = {name: pool.submit(function) for name,function in functions.items()}
+        for name,future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as err:
+                logging.debug('%s: %s' % (name, err))
+                results[name] = err
+    return results
+
+
+def _ratio(time_ms, total):
+    return round(time_ms / float(total), 2) if total else None
+
+def index_stats(response):
+    """
+    @param response: dict indices.stats response
+    @returns: dict index name -> dict
+    """
+    indices = {}
+    for name,data in sorted(response.get('indices', {}).items()):
+        primaries = data['primaries']
+        total = data['total']
+        indices[name] = {
+            'docs': primaries['docs']['count'],
+            'deleted': primaries['docs']['deleted'],
+            'store_bytes': total['store']['size_in_bytes'],
+            'segments': total['segments']['count'],
+            'refreshes': total['refresh']['total'],
+            'refresh_ms': total['refresh']['total_time_in_millis'],
+            'merges': total['merges']['total'],
+            'merges_current': total['merges']['current'],
+            'merge_ms': total['merges']['total_time_in_millis'],
+            'index_total': total['indexing']['index_total'],
+            'search_total': total['search']['query_total'],
+        }
+    return indices
+
+def node_stats(response):
+    """
+    Latencies are means since the node started.
+    @param response: dict nodes.stats response
+    @returns: dict node name -> dict
+    """
+    nodes = {}
+    for data in response.get('nodes', {}).values():
+        search = data['indices']['search']
+        indexing = data['indices']['indexing']
+        pools = data.get('thread_pool', {})
+        nodes[data['name']] = {
+            'search_total': search['query_total'],
+            'search_ms': _ratio(search['query_time_in_millis'], search['query_total']),
+            'index_total': indexing['index_total'],
+            'index_ms': _ratio(indexing['index_time_in_millis'], indexing['index_total']),
+            'write_queue': pools.get('write', {}).get('queue', 0),
+            'write_rejected': pools.get('write', {}).get('rejected', 0),
+            'search_rejected': pools.get('search', {}).get('rejected', 0),
+        }
+    return dict(sorted(nodes.items()))
+
+def summarize(results):
+    """Combine status responses (see fetch)
+
+    @param results: dict name -> response or Exception
+    @returns: dict
+    """
+    summary = {'errors': {}}
+    for name,result in results.items():
+        if isinstance(result, Exception):
+            summary['errors'][name] = str(result)
+    health = results.get('health')
+    if isinstance(health, dict):
+        summary['cluster'] = {
+            'name': health['cluster_name'],
+            'status': health['status'],
+            'nodes': health['number_of_nodes'],
+            'active_shards': health['active_shards'],
+            'unassigned_shards': health['unassigned_shards'],
+        }
+    if isinstance(results.get('indices'), dict):
+        summary['indices'] = index_stats(results['indices'])
+    if isinstance(results.get('nodes'), dict):
+        summary['nodes'] = node_stats(results['nodes'])
+    if isinstance(results.get('datasets'), dict):
+        summary['datasets'] = {
+            bucket['key']: bucket['doc_count']
+            for bucket in results['datasets']['aggregations']['datasets']['buckets']
+        }
+    return summary
+
+def rates(previous, current, seconds):
+    """Indexing rate and rejections between two samples (see summarize)
+
+    >>> a = {'indices': {'r': {'index_total': 1000, 'search_total': 5}},
+    ...      'nodes': {'n': {'write_rejected': 2, 'search_rejected': 0}}}
+    >>> b = {'indices': {'r': {'index_total': 6000, 'search_total': 15}},
+    ...      'nodes': {'n': {'write_rejected': 5, 'search_rejected': 0}}}
+    >>> rates(a, b, 10)
+    {'indexed': 5000, 'index_rate': 500.0, 'search_rate': 1.0, 'write_rejected': 3, 'search_rejected': 0, 'indices': {'r': 500.0}}
+
+    @param previous: dict
+    @param current: dict
+    @param seconds: float Time between samples
+    @returns: dict
+    """
+    indices = {}
+    indexed = 0
+    searched = 0
+    for name,data in current.get('indices', {}).items():
+        before = previous.get('indices', {}).get(name, data)
+        n = data['index_total'] - before['index_total']
+        indexed += n
+        searched += data['search_total'] - before['search_total']
+        indices[name] = round(n / seconds, 1)
+    rejected = {'write_rejected': 0, 'search_rejected': 0}
+    for name,data in current.get('nodes', {}).items():
+        before = previous.get('nodes', {}).get(name, data)
+        for key in rejected.keys():
+            rejected[key] += data[key] - before[key]
+    result = {
+        'indexed': indexed,
+        'index_rate': round(indexed / seconds, 1),
+        'search_rate': round(searched / seconds, 1),
+    }
+    result.update(rejected)
+    result['indices'] = indices
+    return result
+
+
+def _size(num_bytes):
+    """
+    >>> _size(123456789)
+    '117.7MB'
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024:
+            return '%.1f%s' % (num_bytes, unit)
+        num_bytes = num_bytes / 1024.0
+    return '%.1fTB' % num_bytes
+
+def format_status(summary):
+    """
+    @param summary: dict (see summarize)
+    @returns: list of str
+    """
+    lines = []
+    cluster = summary.get('cluster')
+    if cluster:
+        lines.append('Cluster %s: %s, %s nodes, %s shards (%s unassigned)' % (
+            cluster['name'], cluster['status'], cluster['nodes'],
+            cluster['active_shards'], cluster['unassigned_shards'],
+        ))
+    if summary.get('indices'):
+        lines.append('Indexes')
+        lines.append('  %-24s %10s %9s %9s %8s %10s %8s %10s' % (
+            'index', 'docs', 'deleted', 'size', 'segments',
+            'refresh_ms', 'merges', 'merge_ms',
+        ))
+        for name,data in summary['indices'].items():
+            lines.append('  %-24s %10s %9s %9s %8s %10s %8s %10s' % (
+                name, data['docs'], data['deleted'], _size(data['store_bytes']),
+                data['segments'], data['refresh_ms'],
+                '%s+%s' % (data['merges'], data['merges_current'])
+                if data['merges_current'] else data['merges'],
+                data['merge_ms'],
+            ))
+    if summary.get('datasets'):
+        lines.append('Datasets')
+        for name,count in sorted(summary['datasets'].items()):
+            lines.append('  %-24s %10s' % (name, count))
+    if summary.get('nodes'):
+        lines.append('Nodes')
+        lines.append('  %-24s %10s %10s %10s %10s' % (
+            'node', 'search_ms', 'index_ms', 'rej_write', 'rej_search',
+        ))
+        for name,data in summary['nodes'].items():
+            lines.append('  %-24s %10s %10s %10s %10s' % (
+                name, data['search_ms'], data['index_ms'],
+                data['write_rejected'], data['search_rejected'],
+            ))
+    for name,error in summary.get('errors', {}).items():
+        lines.append('ERROR %s: %s' % (name, error))
+    return lines
+
+def format_rates(rates):
+    """
+    @param rates: dict (see rates)
+    @returns: str
+    """
+    line = '%s indexed %8.1f docs/s %6.1f searches/s  rejected: %s write, %s search' % (
+        time.strftime('%H:%M:%S'), rates['index_rate'], rates['search_rate'],
+        rates['write_rejected'], rates['search_rejected'],
+    )
+    active = ['%s %.1f/s' % (name, rate) for name,rate in rates['indices'].items() if rate]
+    if active:
+        line += '  (%s)' % ', '.join(active)
+    return line
+
+
+def watch(ds, interval=WATCH_INTERVAL):
+    """Yield rates (see rates) every interval seconds, forever
+
+    @param ds: docstore.Docstore
+    @param interval: float Seconds
+    @returns: generator of dicts
+    """
+    functions = status_requests(ds)
+    functions = {name: functions[name] for name in ['indices', 'nodes']}
+    previous = summarize(fetch(functions))
+    start = time.perf_counter()
+    while True:
+        time.sleep(interval)
+        current = summarize(fetch(functions))
+        now = time.perf_counter()
+        result = rates(previous, current, now - start)
+        result['errors'] = current['errors']
+        yield result
+        previous,start = current,now
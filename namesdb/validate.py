@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""Offline validation of CSV rows using definitions.FIELD_DEFINITIONS
+
+Nothing in here talks to Elasticsearch.  See validate_csv.
+"""
+
+from collections import Counter
+from functools import partial
+import itertools
+import logging
+logger = logging.getLogger(__name__)
+import sys
+
+from . import dates
+from . import definitions
+from . import sourcefile
+
+BATCH_SIZE = 1000    # rows checked at a time when reading stdin
+MAX_EXAMPLES = 10    # examples listed per error type in report
+
+
+def check_value(field, value, fmt=None):
+    """Check value against field type in definitions.FIELD_DEFINITIONS
+
+    >>> check_value('m_birthyear', '1921')
+    >>> check_value('m_birthyear', 'abc')
+    'number'
+
+    @param field: str
+    @param value: str
+    @param fmt: str (optional) Date format (see dates.infer_formats)
+    @returns: str error type or None
+    """
+    fielddef = definitions.FIELD_DEFINITIONS.get(field)
+    if not fielddef:
+        return None
+    if not value:
+        if fielddef.get('required'):
+            return 'required'
+        return None
+    if fielddef['type'] == 'number':
+        if not value.isdigit():
+            return 'number'
+    elif fielddef['type'] == 'date':
+        if not dates.normalizer(fmt).parse(value):
+            return 'date'
+    return None
+
+def check_rows(fields, headers, formats, rows):
+    """Check a list of rows
+
+    Runs in the worker processes that parse the file (see
+    sourcefile.iter_csv_chunks).  Each process keeps its own date cache.
+    Rows are numbered from 1; Report.add adds the number of rows before.
+
+    @param fields: list of field names for the dataset
+    @param headers: dict of field name -> column number (sourcefile.map_headers)
+    @param formats: dict of date field name -> format (dates.infer_formats)
+    @param rows: list of rows
+    @returns: list of (n, m_pseudoid, errors) where errors=[(field,err,value)]
+    """
+    results = []
+    num_cols = len(headers)
+    pseudoid_col = headers.get('m_pseudoid')
+    for n,row in enumerate(rows, start=1):
+        errors = []
+        if len(row) != num_cols:
+            errors.append(('', 'columns', str(len(row))))
+            results.append((n, None, errors))
+            continue
+        for field in fields:
+            value = row[headers[field]]
+            err = check_value(field, value, formats.get(field))
+            if err:
+                errors.append((field, err, value))
+        if pseudoid_col is not None:
+            m_pseudoid = row[pseudoid_col]
+        else:
+            m_pseudoid = None
+        results.append((n, m_pseudoid, errors))
+    return results
+
+def batches(rows, size=BATCH_SIZE):
+    """Group rows into lists
+
+    @param rows: iterable of rows (header row already removed)
+    @param size: int
+    @returns: generator of lists
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Report():
+    """Accumulates results of check_rows
+    """
+
+    def __init__(self, csvpath, dataset):
+        self.csvpath = csvpath
+        self.dataset = dataset
+        self.rows = 0
+        self.missing_headers = []
+        self.extra_headers = []
+        self.counts = Counter()
+        self.examples = {}
+        self.duplicates = []
+        self._pseudoids = set()
+
+    def ok(self):
+        return not (
+            self.missing_headers or self.extra_headers
+            or self.counts or self.duplicates
+        )
+
+    def add(self, results):
+        """Add results of one check_rows call, in file order
+        """
+        offset = self.rows
+        for n,m_pseudoid,errors in results:
+            n += offset
+            self.rows += 1
+            for field,err,value in errors:
+                key = (field,err)
+                self.counts[key] += 1
+                examples = self.examples.setdefault(key, [])
+                if len(examples) < MAX_EXAMPLES:
+                    examples.append((n, value))
+            if m_pseudoid:
+                if m_pseudoid in self._pseudoids:
+                    self.duplicates.append((n, m_pseudoid))
+                else:
+                    self._pseudoids.add(m_pseudoid)
+
+    def format(self):
+        """Compact plain-text report
+        @returns: list of lines
+        """
+        lines = [
+            'File:    %s' % self.csvpath,
+            'Dataset: %s' % self.dataset,
+            'Rows:    %s' % self.rows,
+        ]
+        if self.missing_headers:
+            lines.append('Missing header(s): %s' % ', '.join(self.missing_headers))
+        if self.extra_headers:
+            lines.append('Extra header(s): %s' % ', '.join(self.extra_headers))
+        for (field,err),count in sorted(self.counts.items()):
+            examples = ', '.join([
+                'row:%s "%s"' % (n,value) for n,value in self.examples[(field,err)]
+            ])
+            lines.append('%s %s: %s (%s)' % (field, err, count, examples))
+        if self.duplicates:
+            lines.append('Duplicate m_pseudoid: %s (%s)' % (
+                len(self.duplicates),
+                ', '.join([
+                    'row:%s %s' % (n,m_pseudoid)
+                    for n,m_pseudoid in self.duplicates[:MAX_EXAMPLES]
+                ])
+            ))
+        if self.ok():
+            lines.append('ok')
+        return lines
+
+
+def validate_csv(csvpath, dataset=None, processes=None):
+    """Check CSV file without loading it into Elasticsearch
+    
+    Verifies headers, checks each field value against its type in
+    definitions.FIELD_DEFINITIONS, and finds duplicate m_pseudoids
+    (which would overwrite each other in the index).
+    Rows are checked in the same worker processes that parse them (see
+    sourcefile.iter_csv_chunks).  Stdin can only be read once so it is
+    checked in this process.
+    
+    @param csvpath: str Absolute path to CSV file
+    @param dataset: str (optional) Dataset name if not in filename
+    @param processes: int Number of worker processes (default: all CPUs)
+    @returns: Report
+    """
+    sourcefile.check_csvpath(csvpath, dataset)
+    if not dataset:
+        dataset = sourcefile.dataset_from_path(csvpath)
+    if not dataset in definitions.DATASETS.keys():
+        logging.error('ddr-import: unknown dataset: %s.' % dataset)
+        sys.exit(1)
+    fields = definitions.DATASETS[dataset]
+    report = Report(csvpath, dataset)
+    
+    rows = sourcefile.iter_csv(csvpath)
+    header_row = next(rows)
+    missing,extra = sourcefile.verify_headers(fields, header_row)
+    report.missing_headers,report.extra_headers = missing,extra
+    if report.missing_headers:
+        # can't check fields that aren't there
+        rows.close()
+        return report
+    headers = sourcefile.map_headers(header_row)
+    
+    sample = list(itertools.islice(rows, dates.SAMPLE_SIZE))
+    date_formats = dates.infer_formats(fields, headers, sample)
+    
+    check = partial(check_rows, fields, headers, date_formats)
+    if csvpath == sourcefile.STDIN:
+        chunks = (check(batch) for batch in batches(itertools.chain(sample, rows)))
+    else:
+        rows.close()
+        chunks = sourcefile.iter_csv_chunks(csvpath, processes, func=check)
+        next(chunks)  # header
+    # chunks are in file order so first duplicate wins
+    for results in chunks:
+        report.add(results)
+    return report
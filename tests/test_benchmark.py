@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmark
+----------------------------------
+
+Tests for `namesdb.benchmark` module.
+"""
+
+import os
+import tempfile
+import unittest
+
+from namesdb import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile(values, 100), 100)
+        self.assertEqual(benchmark.percentile([], 50), None)
+
+    def test_run(self):
+        seen = []
+        def search(query):
+            if query == 'bad':
+                raise ValueError(query)
+            seen.append(query)
+        summary = benchmark.run(search, ['yano', 'takei', 'bad'], clients=3, repeat=2)
+        self.assertEqual(summary['searches'], 12)
+        self.assertEqual(summary['errors'], 6)
+        self.assertEqual(sorted(set(seen)), ['takei', 'yano'])
+        self.assertTrue(summary['p50_ms'] <= summary['p99_ms'] <= summary['max_ms'])
+
+    def test_save(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bench.jsonl')
+        summary = benchmark.summarize([0.01, 0.02, 0.03], 0, 0.06)
+        benchmark.save(path, summary, 'before', target='memory')
+        benchmark.save(path, summary, 'after', target='memory')
+        results = benchmark.load(path)
+        self.assertEqual([r['label'] for r in results], ['before', 'after'])
+        self.assertEqual(results[0]['p95_ms'], 30.0)
+        lines = benchmark.format_results(results)
+        self.assertEqual(len(lines), 3)
+        self.assertIn('before', lines[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
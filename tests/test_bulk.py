@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_bulk
+----------------------------------
+
+Tests for `namesdb.bulk` module.
+"""
+
+import json
+import time
+import unittest
+
+from namesdb import bulk
+
+
+class FakeSerializer():
+    def dumps(self, data):
+        return json.dumps(data)
+
+class FakeTransport():
+    serializer = FakeSerializer()
+
+class FakeES():
+    """Rejects every other document in the first `reject` requests
+    """
+    transport = FakeTransport()
+
+    def __init__(self, reject=0):
+        self.reject = reject
+        self.requests = []
+        self.saved = set()
+
+    def bulk(self, body):
+        lines = body.strip().split('\n')
+        actions = [json.loads(line) for line in lines[::2]]
+        self.requests.append(len(actions))
+        items = []
+        for n,action in enumerate(actions):
+            _id = action['index']['_id']
+            if (len(self.requests) <= self.reject) and (n % 2):
+                items.append({'index': {'_id': _id, 'status': 429}})
+            else:
+                self.saved.add(_id)
+                items.append({'index': {'_id': _id, 'status': 201}})
+        return {'errors': False, 'items': items}
+
+class SlowES(FakeES):
+    def bulk(self, body):
+        time.sleep(0.01)
+        return super().bulk(body)
+
+class BrokenES(FakeES):
+    def bulk(self, body):
+        raise ConnectionError('cluster down')
+
+
+def make_actions(num):
+    return [
+        ({'index': {'_index': 'test', '_id': str(n)}}, {'n': n})
+        for n in range(num)
+    ]
+
+
+class TestBulk(unittest.TestCase):
+
+    def test_increase(self):
+        es = FakeES()
+        writer = bulk.AdaptiveBulkWriter(
+            es, min_batch=10, max_batch=50, max_concurrency=1
+        )
+        summary = writer.write(make_actions(500))
+        self.assertEqual(summary['docs'], 500)
+        self.assertEqual(len(es.saved), 500)
+        # grows by BATCH_STEP, capped at max_batch
+        self.assertEqual(es.requests[:3], [10, 50, 50])
+
+    def test_rejections(self):
+        es = FakeES(reject=3)
+        writer = bulk.AdaptiveBulkWriter(
+            es, min_batch=10, max_batch=100, max_concurrency=2
+        )
+        summary = writer.write(make_actions(300))
+        self.assertEqual(summary['docs'], 300)
+        self.assertEqual(summary['errors'], 0)
+        self.assertTrue(summary['rejections'] > 0)
+        self.assertEqual(len(es.saved), 300)
+        self.assertIn('300 docs', bulk.format_summary(summary))
+
+    def test_fanout(self):
+        fast,slow,broken = FakeES(),SlowES(reject=2),BrokenES()
+        writer = bulk.FanoutWriter(
+            [fast, slow, broken], buffer_size=50, min_batch=10, max_batch=50
+        )
+        summaries = writer.write(iter(make_actions(500)))
+        self.assertEqual(len(fast.saved), 500)
+        self.assertEqual(len(slow.saved), 500)
+        self.assertEqual([s['docs'] for s in summaries], [500, 500, 0])
+        self.assertEqual(summaries[0]['failed'], None)
+        self.assertIn('cluster down', summaries[2]['failed'])
+        self.assertIn('FAILED', bulk.format_summary(summaries[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_bulkfile
+----------------------------------
+
+Tests for `namesdb.bulkfile` module.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from namesdb import bulkfile
+
+bulkfile.RETRY_WAIT = 0
+
+
+class FakeES():
+    """Rejects the first document of each of the first `reject` requests
+    """
+
+    def __init__(self, reject=0):
+        self.reject = reject
+        self.requests = 0
+        self.saved = {}
+
+    def bulk(self, body, index):
+        self.requests += 1
+        lines = body.strip().split(b'\n')
+        items = []
+        for n in range(0, len(lines), 2):
+            _id = json.loads(lines[n])['index']['_id']
+            if (self.requests <= self.reject) and (n == 0):
+                items.append({'index': {'_id': _id, 'status': 429}})
+            else:
+                self.saved[_id] = (index, json.loads(lines[n+1]))
+                items.append({'index': {'_id': _id, 'status': 201}})
+        return {'errors': False, 'items': items}
+
+
+def make_actions(num):
+    return [
+        ({'index': {'_index': 'namesdbrecord-far', '_id': str(n)}}, {'n': n})
+        for n in range(num)
+    ]
+
+
+class TestBulkFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outdir = os.path.join(self.tmpdir.name, 'far-manzanar')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def emit(self, compress):
+        writer = bulkfile.BulkFileWriter(self.outdir, compress, chunk_docs=10)
+        writer.write('record-far', make_actions(25))
+        writer.write('stats', [({'index': {'_id': 'far-manzanar'}}, {'records': 25})])
+        return writer.write_manifest(dataset='far-manzanar')
+
+    def test_manifest(self):
+        self.emit(compress=True)
+        manifest = bulkfile.read_manifest(self.outdir)
+        self.assertEqual(manifest['dataset'], 'far-manzanar')
+        self.assertEqual(
+            [(c['file'], c['docs']) for c in manifest['chunks']],
+            [('record-far-00000.ndjson.gz', 10), ('record-far-00001.ndjson.gz', 10),
+             ('record-far-00002.ndjson.gz', 5), ('stats-00000.ndjson.gz', 1)],
+        )
+        self.assertEqual(bulkfile.verify(self.outdir), [])
+        # no _index in actions
+        data = bulkfile.read_chunk(self.outdir, manifest['chunks'][0])
+        self.assertEqual(json.loads(data.split(b'\n')[0]), {'index': {'_id': '0'}})
+
+    def test_verify(self):
+        self.emit(compress=False)
+        with open(os.path.join(self.outdir, 'record-far-00001.ndjson'), 'a') as f:
+            f.write('{}\n')
+        os.remove(os.path.join(self.outdir, 'stats-00000.ndjson'))
+        self.assertEqual(bulkfile.verify(self.outdir), [
+            'checksum mismatch: record-far-00001.ndjson',
+            'missing: stats-00000.ndjson',
+        ])
+
+    def test_load(self):
+        self.emit(compress=True)
+        es = FakeES(reject=2)
+        loader = bulkfile.BulkFileLoader(es, lambda model: 'test' + model, workers=2)
+        summary = loader.load(self.outdir)
+        self.assertEqual(summary['docs'], 26)
+        self.assertEqual(summary['rejections'], 2)
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(len(es.saved), 26)
+        self.assertEqual(es.saved['7'], ('testrecord-far', {'n': 7}))
+        self.assertEqual(es.saved['far-manzanar'], ('teststats', {'records': 25}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------------------------------
+
+Tests for `namesdb.cache` module.
+"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+FIELDS = ['m_dataset', 'm_pseudoid', 'm_camp', 'm_lastname']
+REJECTS = [{'n': 3, 'm_pseudoid': 'c', 'error': 'invalid',
+            'field': 'm_birthyear', 'value': '19x2'}]
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('elasticsearch_dsl'), 'elasticsearch_dsl not installed'
+)
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvpath = os.path.join(self.tmpdir, 'far-manzanar.csv')
+        with open(self.csvpath, 'w') as f:
+            f.write('"m_dataset","m_pseudoid","m_camp","m_lastname"\r\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_cache(self, dataset='far-manzanar'):
+        from namesdb import cache
+        from namesdb import models
+        records = [
+            models.RecordRow(FIELDS, (dataset, 'a', '7-manzanar', 'Yano')),
+            models.RecordRow(FIELDS, (dataset, 'b', '7-manzanar', None), ('x:y',)),
+        ]
+        key = cache.cache_key(self.csvpath, dataset, FIELDS)
+        cache.write(self.csvpath, key, FIELDS, records, REJECTS)
+        return records
+
+    def test_round_trip(self):
+        from namesdb import cache
+        records = self.write_cache()
+        key = cache.cache_key(self.csvpath, 'far-manzanar', FIELDS)
+        cached,rejects = cache.read(self.csvpath, key)
+        self.assertEqual(
+            [(r.values, r.errors) for r in cached],
+            [(r.values, r.errors) for r in records],
+        )
+        self.assertEqual(cached[0].get('m_lastname'), 'Yano')
+        self.assertEqual(rejects, REJECTS)
+
+    def test_invalidation(self):
+        from namesdb import cache
+        self.write_cache()
+        # other dataset
+        key = cache.cache_key(self.csvpath, 'far-poston', FIELDS)
+        self.assertEqual(cache.read(self.csvpath, key), None)
+        # other fields
+        key = cache.cache_key(self.csvpath, 'far-manzanar', FIELDS[:-1])
+        self.assertEqual(cache.read(self.csvpath, key), None)
+        # file changed
+        with open(self.csvpath, 'a') as f:
+            f.write('"far-manzanar","a","7-manzanar","Yano"\r\n')
+        key = cache.cache_key(self.csvpath, 'far-manzanar', FIELDS)
+        self.assertEqual(cache.read(self.csvpath, key), None)
+
+    def test_no_cache(self):
+        from namesdb import cache
+        key = cache.cache_key(self.csvpath, 'far-manzanar', FIELDS)
+        self.assertEqual(cache.read(self.csvpath, key), None)
+        with open(cache.cache_path(self.csvpath), 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertEqual(cache.read(self.csvpath, key), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cli
+----------------------------------
+
+Tests for `namesdb.cli` module.
+"""
+
+import importlib.util
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = [
+    'elasticsearch', 'elasticsearch_dsl', 'elastictools',
+    'namesdb.definitions', 'namesdb.docstore', 'namesdb.models',
+    'namesdb.publish',
+]
+
+
+class TestStartup(unittest.TestCase):
+
+    @unittest.skipUnless(importlib.util.find_spec('click'), 'click not installed')
+    def test_import_is_light(self):
+        """Importing cli must not load Elasticsearch, definitions, or configs
+        """
+        code = 'import sys, namesdb.cli; print(" ".join(sys.modules))'
+        out = subprocess.check_output([sys.executable, '-c', code])
+        modules = out.decode('utf-8').split()
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
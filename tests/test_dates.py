@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_dates
+----------------------------------
+
+Tests for `namesdb.dates` module.
+"""
+
+from datetime import date
+import unittest
+
+from namesdb import dates
+
+
+class TestDates(unittest.TestCase):
+
+    def test_infer_format(self):
+        self.assertEqual(
+            dates.infer_format(['01/02/1943', '12/25/1944', '']), '%m/%d/%Y'
+        )
+        self.assertEqual(
+            dates.infer_format(['25-12-1944', '01-02-1943']), '%d-%m-%Y'
+        )
+        self.assertEqual(dates.infer_format(['nope']), None)
+
+    def test_infer_formats(self):
+        fields = ['m_pseudoid', 'f_entrydate']
+        headers = {'m_pseudoid': 0, 'f_entrydate': 1}
+        rows = [['a', '1943-01-02'], ['b', ''], ['c']]
+        self.assertEqual(
+            dates.infer_formats(fields, headers, rows),
+            {'f_entrydate': '%Y-%m-%d'}
+        )
+
+    def test_normalizer(self):
+        normalizer = dates.DateNormalizer('%d-%m-%Y')
+        self.assertEqual(normalizer.parse('25-12-1944'), date(1944,12,25))
+        self.assertEqual(normalizer.isoformat('25-12-1944'), '1944-12-25')
+        normalizer.parse('25-12-1944')
+        self.assertEqual(normalizer.parse.cache_info().hits, 2)
+
+    def test_normalize_rowd(self):
+        rowd = {'f_entrydate': '12/25/1944', 'f_departuredate': ''}
+        dates.normalize_rowd(
+            rowd, {'f_entrydate': '%m/%d/%Y', 'f_departuredate': '%m/%d/%Y'}
+        )
+        self.assertEqual(
+            rowd, {'f_entrydate': '1944-12-25', 'f_departuredate': ''}
+        )
+        rowd = {'f_entrydate': 'bogus'}
+        dates.normalize_rowd(rowd, {'f_entrydate': '%m/%d/%Y'})
+        self.assertEqual(rowd, {'f_entrydate': 'bogus'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_docstore
+----------------------------------
+
+Tests for `namesdb.docstore` module.
+"""
+
+import importlib.util
+import unittest
+from unittest import mock
+
+HAS_DOCSTORE = all([
+    importlib.util.find_spec(module)
+    for module in ['elasticsearch', 'elasticsearch_dsl', 'elastictools']
+])
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestDocstore(unittest.TestCase):
+
+    def test_make_hosts(self):
+        from namesdb import docstore
+        self.assertEqual(
+            docstore.make_hosts('es1:9200'), [{'host': 'es1', 'port': '9200'}]
+        )
+        self.assertEqual(
+            docstore.make_hosts('es1:9200,es2:9201', pool_size=4),
+            [{'host': 'es1', 'port': '9200', 'maxsize': 4},
+             {'host': 'es2', 'port': '9201', 'maxsize': 4}]
+        )
+
+    def test_operation(self):
+        from namesdb import docstore
+        for method,url,op in [
+                ('POST', '/_bulk', 'bulk'),
+                ('POST', '/namesdbrecord/_search', 'search'),
+                ('POST', '/namesdbrecord/_count', 'search'),
+                ('POST', '/namesdbrecord-far/_delete_by_query', 'delete'),
+                ('DELETE', '/namesdbstats/_doc/far-manzanar', 'delete'),
+                ('HEAD', '/namesdbrecord-far/_doc/far-manzanar:abc', 'get'),
+                ('POST', '/_mget', 'get'),
+                ('GET', '/_cluster/health', 'status'),
+                ('GET', '/_tasks/abc:123', 'status'),
+                ('GET', '/', 'status'),
+                ('PUT', '/namesdbstats/_doc/far-manzanar', 'index'),
+        ]:
+            self.assertEqual(docstore.operation(method, url), op, url)
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestRetryTransport(unittest.TestCase):
+
+    def setUp(self):
+        from namesdb import docstore
+        self.docstore = docstore
+        self.waits = []
+        patches = [
+            mock.patch.object(docstore.time, 'sleep', self.waits.append),
+            mock.patch.object(docstore.random, 'uniform', lambda a, b: b),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def transport(self, responses, **kwargs):
+        """RetryTransport whose requests fail or return in turn
+        """
+        from elasticsearch import Transport
+        self.calls = []
+        responses = list(responses)
+        def perform_request(transport, method, url, headers=None, params=None, body=None):
+            self.calls.append((method, url, params))
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        patch = mock.patch.object(Transport, 'perform_request', perform_request)
+        patch.start()
+        self.addCleanup(patch.stop)
+        return self.docstore.RetryTransport(
+            [{'host': 'localhost', 'port': 9200}], **kwargs
+        )
+
+    def test_retry_statuses(self):
+        from elasticsearch import TransportError
+        for status in [429, 502, 503, 504]:
+            self.waits.clear()
+            transport = self.transport(
+                [TransportError(status, 'busy', {}), {'ok': True}], retries=2
+            )
+            self.assertEqual(transport.perform_request('POST', '/_bulk'), {'ok': True})
+            self.assertEqual(len(self.calls), 2)
+            self.assertEqual(self.waits, [0.5])
+
+    def test_connection_error(self):
+        from elasticsearch import ConnectionError
+        err = ConnectionError('N/A', 'connection refused', Exception())
+        transport = self.transport([err, err, {'ok': True}], retries=2, backoff=1)
+        self.assertEqual(transport.perform_request('GET', '/_search'), {'ok': True})
+        self.assertEqual(self.waits, [1, 2])
+
+    def test_gives_up(self):
+        from elasticsearch import NotFoundError, TransportError
+        transport = self.transport([TransportError(429, 'busy', {})] * 3, retries=2)
+        self.assertRaises(TransportError, transport.perform_request, 'POST', '/_bulk')
+        self.assertEqual(len(self.calls), 3)
+        # other errors are not retried
+        transport = self.transport([NotFoundError(404, 'not found', {})])
+        self.assertRaises(NotFoundError, transport.perform_request, 'GET', '/x/_doc/1')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_backoff_cap(self):
+        from elasticsearch import TransportError
+        transport = self.transport(
+            [TransportError(503, 'unavailable', {})] * 6 + [{'ok': True}],
+            retries=6, backoff=4,
+        )
+        transport.perform_request('POST', '/_bulk')
+        self.assertEqual(
+            self.waits, [4, 8, 16] + [self.docstore.RETRY_BACKOFF_MAX] * 3
+        )
+
+    def test_timeouts(self):
+        transport = self.transport([{}] * 4, timeouts={'search': 5})
+        transport.perform_request('POST', '/namesdbrecord/_search')
+        transport.perform_request('POST', '/_bulk')
+        transport.perform_request('PUT', '/namesdbstats/_doc/x')
+        transport.perform_request('GET', '/_search', params={'request_timeout': 1})
+        self.assertEqual(
+            [params['request_timeout'] for method,url,params in self.calls],
+            [5, self.docstore.DOCSTORE_TIMEOUTS['bulk'],
+             self.docstore.DOCSTORE_TIMEOUTS['index'], 1]
+        )
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestFastJSONSerializer(unittest.TestCase):
+
+    DATA = {'m_lastname': 'Yano', 'n': [1, 2.5, None]}
+
+    def check(self, serializer):
+        from namesdb import docstore
+        text = serializer.dumps(self.DATA)
+        self.assertIsInstance(text, str)
+        self.assertEqual(serializer.loads(text), self.DATA)
+        self.assertGreaterEqual(docstore.TIMINGS.loads, 0.0)
+        # strings are passed through
+        self.assertEqual(serializer.dumps('{"a": 1}'), '{"a": 1}')
+
+    def test_without_orjson(self):
+        from namesdb import docstore
+        with mock.patch.object(docstore, 'orjson', None):
+            self.check(docstore.FastJSONSerializer())
+
+    @unittest.skipUnless(importlib.util.find_spec('orjson'), 'orjson not installed')
+    def test_orjson(self):
+        from namesdb import docstore
+        self.assertIsNotNone(docstore.orjson)
+        self.check(docstore.FastJSONSerializer())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_family
+----------------------------------
+
+Tests for `namesdb.family` module.
+"""
+
+import os
+import unittest
+
+from namesdb import family
+
+
+class Row():
+    """Stand-in for models.RecordRow
+    """
+    def __init__(self, **values):
+        self.values = values
+
+    def get(self, field, default=None):
+        return self.values.get(field, default)
+
+
+def make_rows(num_families, size):
+    rows = []
+    for f in range(num_families):
+        for i in range(size):
+            rows.append(Row(
+                m_dataset='wra-master', m_pseudoid='%s_%s' % (f, i),
+                m_familyno=str(f), m_individualno=str(i), m_birthyear='1900',
+                m_lastname='Yano',
+            ))
+    return rows
+
+
+class TestFamily(unittest.TestCase):
+
+    def test_record_families(self):
+        row = Row(m_dataset='far-manzanar', m_familyno='12', m_altfamilyid='34')
+        self.assertEqual(
+            family.record_families(row), ['far-manzanar:12', 'far-manzanar:34']
+        )
+        row = Row(m_dataset='far-manzanar', m_familyno=' ')
+        self.assertEqual(family.record_families(row), [])
+
+    def test_grouper(self):
+        grouper = family.FamilyGrouper()
+        for row in make_rows(5, 3):
+            grouper.add(row)
+        families = dict(grouper.families())
+        self.assertEqual(len(families), 5)
+        self.assertEqual(grouper.spills, 0)
+        self.assertEqual(len(families['wra-master:2']), 3)
+
+    def test_spill(self):
+        grouper = family.FamilyGrouper(max_members=7, partitions=4)
+        for row in reversed(make_rows(10, 4)):
+            grouper.add(row)
+        self.assertTrue(grouper.spills > 1)
+        spilldir = grouper.spilldir
+        families = dict(grouper.families())
+        self.assertFalse(os.path.exists(spilldir))
+        self.assertEqual(len(families), 10)
+        source = family.family_source('wra-master:3', families['wra-master:3'])
+        self.assertEqual(source['member_count'], 4)
+        self.assertEqual(source['member_ids'], [
+            'wra-master:3_0', 'wra-master:3_1', 'wra-master:3_2', 'wra-master:3_3'
+        ])
+        self.assertEqual(source['members'][0]['m_individualno'], '0')
+        self.assertEqual(len(family.format_family(source)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_link
+----------------------------------
+
+Tests for `namesdb.link` module.
+"""
+
+import unittest
+
+from namesdb import link
+
+SOURCES = {
+    'far-manzanar:7-manzanar_yano_1922_taro': {
+        'm_dataset': 'far-manzanar', 'm_lastname': 'Yano', 'm_firstname': 'Taro',
+        'm_birthyear': '1922', 'm_gender': 'M', 'm_camp': '7-manzanar',
+    },
+    'wra-master:7-manzanar_yano_1923_taro': {
+        'm_dataset': 'wra-master', 'm_lastname': 'YANO', 'm_firstname': 'Taro',
+        'm_birthyear': '1923', 'm_gender': 'M', 'm_camp': '7-manzanar',
+    },
+    'wra-master:7-manzanar_yano_1923_hana': {
+        'm_dataset': 'wra-master', 'm_lastname': 'Yano', 'm_firstname': 'Hana',
+        'm_birthyear': '1923', 'm_gender': 'F', 'm_camp': '7-manzanar',
+    },
+    'far-poston:2-poston_abe_1901_jiro': {
+        'm_dataset': 'far-poston', 'm_lastname': 'Abe', 'm_firstname': 'Jiro',
+        'm_birthyear': '1901', 'm_gender': 'M', 'm_camp': '2-poston',
+    },
+}
+
+
+class TestLink(unittest.TestCase):
+
+    def test_normalize_name(self):
+        self.assertEqual(link.normalize_name('Ōhashi '), 'ohashi')
+        self.assertEqual(link.normalize_name(None), '')
+
+    def test_blocks(self):
+        records = [link.make_linkrecord(k,v) for k,v in SOURCES.items()]
+        blocks,skipped = link.make_blocks(records)
+        self.assertEqual(skipped, 0)
+        # abe is alone in all its blocks
+        for block in blocks:
+            self.assertNotIn('abe', [rec[link.LASTNAME] for rec in block])
+
+    def test_link(self):
+        records = [link.make_linkrecord(k,v) for k,v in SOURCES.items()]
+        blocks,skipped = link.make_blocks(records)
+        pairs = {}
+        for block in blocks:
+            for a,b,s in link.score_block(block):
+                pairs[(a,b)] = s
+        self.assertEqual(list(pairs.keys()), [(
+            'far-manzanar:7-manzanar_yano_1922_taro',
+            'wra-master:7-manzanar_yano_1923_taro',
+        )])
+        clusters = link.clusters(SOURCES.keys(), pairs.keys())
+        self.assertEqual(
+            clusters['wra-master:7-manzanar_yano_1923_taro'],
+            'far-manzanar:7-manzanar_yano_1922_taro'
+        )
+        self.assertEqual(len(set(clusters.values())), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
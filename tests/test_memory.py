@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_memory
+----------------------------------
+
+Tests for `namesdb.memory` module.
+"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from namesdb import bulk
+from namesdb import memory
+
+HAS_DOCSTORE = all([
+    importlib.util.find_spec(module)
+    for module in ['elasticsearch', 'elasticsearch_dsl', 'elastictools']
+])
+
+DOCS = {
+    'a': {'m_lastname': 'Yano', 'm_firstname': 'Taro', 'm_pseudoid': 'c', 'm_linkid': 'a'},
+    'b': {'m_lastname': 'Yano', 'm_firstname': 'Hana', 'm_pseudoid': 'a', 'm_linkid': 'b'},
+    'c': {'m_lastname': 'Abe', 'm_firstname': 'Taro', 'm_pseudoid': 'b', 'm_linkid': 'a'},
+}
+
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.es = memory.MemoryElasticsearch()
+        self.es.indices['test'] = DOCS
+
+    def ids(self, body):
+        response = self.es.search(index='test', body=body)
+        return [hit['_id'] for hit in response['hits']['hits']]
+
+    def test_multi_match(self):
+        body = {
+            'query': {'multi_match': {'query': 'yano', 'fields': ['m_lastname']}},
+            'sort': ['m_pseudoid'],
+        }
+        self.assertEqual(self.ids(body), ['b', 'a'])
+        body['collapse'] = {'field': 'm_linkid'}
+        body['query']['multi_match']['query'] = 'taro yano'
+        body['query']['multi_match']['fields'] = ['m_lastname', 'm_firstname']
+        self.assertEqual(self.ids(body), ['b', 'c'])
+
+    def test_bool_term(self):
+        body = {'query': {'bool': {'must': [
+            {'bool': {'should': [
+                {'term': {'m_firstname': {'value': 'Taro', 'boost': 2}}},
+                {'term': {'m_lastname': 'Taro'}},
+            ], 'minimum_should_match': 1}},
+        ]}}, 'sort': [{'m_pseudoid': {'order': 'desc'}}], 'size': 1}
+        response = self.es.search(index='test', body=body)
+        self.assertEqual(response['hits']['total']['value'], 2)
+        self.assertEqual([h['_id'] for h in response['hits']['hits']], ['a'])
+
+    def test_source(self):
+        body = {'query': {'match_all': {}}, '_source': ['m_lastname']}
+        response = self.es.search(index='test', body=body)
+        for hit in response['hits']['hits']:
+            self.assertEqual(list(hit['_source'].keys()), ['m_lastname'])
+
+
+def bulk_body(actions):
+    return [line for action in actions for line in action]
+
+def make_actions(num, index='testrecord-far'):
+    return [
+        (
+            {'index': {'_index': index, '_id': 'far-test:%s' % n}},
+            {'m_dataset': 'far-test', 'm_camp': ['a', 'b', 'c'][n % 3], 'n': n},
+        )
+        for n in range(num)
+    ]
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.es = memory.MemoryElasticsearch()
+        for family in ['far', 'wra']:
+            self.es.indices.create(
+                index='testrecord-%s' % family,
+                body={'aliases': {'testrecord': {}}},
+            )
+
+    def test_indices(self):
+        self.assertTrue(self.es.indices.exists(index='testrecord'))
+        self.assertTrue(self.es.indices.exists_alias(name='testrecord'))
+        self.assertFalse(self.es.indices.exists(index='testfamily'))
+        self.assertEqual(
+            self.es.indices.resolve('test*'), ['testrecord-far', 'testrecord-wra']
+        )
+        self.es.indices.delete(index='testrecord-wra')
+        self.assertEqual(self.es.indices.aliases, {'testrecord': ['testrecord-far']})
+        self.es.indices.delete(index='testrecord-wra', ignore=404)
+        self.assertRaises(
+            memory.NotFoundError, self.es.indices.delete, index='testrecord-wra'
+        )
+
+    def test_bulk(self):
+        writer = bulk.AdaptiveBulkWriter(self.es, min_batch=10, max_batch=20)
+        summary = writer.write(make_actions(50))
+        self.assertEqual(summary['docs'], 50)
+        self.assertEqual(self.es.requests['bulk'], summary['batches'])
+        response = self.es.bulk(body=(
+            '{"update": {"_index": "testrecord-far", "_id": "far-test:1"}}\n'
+            '{"doc": {"m_linkid": "x"}}\n'
+            '{"delete": {"_index": "testrecord-far", "_id": "far-test:2"}}\n'
+            '{"update": {"_index": "testrecord-far", "_id": "nope"}}\n'
+            '{"doc": {"m_linkid": "x"}}\n'
+        ))
+        self.assertTrue(response['errors'])
+        self.assertEqual(
+            [list(item.values())[0]['status'] for item in response['items']],
+            [200, 200, 404],
+        )
+        doc = self.es.get(index='testrecord', id='far-test:1')
+        self.assertEqual(doc['_index'], 'testrecord-far')
+        self.assertEqual(doc['_source']['m_linkid'], 'x')
+        self.assertRaises(
+            memory.NotFoundError, self.es.get, index='testrecord', id='far-test:2'
+        )
+        docs = self.es.mget(body={'ids': ['far-test:3', 'far-test:2']}, index='testrecord')
+        self.assertEqual([d['found'] for d in docs['docs']], [True, False])
+
+    def test_index_delete(self):
+        self.es.index(index='teststats', id='far-test', body={'records': 3})
+        self.assertEqual(
+            self.es.get(index='teststats', id='far-test')['_source'], {'records': 3}
+        )
+        self.es.delete(index='teststats', id='far-test')
+        result = self.es.delete(index='teststats', id='far-test', ignore=404)
+        self.assertEqual(result['result'], 'not_found')
+
+    def test_aggregations(self):
+        self.es.bulk(body=bulk_body(make_actions(10)))
+        response = self.es.search(index='testrecord', body={
+            'query': {'bool': {'must_not': [{'term': {'m_camp': 'c'}}]}},
+            'size': 0,
+            'aggs': {'camps': {'terms': {'field': 'm_camp', 'size': 1}}},
+        })
+        self.assertEqual(response['hits']['hits'], [])
+        self.assertEqual(response['hits']['total']['value'], 7)
+        camps = response['aggregations']['camps']
+        self.assertEqual(camps['buckets'], [{'key': 'a', 'doc_count': 4}])
+        self.assertEqual(camps['sum_other_doc_count'], 3)
+
+    def test_scroll_delete_by_query(self):
+        self.es.bulk(body=bulk_body(make_actions(25)))
+        response = self.es.search(
+            index='testrecord', body={'query': {'match': {'m_camp': 'b'}}},
+            scroll='1m', size=3, _source=['n'],
+        )
+        ns = [hit['_source']['n'] for hit in response['hits']['hits']]
+        while True:
+            response = self.es.scroll(scroll_id=response['_scroll_id'], scroll='1m')
+            if not response['hits']['hits']:
+                break
+            ns += [hit['_source']['n'] for hit in response['hits']['hits']]
+        self.es.clear_scroll(scroll_id=response['_scroll_id'])
+        self.assertEqual(sorted(ns), list(range(1, 25, 3)))
+        task = self.es.delete_by_query(
+            index='testrecord', body={'query': {'term': {'m_camp': 'b'}}},
+            wait_for_completion=False,
+        )['task']
+        result = self.es.tasks.get(task_id=task)
+        self.assertTrue(result['completed'])
+        self.assertEqual(result['response']['deleted'], 8)
+        self.assertEqual(self.es.count(index='testrecord')['count'], 17)
+
+    def test_latency(self):
+        es = memory.MemoryElasticsearch(latency={'search': 0.02}, doc_latency=0.001)
+        start = time.perf_counter()
+        es.search(index='x', body={})
+        es.bulk(body=bulk_body(make_actions(20)))
+        elapsed = time.perf_counter() - start
+        self.assertGreaterEqual(elapsed, 0.04)
+        self.assertEqual(es.requests, {'search': 1, 'bulk': 1})
+
+    def test_delete_latency_unlocked(self):
+        """Other requests are not blocked while delete_by_query sleeps
+        """
+        es = memory.MemoryElasticsearch(latency={'delete': 0.5})
+        es.bulk(body=bulk_body(make_actions(10)))
+        thread = threading.Thread(target=es.delete_by_query, kwargs={
+            'index': 'testrecord-far', 'body': {'query': {'match_all': {}}},
+        })
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertTrue(es.lock.acquire(timeout=0.2))
+        es.lock.release()
+        thread.join()
+        self.assertEqual(es.indices['testrecord-far'], {})
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestMemoryDocstore(unittest.TestCase):
+    """Docstore and import pipeline against a MemoryElasticsearch
+    """
+
+    def setUp(self):
+        from namesdb import benchmark
+        from namesdb import definitions
+        from namesdb import sourcefile
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvpath = os.path.join(self.tmpdir, 'far-manzanar.csv')
+        fields = definitions.DATASETS['far-manzanar']
+        rows = []
+        for n in range(30):
+            values = {field: '' for field in fields}
+            values.update({
+                'm_dataset': 'far-manzanar', 'm_camp': '7-manzanar',
+                'm_pseudoid': '7-manzanar_yano_%s' % n, 'm_lastname': 'Yano',
+                'm_firstname': 'Taro', 'm_birthyear': '1922', 'm_gender': 'M',
+            })
+            rows.append([values[field] for field in fields])
+        sourcefile.write_csv(self.csvpath, fields, rows)
+        self.ds = benchmark.memory_docstore([], 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_indices(self):
+        es = self.ds.es
+        self.assertIsInstance(es, memory.MemoryElasticsearch)
+        self.assertEqual(self.ds.dataset_index('far-manzanar'), 'testrecord-far')
+        self.assertTrue(es.indices.exists(index='testrecord-far'))
+        self.assertTrue(es.indices.exists(index=self.ds.index_name('family')))
+
+    def test_import(self):
+        from namesdb import benchmark
+        result = benchmark.time_import(
+            self.ds, self.csvpath, {'min_batch': 5, 'max_batch': 10}
+        )
+        self.assertEqual((result['records'], result['rejects']), (30, 0))
+        es = self.ds.es
+        self.assertEqual(es.count(index='testrecord')['count'], 30)
+        self.assertGreaterEqual(es.requests['bulk'], 3)
+        doc = es.get(index='testrecord', id='far-manzanar:7-manzanar_yano_7')
+        self.assertEqual(doc['_index'], 'testrecord-far')
+        self.assertEqual(doc['_source']['m_firstname'], 'Taro')
+        # loaded directly, as memory_docstore does
+        self.ds = benchmark.memory_docstore([self.csvpath], 'test')
+        self.assertEqual(self.ds.es.requests['bulk'], 0)
+        self.assertEqual(self.ds.es.count(index='testrecord')['count'], 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_models
+----------------------------------
+
+Tests for `namesdb.models` module.
+"""
+
+import importlib.util
+import unittest
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('elasticsearch_dsl'), 'elasticsearch_dsl not installed'
+)
+class TestRecordMapping(unittest.TestCase):
+
+    def test_shared_fields(self):
+        from namesdb import models
+        far = models.record_mapping('far')['properties']
+        wra = models.record_mapping('wra')['properties']
+        for mapping in [far, wra]:
+            self.assertEqual(mapping['m_lastname']['type'], 'text')
+            self.assertEqual(mapping['m_linkid']['type'], 'keyword')
+        shared = lambda mapping: {
+            field: value for field,value in mapping.items()
+            if not field.startswith(('f_', 'w_'))
+        }
+        self.assertEqual(shared(far), shared(wra))
+
+    def test_family_fields(self):
+        from namesdb import models
+        far = models.record_mapping('far')['properties']
+        wra = models.record_mapping('wra')['properties']
+        self.assertFalse([field for field in far if field.startswith('w_')])
+        self.assertFalse([field for field in wra if field.startswith('f_')])
+        self.assertIn('f_campaddress', far)
+        self.assertIn('w_fatheroccupus', wra)
+
+    def test_dataset_family(self):
+        from namesdb import models
+        self.assertEqual(models.dataset_family('wra-master'), 'wra')
+        self.assertRaises(ValueError, models.dataset_family, 'xyz-master')
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('elasticsearch_dsl'), 'elasticsearch_dsl not installed'
+)
+class TestRecord(unittest.TestCase):
+
+    FIELDS = ['m_pseudoid', 'm_lastname', 'f_entrydate', 'f_departuredate']
+
+    def from_dict(self, **data):
+        from namesdb import models
+        data.setdefault('m_pseudoid', 'abc')
+        return models.Record.from_dict(self.FIELDS, 'far-manzanar', 'abc', data)
+
+    def test_dates(self):
+        from namesdb import dates
+        rowd = {'m_lastname': 'Yano', 'f_entrydate': '12/25/1944'}
+        dates.normalize_rowd(rowd, {'f_entrydate': '%m/%d/%Y'})
+        record = self.from_dict(**rowd)
+        self.assertEqual(record.errors, [])
+        self.assertEqual(record.f_entrydate, '1944-12-25')
+        self.assertIn('1944-12-25', record.fulltext.split())
+
+    def test_bad_date(self):
+        record = self.from_dict(
+            m_lastname='Yano', f_entrydate='bogus', f_departuredate='1945-09-01'
+        )
+        self.assertEqual(record.errors, ['f_entrydate:bogus'])
+        self.assertNotIn('f_entrydate', record.to_dict())
+        self.assertNotIn('bogus', record.fulltext)
+        self.assertIn('1945-09-01', record.fulltext.split())
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('elasticsearch_dsl'), 'elasticsearch_dsl not installed'
+)
+class TestRecordRow(unittest.TestCase):
+
+    FIELDS = ['m_dataset', 'm_pseudoid', 'm_camp', 'm_lastname', 'f_entrydate']
+
+    def test_intern_value(self):
+        from namesdb import models
+        camps = [''.join(['7-', 'manzanar']) for n in range(2)]
+        self.assertIsNot(camps[0], camps[1])
+        self.assertIs(
+            models.intern_value('m_camp', camps[0]),
+            models.intern_value('m_camp', camps[1]),
+        )
+        lastnames = [''.join(['Ya', 'no']) for n in range(2)]
+        self.assertIsNot(
+            models.intern_value('m_lastname', lastnames[0]),
+            models.intern_value('m_lastname', lastnames[1]),
+        )
+        self.assertEqual(models.intern_value('m_camp', None), None)
+
+    def test_get(self):
+        from namesdb import models
+        row = models.RecordRow(
+            self.FIELDS, ('far-manzanar', 'abc', '7-manzanar', None, '1944-12-25')
+        )
+        self.assertEqual(row.get('m_pseudoid'), 'abc')
+        self.assertEqual(row.get('f_entrydate'), '1944-12-25')
+        self.assertEqual(row.get('m_lastname', ''), '')
+        self.assertEqual(row.get('w_filenumber', 'x'), 'x')
+        # rows with the same field list share one positions dict
+        other = models.RecordRow(
+            self.FIELDS, ('far-manzanar', 'def', None, 'Abe', None)
+        )
+        self.assertIs(row.positions, other.positions)
+
+    def test_round_trip(self):
+        from namesdb import models
+        record = models.Record.from_dict(self.FIELDS, 'far-manzanar', 'abc', {
+            'm_pseudoid': 'abc', 'm_camp': '7-manzanar', 'm_lastname': 'Yano',
+            'f_entrydate': 'bogus',
+        })
+        row = models.RecordRow.from_record(record, self.FIELDS)
+        self.assertEqual(row.errors, ('f_entrydate:bogus',))
+        self.assertEqual(repr(row), '<Record far-manzanar:abc>')
+        copy = row.to_record()
+        self.assertEqual(copy.meta.id, 'far-manzanar:abc')
+        self.assertEqual(copy.to_dict(), record.to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_names
+----------------------------------
+
+Tests for `namesdb.names` module.
+"""
+
+import unittest
+
+from namesdb import names
+
+
+class TestNames(unittest.TestCase):
+
+    def test_norm_key(self):
+        for variant in ['Ohashi', 'Oohashi', 'Ōhashi', 'OHHASHI', 'Ohashi ']:
+            self.assertEqual(names.norm_key(variant), 'ohashi')
+        for variant in ['Kato', 'Katō', 'Katou', 'Katoh']:
+            self.assertEqual(names.norm_key(variant), 'kato')
+        self.assertEqual(names.norm_key(None), '')
+
+    def test_phon_key(self):
+        self.assertEqual(names.phon_key('Yamamoto'), names.phon_key('Yamamota'))
+        self.assertNotEqual(names.phon_key('Yano'), names.phon_key('Abe'))
+        self.assertEqual(names.soundex(''), '')
+
+    def test_name_keys(self):
+        self.assertEqual(names.name_keys('Ōno'), ('ono', 'O500'))
+        self.assertEqual(names.name_keys('Ohno'), ('ono', 'O500'))
+
+
+if __name__ == '__main__':
+    unittest.main()
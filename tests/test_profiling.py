@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiling
+----------------------------------
+
+Tests for `namesdb.profiling` module.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from namesdb import profiling
+
+PROFILE = {
+    'shards': [{
+        'id': '[node][namesdbrecord][0]',
+        'searches': [{
+            'query': [{
+                'type': 'BooleanQuery',
+                'description': 'm_lastname:yano m_firstname:yano',
+                'time_in_nanos': 2500000,
+                'children': [{
+                    'type': 'TermQuery',
+                    'description': 'm_lastname:yano',
+                    'time_in_nanos': 1000000,
+                }],
+            }],
+            'rewrite_time': 100000,
+            'collector': [{
+                'name': 'SimpleFieldCollector',
+                'reason': 'search_top_hits',
+                'time_in_nanos': 4000000,
+            }],
+        }],
+        'fetch': {
+            'type': 'fetch',
+            'time_in_nanos': 8000000,
+            'children': [{'type': 'FetchSourcePhase', 'time_in_nanos': 6000000}],
+        },
+    }],
+}
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_format_profile(self):
+        lines = profiling.format_profile(PROFILE)
+        self.assertEqual(lines[0], 'shard [node][namesdbrecord][0]')
+        self.assertIn('2.50ms  BooleanQuery', lines[1])
+        self.assertTrue(lines[2].startswith('    query'))
+        self.assertIn('SimpleFieldCollector (search_top_hits)', lines[4])
+        self.assertIn('8.00ms', lines[5])
+        self.assertIn('FetchSourcePhase', lines[6])
+
+    def test_timer(self):
+        timer = profiling.Timer()
+        with timer.time('convert'):
+            pass
+        timer.add('request', 0.5)
+        self.assertEqual(list(timer.timings.keys()), ['convert', 'request'])
+
+    def test_slowlog(self):
+        self.assertFalse(profiling.log_slow('yano', {}, 10.0))
+        path = os.path.join(tempfile.mkdtemp(), 'slow.json')
+        profiling.enable_slowlog(path, threshold=0.5)
+        try:
+            self.assertFalse(profiling.log_slow('yano', {}, 0.1))
+            self.assertTrue(profiling.log_slow(
+                'takei', {'query': {}}, 0.75, took=700, hits=3, page=2
+            ))
+        finally:
+            for handler in list(profiling.slowlog.handlers):
+                handler.close()
+                profiling.slowlog.removeHandler(handler)
+            profiling.SLOWLOG['threshold'] = None
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['query'], 'takei')
+        self.assertEqual(lines[0]['elapsed_ms'], 750.0)
+        self.assertEqual(lines[0]['page'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_publish
+----------------------------------
+
+Tests for `namesdb.publish` module, against a MemoryElasticsearch.
+"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+HAS_DOCSTORE = all([
+    importlib.util.find_spec(module)
+    for module in ['elasticsearch', 'elasticsearch_dsl', 'elastictools']
+])
+
+ROWS = [
+    {'m_pseudoid': '7-manzanar_yano_1922_taro', 'm_lastname': 'Yano',
+     'm_firstname': 'Taro', 'm_birthyear': '1922', 'm_familyno': '1'},
+    {'m_pseudoid': '7-manzanar_yano_1925_hana', 'm_lastname': 'Yano',
+     'm_firstname': 'Hana', 'm_birthyear': '1925', 'm_familyno': '1'},
+    {'m_pseudoid': '7-manzanar_abe_1901_jiro', 'm_lastname': 'Abe',
+     'm_firstname': 'Jiro', 'm_birthyear': '1901', 'm_familyno': '2'},
+]
+
+def write_csv(path, rows):
+    from namesdb import definitions
+    from namesdb import sourcefile
+    fields = definitions.DATASETS['far-manzanar']
+    lines = []
+    for row in rows:
+        values = {field: '' for field in fields}
+        values.update({'m_dataset': 'far-manzanar', 'm_camp': '7-manzanar', 'm_gender': 'M'})
+        values.update(row)
+        lines.append([values[field] for field in fields])
+    sourcefile.write_csv(path, fields, lines)
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestDeleteDataset(unittest.TestCase):
+
+    def setUp(self):
+        from namesdb import benchmark
+        from namesdb import config
+        from namesdb import publish
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvpath = os.path.join(self.tmpdir, 'far-manzanar.csv')
+        write_csv(self.csvpath, ROWS)
+        self.ds = benchmark.memory_docstore([self.csvpath], config.INDEX_PREFIX)
+        self.es = self.ds.es
+        # another dataset's documents are kept
+        self.es.indices['namesdbrecord-far']['far-poston:x'] = {
+            'm_dataset': 'far-poston'
+        }
+        for _id in ['far-manzanar:1', 'far-manzanar:2', 'far-poston:1']:
+            self.es.index(
+                index='namesdbfamily', id=_id, body={'m_dataset': _id.split(':')[0]}
+            )
+        publish.write_stats(self.ds, {'m_dataset': 'far-manzanar', 'records': 3})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertDeleted(self):
+        self.assertEqual(list(self.es.indices['namesdbrecord-far']), ['far-poston:x'])
+        self.assertEqual(list(self.es.indices['namesdbfamily']), ['far-poston:1'])
+        self.assertEqual(self.es.indices['namesdbstats'], {})
+
+    def test_delete_dataset(self):
+        from namesdb import publish
+        tasks = publish.delete_dataset(self.ds, 'far-manzanar', slices=2)
+        self.assertEqual(len(tasks), 2)
+        self.assertDeleted()
+        with self.assertLogs(level='INFO') as logs:
+            response = publish.watch_task(self.ds, tasks[0])
+        self.assertEqual(response['deleted'], 3)
+        self.assertIn('%s done: 3/3 (100.0%%)' % tasks[0], logs.output[0])
+
+    def test_unknown_dataset(self):
+        from namesdb import publish
+        with self.assertLogs(level='ERROR'):
+            self.assertRaises(SystemExit, publish.delete_dataset, self.ds, 'far-nowhere')
+
+    def test_watch_task(self):
+        """Task status is logged until the task completes
+        """
+        from namesdb import publish
+        running = {'completed': False, 'task': {
+            'running_time_in_nanos': 2 * 10**9,
+            'status': {'total': 1000, 'deleted': 250, 'throttled_millis': 500},
+        }}
+        done = {'completed': True, 'task': {
+            'running_time_in_nanos': 4 * 10**9,
+            'status': {'total': 1000, 'deleted': 1000},
+        }, 'response': {'total': 1000, 'deleted': 1000, 'failures': ['oops']}}
+        with mock.patch.object(self.es.tasks, 'get', side_effect=[running, done]):
+            with self.assertLogs(level='INFO') as logs:
+                response = publish.watch_task(self.ds, 'node:1', interval=0)
+        self.assertEqual(response['deleted'], 1000)
+        self.assertEqual(logs.output, [
+            'INFO:root:node:1: 250/1000 (25.0%) 125.0/s, throttled 0.5s',
+            'INFO:root:node:1 done: 1000/1000 (100.0%) 250.0/s',
+            'ERROR:root:node:1: oops',
+        ])
+
+    def test_watch_missing_task(self):
+        from namesdb import publish
+        with self.assertLogs(level='ERROR'):
+            self.assertRaises(SystemExit, publish.watch_task, self.ds, 'node:404')
+
+    def test_format_task_status(self):
+        from namesdb import publish
+        self.assertEqual(
+            publish.format_task_status({'total': 0, 'deleted': 0}, 0),
+            '0/0 (100.0%) 0.0/s'
+        )
+        self.assertEqual(
+            publish.format_task_status(
+                {'total': 10, 'deleted': 5, 'version_conflicts': 2}, 5
+            ),
+            '5/10 (50.0%) 1.0/s, 2 conflicts'
+        )
+
+    @unittest.skipUnless(importlib.util.find_spec('click'), 'click not installed')
+    def test_cli_no_wait(self):
+        from click.testing import CliRunner
+        from namesdb import cli
+        from namesdb import publish
+        args = ['delete', '-H', 'localhost:9200', '--dataset', 'far-manzanar']
+        with mock.patch('namesdb.docstore.get_elasticsearch', return_value=self.es):
+            with mock.patch.object(publish, 'watch_task') as watch_task:
+                result = CliRunner().invoke(cli.namesdb, args + ['--no-wait'])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertFalse(watch_task.called)
+                self.assertDeleted()
+                result = CliRunner().invoke(cli.namesdb, args + ['--slices', '4'])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertEqual(watch_task.call_count, 2)
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestImportRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvpath = os.path.join(self.tmpdir, 'far-manzanar.csv')
+        write_csv(self.csvpath, ROWS)
+        # short row at the end
+        with open(self.csvpath, 'a') as f:
+            f.write('"short"\r\n')
+        self.rejects_path = os.path.join(self.tmpdir, 'rejects.ndjson')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_records_iterator(self):
+        """Rows and row numbers may be iterators
+        """
+        from namesdb import definitions
+        from namesdb import publish
+        from namesdb import sourcefile
+        fields = definitions.DATASETS['far-manzanar']
+        rows = sourcefile.iter_csv(self.csvpath)
+        headers = sourcefile.map_headers(next(rows))
+        records,rejects = publish.load_records(
+            'far-manzanar', fields, headers, rows, row_numbers=iter([5, 7, 9, 11])
+        )
+        self.assertEqual(
+            [r.get('m_pseudoid') for r in records], [row['m_pseudoid'] for row in ROWS]
+        )
+        self.assertEqual(rejects.defective_rows, 1)
+
+    def test_sample(self):
+        from namesdb import definitions
+        from namesdb import publish
+        records,rejects = publish.read_records(
+            self.csvpath, 'far-manzanar', definitions.DATASETS['far-manzanar'],
+            sample_options={'num': 2},
+        )
+        self.assertEqual(
+            [r.get('m_pseudoid') for r in records],
+            [row['m_pseudoid'] for row in ROWS[:2]]
+        )
+        self.assertFalse(rejects)
+
+    def test_short_row(self):
+        """A short row is written to the reject file and the import continues
+        """
+        from namesdb import benchmark
+        from namesdb import config
+        from namesdb import publish
+        from namesdb import rejects
+        ds = benchmark.memory_docstore([], config.INDEX_PREFIX)
+        with self.assertLogs(level='ERROR'):
+            publish.import_records(
+                ds, None, False, self.csvpath, rejects_path=self.rejects_path
+            )
+        self.assertEqual(ds.es.count(index='namesdbrecord')['count'], 3)
+        entries = rejects.read_rejects(self.rejects_path)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['n'], 4)
+        self.assertEqual(entries[0]['error'], 'IndexError')
+        self.assertEqual(entries[0]['row'], ['short'])
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+@unittest.skipUnless(importlib.util.find_spec('click'), 'click not installed')
+class TestEmitBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvpath = os.path.join(self.tmpdir, 'far-manzanar.csv')
+        write_csv(self.csvpath, ROWS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cli_no_hosts(self):
+        """post --emit-bulk writes bulk files without a cluster
+        """
+        from click.testing import CliRunner
+        from namesdb import bulkfile
+        from namesdb import cli
+        outdir = os.path.join(self.tmpdir, 'bulk')
+        args = ['post', '--emit-bulk', outdir, self.csvpath]
+        env = {'ES_HOST': None, 'ES_TARGETS': None}
+        with mock.patch('namesdb.docstore.Docstore') as Docstore:
+            result = CliRunner(env=env).invoke(cli.namesdb, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertFalse(Docstore.called)
+        manifest = bulkfile.read_manifest(outdir)
+        self.assertEqual(manifest['dataset'], 'far-manzanar')
+        self.assertEqual(
+            sorted(set(chunk['model'] for chunk in manifest['chunks'])),
+            ['family', 'record-far', 'stats']
+        )
+        self.assertEqual(
+            sum(c['docs'] for c in manifest['chunks'] if c['model'] == 'record-far'), 3
+        )
+        self.assertFalse(manifest['chunks'][0]['file'].endswith('.gz'))
+
+    def test_cli_gzip(self):
+        """--gzip compresses bulk files; --no-compress is the transport option
+        """
+        from click.testing import CliRunner
+        from namesdb import bulkfile
+        from namesdb import cli
+        outdir = os.path.join(self.tmpdir, 'bulk')
+        args = ['post', '--emit-bulk', outdir, '--gzip', '--no-compress', self.csvpath]
+        result = CliRunner(env={'ES_HOST': None}).invoke(cli.namesdb, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        manifest = bulkfile.read_manifest(outdir)
+        for chunk in manifest['chunks']:
+            self.assertTrue(chunk['file'].endswith('.gz'), chunk['file'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_rejects
+----------------------------------
+
+Tests for `namesdb.rejects` module.
+"""
+
+import os
+import tempfile
+import unittest
+
+from namesdb import bulk
+from namesdb import memory
+from namesdb import rejects
+
+
+class TestRejects(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'far-manzanar.csv.rejects.ndjson')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_rejects(self, rejectlog):
+        rejectlog.defective(3, KeyError('m_pseudoid'), ['a', 'b'])
+        for n in range(4, 10):
+            rejectlog.invalid(n, 'id%s' % n, ['m_birthyear:19x%s' % n])
+        rejectlog.invalid(10, 'id10', ['m_birthyear:abc', 'f_birthdate:1/2/3'])
+
+    def test_reject_file(self):
+        with rejects.RejectLog(self.path) as rejectlog:
+            self.write_rejects(rejectlog)
+        self.assertEqual(rejectlog.defective_rows, 1)
+        self.assertEqual(rejectlog.invalid_records, 7)
+        self.assertEqual(len(rejectlog), 8)
+        entries = rejects.read_rejects(self.path)
+        self.assertEqual(len(entries), 9)
+        self.assertEqual(entries[0]['error'], 'KeyError')
+        self.assertEqual(entries[0]['row'], ['a', 'b'])
+        self.assertEqual(
+            entries[1],
+            {'n': 4, 'm_pseudoid': 'id4', 'error': 'invalid',
+             'field': 'm_birthyear', 'value': '19x4'},
+        )
+        # row 10 has two errors but is listed once
+        self.assertEqual(
+            rejects.reject_ids(self.path), ['id%s' % n for n in range(4, 11)]
+        )
+
+    def test_summary(self):
+        rejectlog = rejects.RejectLog(top=2)
+        self.write_rejects(rejectlog)
+        lines = rejectlog.format_summary(70)
+        self.assertEqual(lines[0], 'Defective rows: 1')
+        self.assertEqual(lines[1], '7 records contain errors (10.00%)')
+        self.assertIn('m_birthyear', lines[2])
+        self.assertIn('e.g. row 4: 19x4', lines[2])
+        self.assertEqual(lines[-1], '| ... 1 more error types')
+
+    def test_replay(self):
+        with rejects.RejectLog(self.path) as rejectlog:
+            self.write_rejects(rejectlog)
+            entries = rejectlog.entries()
+        replayed = rejects.RejectLog()
+        replayed.replay(entries)
+        self.assertEqual(replayed.defective_rows, 1)
+        self.assertEqual(replayed.invalid_records, 7)
+        self.assertEqual(replayed.counts, rejectlog.counts)
+
+    def test_bulk_failures(self):
+        """Documents refused in bulk requests are written with their source
+        """
+        es = memory.MemoryElasticsearch()
+        es.indices.create('test', body={'mappings': {'properties': {
+            'f_entrydate': {'type': 'date'},
+        }}})
+        actions = [
+            ({'index': {'_index': 'test', '_id': 'far-test:%s' % n}},
+             {'m_pseudoid': str(n), 'f_entrydate': date})
+            for n,date in enumerate(['1944-12-25', '12/25/1944', '1945-01-02'])
+        ]
+        with rejects.RejectLog(self.path) as rejectlog:
+            writer = bulk.AdaptiveBulkWriter(es, on_error=rejectlog.rejected)
+            summary = writer.write(actions)
+        self.assertEqual(summary['docs'], 2)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(rejectlog.failed_records, 1)
+        self.assertEqual(len(rejectlog), 1)
+        entries = rejects.read_rejects(self.path)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['error'], 'mapper_parsing_exception')
+        self.assertEqual(entries[0]['field'], 'f_entrydate')
+        self.assertEqual(entries[0]['value'], '12/25/1944')
+        self.assertEqual(entries[0]['source'], actions[1][1])
+        self.assertEqual(rejects.reject_ids(self.path), ['1'])
+        lines = rejectlog.format_summary()
+        self.assertEqual(lines[0], '1 records rejected by Elasticsearch')
+        self.assertIn('e.g. 1: 12/25/1944', lines[1])
+        # written after reading rejects, and replayed
+        with rejects.RejectLog(self.path) as rejectlog:
+            self.write_rejects(rejectlog)
+        rejectlog.rejected(*actions[1], {'status': 400, 'error': 'oops'})
+        rejectlog.close()
+        entries = rejects.read_rejects(self.path)
+        self.assertEqual(len(entries), 10)
+        self.assertEqual(entries[-1]['error'], 'status 400')
+        replayed = rejects.RejectLog()
+        replayed.replay(entries)
+        self.assertEqual(
+            (replayed.defective_rows, replayed.invalid_records, replayed.failed_records),
+            (1, 7, 1)
+        )
+
+    def test_no_rejects(self):
+        with open(self.path, 'w') as f:
+            f.write('{}\n')
+        with rejects.RejectLog(self.path) as rejectlog:
+            pass
+        # old reject file removed, no new one written
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(rejectlog.entries(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
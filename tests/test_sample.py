@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sample
+----------------------------------
+
+Tests for `namesdb.sample` module.
+"""
+
+import unittest
+
+from namesdb import sample
+
+ROWS = [['row%s' % n] for n in range(1, 1001)]
+
+
+class TestSample(unittest.TestCase):
+
+    def test_reservoir(self):
+        rows = list(sample.sample_rows(ROWS, size=10, seed=42))
+        self.assertEqual(len(rows), 10)
+        # row numbers refer to source rows, in file order
+        for n,row in rows:
+            self.assertEqual(row, ['row%s' % n])
+        self.assertEqual([n for n,row in rows], sorted([n for n,row in rows]))
+        # deterministic
+        self.assertEqual(rows, list(sample.sample_rows(ROWS, size=10, seed=42)))
+        self.assertNotEqual(rows, list(sample.sample_rows(ROWS, size=10, seed=43)))
+
+    def test_fraction(self):
+        rows = list(sample.sample_rows(ROWS, frac=0.1, seed=1))
+        self.assertTrue(50 < len(rows) < 150)
+        self.assertEqual(rows, list(sample.sample_rows(ROWS, frac=0.1, seed=1)))
+
+    def test_limit(self):
+        rows = list(sample.sample_rows(ROWS, num=3))
+        self.assertEqual(rows, [(1, ['row1']), (2, ['row2']), (3, ['row3'])])
+        rows = list(sample.sample_rows(ROWS, size=100, num=5))
+        self.assertEqual(len(rows), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
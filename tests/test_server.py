@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_server
+----------------------------------
+
+Tests for `namesdb.server` module, against a MemoryElasticsearch.
+"""
+
+from http.server import ThreadingHTTPServer
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import urlopen
+
+HAS_DOCSTORE = all([
+    importlib.util.find_spec(module)
+    for module in ['elasticsearch', 'elasticsearch_dsl', 'elastictools']
+])
+
+ROWS = [
+    {'m_pseudoid': '7-manzanar_yano_1922_taro', 'm_lastname': 'Yano',
+     'm_firstname': 'Taro', 'm_birthyear': '1922'},
+    {'m_pseudoid': '7-manzanar_yano_1925_hana', 'm_lastname': 'Yano',
+     'm_firstname': 'Hana', 'm_birthyear': '1925'},
+    {'m_pseudoid': '7-manzanar_abe_1901_jiro/2', 'm_lastname': 'Abe',
+     'm_firstname': 'Jiro', 'm_birthyear': '1901'},
+]
+
+def write_csv(path, rows):
+    from namesdb import definitions
+    from namesdb import sourcefile
+    fields = definitions.DATASETS['far-manzanar']
+    lines = []
+    for row in rows:
+        values = {field: '' for field in fields}
+        values.update({'m_dataset': 'far-manzanar', 'm_camp': '7-manzanar', 'm_gender': 'M'})
+        values.update(row)
+        lines.append([values[field] for field in fields])
+    sourcefile.write_csv(path, fields, lines)
+
+
+@unittest.skipUnless(HAS_DOCSTORE, 'elasticsearch or elastictools not installed')
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from namesdb import benchmark
+        from namesdb import server
+        cls.tmpdir = tempfile.mkdtemp()
+        csvpath = os.path.join(cls.tmpdir, 'far-manzanar.csv')
+        write_csv(csvpath, ROWS)
+        server.Handler.ds = benchmark.memory_docstore([csvpath], 'test')
+        cls.httpd = ThreadingHTTPServer(('127.0.0.1', 0), server.Handler)
+        cls.url = 'http://127.0.0.1:%s' % cls.httpd.server_address[1]
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.thread.join()
+        shutil.rmtree(cls.tmpdir)
+
+    def get(self, path):
+        """
+        @returns: (status, data)
+        """
+        try:
+            with urlopen(self.url + path) as response:
+                self.assertTrue(response.headers['X-Response-Time'].endswith('ms'))
+                return response.status,json.loads(response.read())
+        except HTTPError as err:
+            return err.code,json.loads(err.read())
+
+    def test_search(self):
+        status,data = self.get('/search?q=yano&size=1')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(
+            [r['m_pseudoid'] for r in data['results']], ['7-manzanar_yano_1922_taro']
+        )
+        status,data = self.get('/search?q=yano&size=1&page=2')
+        self.assertEqual(
+            [r['m_pseudoid'] for r in data['results']], ['7-manzanar_yano_1925_hana']
+        )
+
+    def test_search_errors(self):
+        self.assertEqual(self.get('/search'), (400, {'error': 'q is required'}))
+        status,data = self.get('/search?q=yano&size=x')
+        self.assertEqual(status, 400)
+
+    def test_record(self):
+        _id = 'far-manzanar:7-manzanar_yano_1922_taro'
+        status,data = self.get('/records/%s' % quote(_id, safe=''))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['id'], _id)
+        self.assertEqual(data['m_firstname'], 'Taro')
+        # encoded / is part of the ID, not the path
+        _id = 'far-manzanar:7-manzanar_abe_1901_jiro/2'
+        status,data = self.get('/records/%s' % quote(_id, safe=''))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['id'], _id)
+
+    def test_record_not_found(self):
+        for _id in ['far-manzanar%3Anobody', 'xyz-master%3Anobody', 'nobody']:
+            status,data = self.get('/records/%s' % _id)
+            self.assertEqual(status, 404, _id)
+
+    def test_facets(self):
+        status,data = self.get('/facets?field=m_camp')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['terms'], [{'value': '7-manzanar', 'count': 3}])
+        status,data = self.get('/facets?field=m_notes')
+        self.assertEqual(status, 400)
+
+    def test_stats(self):
+        self.assertEqual(self.get('/stats?dataset=far-manzanar'), (200, {'stats': []}))
+
+    def test_not_found(self):
+        status,data = self.get('/nothing')
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
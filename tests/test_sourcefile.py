@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sourcefile
+----------------------------------
+
+Tests for `namesdb.sourcefile` module.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+from namesdb import sourcefile
+
+CSV_TEXT = (
+    '"m_pseudoid","m_lastname","m_notes"\r\n'
+    '"1-topaz_yano_1922_taro","Yano","line one\r\nline two"\r\n'
+    '"1-topaz_abe_1901_hana","Abe",""\r\n'
+)
+ROWS = [
+    ['m_pseudoid', 'm_lastname', 'm_notes'],
+    ['1-topaz_yano_1922_taro', 'Yano', 'line one\r\nline two'],
+    ['1-topaz_abe_1901_hana', 'Abe', ''],
+]
+
+
+class TestSourcefile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_strip_compression(self):
+        self.assertEqual(
+            sourcefile.strip_compression('/tmp/far-poston.csv.bz2'),
+            '/tmp/far-poston.csv'
+        )
+        self.assertEqual(
+            sourcefile.strip_compression('/tmp/far-poston.csv'),
+            '/tmp/far-poston.csv'
+        )
+
+    def test_read_csv(self):
+        path = os.path.join(self.tmpdir, 'far-poston.csv')
+        with open(path, 'w', newline='') as f:
+            f.write(CSV_TEXT)
+        self.assertEqual(sourcefile.read_csv(path), ROWS)
+
+    def test_read_csv_compressed(self):
+        for ext,opener in [('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open)]:
+            path = os.path.join(self.tmpdir, 'far-poston.csv' + ext)
+            with opener(path, 'wb') as f:
+                f.write(CSV_TEXT.encode('utf-8'))
+            self.assertEqual(list(sourcefile.iter_csv(path)), ROWS)
+
+    def test_iter_csv_parallel(self):
+        path = os.path.join(self.tmpdir, 'far-poston.csv')
+        with open(path, 'w', newline='') as f:
+            f.write(CSV_TEXT)
+            for n in range(500):
+                f.write('"%s","a ""quoted""\nname","x\ny\n"\r\n' % n)
+        expected = list(sourcefile.iter_csv(path))
+        self.assertEqual(len(expected), 503)
+        for chunk_size in [1, 7, 100, 1000000]:
+            rows = list(sourcefile.iter_csv_parallel(path, 2, chunk_size))
+            self.assertEqual(rows, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_stats
+----------------------------------
+
+Tests for `namesdb.stats` module.
+"""
+
+import unittest
+
+from namesdb import stats
+
+
+class Row():
+    """Stand-in for models.RecordRow
+    """
+    def __init__(self, **values):
+        self.values = values
+
+    def get(self, field, default=None):
+        return self.values.get(field, default)
+
+
+class TestStats(unittest.TestCase):
+
+    def test_hyperloglog(self):
+        a,b = stats.HyperLogLog(),stats.HyperLogLog()
+        for n in range(5000):
+            a.add('a%s' % n)
+            b.add('b%s' % n)
+        self.assertTrue(4800 < a.count() < 5200)
+        c = stats.HyperLogLog.loads(a.dumps())
+        self.assertEqual(c.count(), a.count())
+        c.merge(b)
+        self.assertTrue(9600 < c.count() < 10400)
+        self.assertEqual(stats.HyperLogLog().count(), 0)
+
+    def test_dataset_stats(self):
+        dstats = stats.DatasetStats('far-manzanar')
+        for n in range(30):
+            dstats.add(Row(
+                m_camp='7-manzanar', m_gender='MF'[n % 2],
+                m_birthyear=str(1900 + n % 3), m_familyno=str(n // 3),
+            ))
+        source = dstats.source()
+        self.assertEqual(source['records'], 30)
+        self.assertEqual(source['distinct_families'], 10)
+        self.assertEqual(
+            source['counts']['m_gender'],
+            [{'value': 'F', 'count': 15}, {'value': 'M', 'count': 15}]
+        )
+        self.assertEqual(
+            source['counts']['m_originalstate'], [{'value': '', 'count': 30}]
+        )
+        merged = stats.merge_sources([source, source])
+        self.assertEqual(merged['records'], 60)
+        self.assertEqual(merged['distinct_families'], 10)
+        self.assertEqual(merged['counts']['m_camp'][0]['count'], 60)
+        self.assertIn('(blank)', '\n'.join(stats.format_stats(source)))
+
+    def test_merge_datasets(self):
+        """Datasets sharing family numbers are counted as different families
+        """
+        sources = []
+        for dataset in ['far-manzanar', 'far-poston']:
+            dstats = stats.DatasetStats(dataset)
+            for n in range(30):
+                dstats.add(Row(m_camp=dataset, m_familyno=str(n // 3)))
+            sources.append(dstats.source())
+        self.assertEqual(
+            [source['distinct_families'] for source in sources], [10, 10]
+        )
+        merged = stats.merge_sources(sources)
+        self.assertEqual(merged['m_dataset'], 'far-manzanar,far-poston')
+        self.assertEqual(merged['records'], 60)
+        self.assertEqual(merged['distinct_families'], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
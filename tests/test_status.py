@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_status
+----------------------------------
+
+Tests for `namesdb.status` module.
+"""
+
+import unittest
+
+from namesdb import status
+
+HEALTH = {
+    'cluster_name': 'namesdb', 'status': 'green', 'number_of_nodes': 2,
+    'active_shards': 4, 'unassigned_shards': 0,
+}
+
+def index_response(index_total):
+    data = {
+        'docs': {'count': 1000, 'deleted': 10},
+        'store': {'size_in_bytes': 2048},
+        'segments': {'count': 7},
+        'refresh': {'total': 30, 'total_time_in_millis': 450},
+        'merges': {'current': 1, 'total': 3, 'total_time_in_millis': 900},
+        'indexing': {'index_total': index_total, 'index_time_in_millis': 100},
+        'search': {'query_total': 4, 'query_time_in_millis': 20},
+    }
+    return {'indices': {'namesdbrecord-far': {'primaries': data, 'total': data}}}
+
+def node_response(write_rejected):
+    return {'nodes': {'abc': {
+        'name': 'node-1',
+        'indices': {
+            'search': {'query_total': 4, 'query_time_in_millis': 20},
+            'indexing': {'index_total': 0, 'index_time_in_millis': 0},
+        },
+        'thread_pool': {
+            'write': {'queue': 0, 'rejected': write_rejected},
+            'search': {'queue': 0, 'rejected': 0},
+        },
+    }}}
+
+DATASETS = {'aggregations': {'datasets': {'buckets': [
+    {'key': 'far-manzanar', 'doc_count': 600},
+    {'key': 'far-poston', 'doc_count': 400},
+]}}}
+
+
+class TestStatus(unittest.TestCase):
+
+    def test_fetch(self):
+        def broken():
+            raise Exception('no such index')
+        results = status.fetch({'health': lambda: HEALTH, 'datasets': broken})
+        self.assertEqual(results['health'], HEALTH)
+        self.assertIsInstance(results['datasets'], Exception)
+
+    def test_summarize(self):
+        summary = status.summarize({
+            'health': HEALTH,
+            'indices': index_response(1000),
+            'nodes': node_response(0),
+            'datasets': Exception('timed out'),
+        })
+        self.assertEqual(summary['cluster']['status'], 'green')
+        index = summary['indices']['namesdbrecord-far']
+        self.assertEqual(index['docs'], 1000)
+        self.assertEqual(index['segments'], 7)
+        self.assertEqual(index['merges_current'], 1)
+        self.assertEqual(summary['nodes']['node-1']['search_ms'], 5.0)
+        self.assertEqual(summary['nodes']['node-1']['index_ms'], None)
+        self.assertEqual(summary['errors'], {'datasets': 'timed out'})
+        self.assertNotIn('datasets', summary)
+        lines = status.format_status(summary)
+        self.assertTrue(lines[0].startswith('Cluster namesdb: green'))
+        self.assertIn('ERROR datasets: timed out', lines)
+
+    def test_datasets(self):
+        summary = status.summarize({'datasets': DATASETS})
+        self.assertEqual(
+            summary['datasets'], {'far-manzanar': 600, 'far-poston': 400}
+        )
+
+    def test_rates(self):
+        before = status.summarize({
+            'indices': index_response(1000), 'nodes': node_response(1),
+        })
+        after = status.summarize({
+            'indices': index_response(3000), 'nodes': node_response(4),
+        })
+        rates = status.rates(before, after, 4)
+        self.assertEqual(rates['index_rate'], 500.0)
+        self.assertEqual(rates['write_rejected'], 3)
+        self.assertEqual(rates['indices'], {'namesdbrecord-far': 500.0})
+        self.assertIn('500.0 docs/s', status.format_rates(rates))
+
+
+if __name__ == '__main__':
+    unittest.main()
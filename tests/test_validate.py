@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_validate
+----------------------------------
+
+Tests for `namesdb.validate` module.
+"""
+
+from functools import partial
+import os
+import shutil
+import tempfile
+import unittest
+
+from namesdb import definitions
+from namesdb import sourcefile
+from namesdb import validate
+
+FIELDS = definitions.DATASETS['far-manzanar']
+
+
+def make_row(**values):
+    row = {field: '' for field in FIELDS}
+    row.update({
+        'm_dataset': 'far-manzanar', 'm_camp': '7-manzanar', 'm_gender': 'M',
+        'm_birthyear': '1922', 'f_entrydate': '04/01/1942',
+    })
+    row.update(values)
+    return [row[field] for field in FIELDS]
+
+ROWS = [
+    make_row(m_pseudoid='a'),
+    make_row(m_pseudoid='b', m_birthyear='19x2'),
+    make_row(m_pseudoid='c', f_entrydate='bogus'),
+    make_row(m_pseudoid='a'),
+    make_row(m_pseudoid='d', m_gender=''),
+]
+
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'far-manzanar.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_csv(self, rows):
+        sourcefile.write_csv(self.path, FIELDS, rows)
+
+    def test_check_value(self):
+        self.assertEqual(validate.check_value('m_birthyear', '1922'), None)
+        self.assertEqual(validate.check_value('m_birthyear', '19x2'), 'number')
+        self.assertEqual(validate.check_value('m_gender', ''), 'required')
+        self.assertEqual(validate.check_value('f_entrydate', 'bogus', '%m/%d/%Y'), 'date')
+        self.assertEqual(validate.check_value('f_entrydate', '04/01/1942', '%m/%d/%Y'), None)
+
+    def test_validate_csv(self):
+        self.write_csv(ROWS)
+        report = validate.validate_csv(self.path, processes=2)
+        self.assertFalse(report.ok())
+        self.assertEqual(report.rows, 5)
+        self.assertEqual(dict(report.counts), {
+            ('m_birthyear', 'number'): 1,
+            ('f_entrydate', 'date'): 1,
+            ('m_gender', 'required'): 1,
+        })
+        self.assertEqual(report.examples[('f_entrydate', 'date')], [(3, 'bogus')])
+        self.assertEqual(report.duplicates, [(4, 'a')])
+        lines = report.format()
+        self.assertIn('m_birthyear number: 1 (row:2 "19x2")', lines)
+        self.assertIn('Duplicate m_pseudoid: 1 (row:4 a)', lines)
+
+    def test_validate_ok(self):
+        self.write_csv(ROWS[:1])
+        report = validate.validate_csv(self.path)
+        self.assertTrue(report.ok())
+        self.assertEqual(report.format()[-1], 'ok')
+
+    def test_missing_headers(self):
+        sourcefile.write_csv(self.path, FIELDS[:-1], [row[:-1] for row in ROWS])
+        report = validate.validate_csv(self.path)
+        self.assertEqual(report.missing_headers, ['f_farlineid'])
+        self.assertEqual(report.rows, 0)
+
+    def test_check_in_chunk_workers(self):
+        """Rows are numbered across chunks checked by worker processes
+        """
+        self.write_csv(ROWS * 20)
+        headers = sourcefile.map_headers(FIELDS)
+        check = partial(validate.check_rows, FIELDS, headers, {})
+        chunks = sourcefile.iter_csv_chunks(
+            self.path, processes=2, chunk_size=1000, func=check
+        )
+        self.assertEqual(next(chunks), [FIELDS])
+        report = validate.Report(self.path, 'far-manzanar')
+        num_chunks = 0
+        for results in chunks:
+            report.add(results)
+            num_chunks += 1
+        self.assertGreater(num_chunks, 2)
+        self.assertEqual(report.rows, 100)
+        self.assertEqual(report.counts[('m_birthyear', 'number')], 20)
+        self.assertEqual(
+            [n for n,value in report.examples[('m_birthyear', 'number')]][:3],
+            [2, 7, 12]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()